@@ -1,137 +1,423 @@
 import os
-import json
 import sys
 import requests
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import json_codec
+from assignment_record import Assignment, load_records, dump_records
+import working_set
+import course_cache
+import rate_limit
+import stage_supervisor
+from progress import Progress
 # The RECLAIM_API_KEY import has been completely removed to fix the ImportError.
+import config
 from config import CANVAS_URL, CANVAS_TOKEN
 
 SEEN_FILE = "seen_assignments.json"
+NEW_NAMES_FILE = "new_assignment_names.json"
+# How assignments are fetched: "courses" (one request per course), "planner"
+# (cross-course /api/v1/planner/items) or "graphql" (batched /api/graphql queries).
+# Set CANVAS_INGEST_STRATEGY in config.py or pass --strategy <name>.
+INGEST_STRATEGY = getattr(config, "CANVAS_INGEST_STRATEGY", "courses")
+# Only assignments due within this many days (and not yet past) are tracked;
+# later ones are picked up once they enter the window. None = no upper limit.
+ACTIVE_WINDOW_DAYS = getattr(config, "ACTIVE_WINDOW_DAYS", working_set.DEFAULT_WINDOW_DAYS)
+REQUEST_TIMEOUT = 30 # Seconds before a stalled Canvas request is given up on
+COURSE_FIELDS = ("id", "name", "course_code", "term")
+PLANNER_TYPES = ("assignment", "quiz", "discussion_topic")
+PLANNER_FIELDS = ("plannable_type", "plannable", "plannable_date", "html_url", "context_name", "submissions")
+
+# Courses only (no assignments), so past terms can be dropped before asking for their assignments
+GRAPHQL_COURSES_QUERY = """
+query Courses {
+  allCourses { _id name state term { endAt } }
+}
+"""
+GRAPHQL_PAGE_SIZE = 100 # Assignments per course and request
+GRAPHQL_BATCH = 20 # Courses per request
+# The student's own submissions come along, so submitted work can be dropped like the other strategies do
+GRAPHQL_ASSIGNMENTS_FIELDS = (
+    "assignmentsConnection(first: %d, after: $a%d) {"
+    " nodes { name htmlUrl dueAt unlockAt submissionsConnection { nodes { submittedAt } } }"
+    " pageInfo { hasNextPage endCursor } }"
+)
 
 # --- SAFETY CHECKS ---
-if not CANVAS_TOKEN:
-    print("ERROR: CANVAS_TOKEN is missing. Please update your config.py file.")
-    sys.exit(1)
+def check_config(canvas_url=CANVAS_URL, token=CANVAS_TOKEN):
+    """Exits with an error if the Canvas URL or token is missing."""
+    if not token:
+        print("ERROR: CANVAS_TOKEN is missing. Please update your config.py file.")
+        sys.exit(1)
 
-if not CANVAS_URL:
-    print("ERROR: CANVAS_URL is missing.")
-    sys.exit(1)
+    if not canvas_url:
+        print("ERROR: CANVAS_URL is missing.")
+        sys.exit(1)
 
 # --- HELPER FUNCTIONS ---
-def load_seen():
-    """Loads previously seen assignments from a file."""
-    if os.path.exists(SEEN_FILE):
+def load_seen(path=SEEN_FILE):
+    """Loads previously seen assignments from a file as Assignment records."""
+    if os.path.exists(path):
         try:
-            with open(SEEN_FILE, "r") as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            print(f"Warning: {SEEN_FILE} is corrupted. Starting with an empty list.")
+            return load_records(json_codec.load_file(path))
+        except json_codec.JSONDecodeError:
+            print(f"Warning: {path} is corrupted. Starting with an empty list.")
             return []
     return []
 
-def save_seen(seen):
+def save_seen(seen, path=SEEN_FILE):
     """Saves the list of seen assignments to a file."""
-    with open(SEEN_FILE, "w") as f:
-        json.dump(seen, f, indent=2)
+    json_codec.save_file(path, dump_records(seen))
 
-def save_new_names_only(new_assignments: list):
+def save_new_names_only(new_assignments: list, path=NEW_NAMES_FILE):
     """Saves the names and links of newly discovered assignments to a separate file."""
-    NEW_NAMES_FILE = "new_assignment_names.json"
     names_and_details = [
         {
-            "name": a.get("name"),
-            "course": a.get("course_name", "Unknown"), 
-            "link": a.get("html_url")
+            "name": a.name,
+            "course": a.course_name, 
+            "link": a.html_url
         } 
         for a in new_assignments
     ]
-    with open(NEW_NAMES_FILE, "w") as f:
-        json.dump(names_and_details, f, indent=2)
+    json_codec.save_file(path, names_and_details)
 
 # --- FETCH ASSIGNMENTS ---
-def fetch_assignments():
-    """Fetches assignments from Canvas API for all active courses."""
-    headers = {"Authorization": f"Bearer {CANVAS_TOKEN}"}
-    all_assignments = []
+def iter_assignments(canvas_url=None, token=None, http=None):
+    """
+    Yields assignments from Canvas API for all active courses, one course at
+    a time as each response arrives (used by the streaming pipeline).
+    Defaults to the config.py account; `http` may be any object with a
+    requests-style get() and defaults to the shared request scheduler.
+    """
+    http = http or rate_limit.shared_http()
+    canvas_url = canvas_url or CANVAS_URL
+    token = token or CANVAS_TOKEN
+    headers = {"Authorization": f"Bearer {token}"}
+
+    courses_url = f"{canvas_url}/api/v1/courses?per_page=100&enrollment_state=active&include[]=term"
 
-    courses_url = f"{CANVAS_URL}/api/v1/courses?per_page=100&enrollment_state=active"
-    print("Fetching active course IDs...")
+    def load_courses():
+        print("Fetching active course IDs...")
+        # Closing the streamed response frees its request slot even if parsing stops early
+        with http.get(courses_url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            return list(json_codec.iter_projected(response.raw, COURSE_FIELDS))
 
+    # The course list rarely changes, so it comes from the cache when it can
+    cache = course_cache.shared()
+    courses_key = course_cache.cache_key(canvas_url, token, "courses")
     try:
-        response = requests.get(courses_url, headers=headers)
-        response.raise_for_status()
-        courses = response.json()
-    except requests.exceptions.RequestException as e:
+        courses, source = cache.get(courses_key, load_courses)
+    except (requests.exceptions.RequestException, *json_codec.PARSE_ERRORS) as e:
         print(f"FATAL ERROR: Could not fetch courses. Error: {e}")
-        return []
+        return
+    if source != course_cache.FETCHED:
+        print(f"Using the cached course list ({source}).")
 
     print(f"Found {len(courses)} active courses. Fetching assignments...")
+    bar = Progress("Canvas", "courses", len(courses))
 
     for course in courses:
+        if stage_supervisor.cancel_requested():
+            # Whatever was fetched so far is still saved by main()
+            print("Cancel requested: skipping the remaining courses.")
+            return
         course_id = course.get("id")
-        course_name = course.get("name", "Unknown Course")
+        course_name = course.get("name") or "Unknown Course"
         if not course_id:
+            bar.advance()
             continue
-        assignments_url = f"{CANVAS_URL}/api/v1/courses/{course_id}/assignments"
+        assignments_url = f"{canvas_url}/api/v1/courses/{course_id}/assignments"
         # Only fetching unsubmitted assignments, ordered by due date
         params = {"bucket": "unsubmitted", "order_by": "due_at", "per_page": 50}
 
         try:
-            assignment_response = requests.get(assignments_url, headers=headers, params=params)
-            assignment_response.raise_for_status()
-            course_assignments = assignment_response.json()
-            for assignment in course_assignments:
-                assignment["course_name"] = course_name
-                all_assignments.append(assignment)
+            with http.get(assignments_url, headers=headers, params=params, stream=True,
+                          timeout=REQUEST_TIMEOUT) as assignment_response:
+                assignment_response.raise_for_status()
+                assignment_response.raw.decode_content = True
+                # Stream-parse the payload, keeping only the fields the pipeline uses
+                course_assignments = []
+                for assignment in json_codec.iter_projected(assignment_response.raw):
+                    assignment["course_name"] = course_name
+                    course_assignments.append(assignment)
             print(f"  Fetched {len(course_assignments)} assignments for {course_name}")
-        except requests.exceptions.RequestException:
+        except (requests.exceptions.RequestException, *json_codec.PARSE_ERRORS) as e:
+            response = getattr(e, "response", None)
+            if response is not None and response.status_code in (401, 403, 404):
+                # Probably no longer enrolled: fetch the course list again next time
+                cache.invalidate(courses_key)
             # Silently skip courses that might fail assignment retrieval
             continue
+        finally:
+            # Counted once the course is downloaded (or skipped), so the ETA isn't a course ahead
+            bar.advance()
+
+        yield from course_assignments
+
+def fetch_assignments(canvas_url=None, token=None, http=None):
+    """Fetches assignments from Canvas API for all active courses (see iter_assignments)."""
+    return list(iter_assignments(canvas_url, token, http))
+
+def fetch_course_name(course_id, canvas_url=None, token=None, http=None) -> str:
+    """Name of one course (for pushed events that only carry its id)."""
+    http = http or rate_limit.shared_http()
+    canvas_url = canvas_url or CANVAS_URL
+    token = token or CANVAS_TOKEN
+    cache = course_cache.shared()
+
+    # Usually already known from the cached course list
+    listed = cache.peek(course_cache.cache_key(canvas_url, token, "courses"))
+    for course in (listed or {}).get("value", []):
+        if str(course.get("id")) == str(course_id) and course.get("name"):
+            return course["name"]
+
+    def load_course():
+        response = http.get(f"{canvas_url}/api/v1/courses/{course_id}",
+                            headers={"Authorization": f"Bearer {token}"}, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return {key: response.json().get(key) for key in COURSE_FIELDS}
+
+    try:
+        course, _ = cache.get(course_cache.cache_key(canvas_url, token, f"course:{course_id}"), load_course)
+        return course.get("name") or f"Course {course_id}"
+    except (requests.exceptions.RequestException, ValueError):
+        return f"Course {course_id}"
+
+def _planner_item_to_assignment(item: dict, canvas_url: str):
+    """Converts a planner item into the scraper's assignment dict, or None if it isn't one."""
+    if item.get("plannable_type") not in PLANNER_TYPES:
+        return None
+    submissions = item.get("submissions") or {}
+    if submissions.get("submitted"):
+        return None
+    plannable = item.get("plannable") or {}
+    link = item.get("html_url") or ""
+    if link.startswith("/"):
+        link = canvas_url + link
+    return {
+        "name": plannable.get("title"),
+        "html_url": link,
+        "due_at": plannable.get("due_at") or item.get("plannable_date"),
+        "unlock_at": plannable.get("unlock_at"),
+        "course_name": item.get("context_name") or "Unknown Course",
+    }
+
+def iter_planner_items(canvas_url=None, token=None, http=None):
+    """
+    Yields every upcoming, unsubmitted assignment across all courses from
+    the planner endpoint, a page at a time: a few paginated requests
+    instead of one per course.
+    """
+    http = http or rate_limit.shared_http()
+    canvas_url = canvas_url or CANVAS_URL
+    token = token or CANVAS_TOKEN
+    headers = {"Authorization": f"Bearer {token}"}
+    total = 0
+
+    start_date = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    url = f"{canvas_url}/api/v1/planner/items"
+    params = {"start_date": start_date, "per_page": 100}
+    print("Fetching upcoming planner items...")
+
+    page = 0
+    bar = Progress("Canvas", "pages")
+    while url:
+        try:
+            with http.get(url, headers=headers, params=params, stream=True, timeout=REQUEST_TIMEOUT) as response:
+                response.raise_for_status()
+                response.raw.decode_content = True
+                page_assignments = []
+                for item in json_codec.iter_projected(response.raw, PLANNER_FIELDS):
+                    assignment = _planner_item_to_assignment(item, canvas_url)
+                    if assignment:
+                        page_assignments.append(assignment)
+        except (requests.exceptions.RequestException, *json_codec.PARSE_ERRORS) as e:
+            print(f"FATAL ERROR: Could not fetch planner items. Error: {e}")
+            return
+        page += 1
+        bar.advance()
+        total += len(page_assignments)
+        yield from page_assignments
+        # The next-page URL already carries the query string
+        url = response.links.get("next", {}).get("url")
+        params = None
+
+    bar.finish()
+    print(f"  Fetched {total} assignments in {page} page(s)")
+
+def fetch_planner_items(canvas_url=None, token=None, http=None):
+    """Fetches every upcoming, unsubmitted assignment from the planner (see iter_planner_items)."""
+    return list(iter_planner_items(canvas_url, token, http))
+
+def _graphql(http, canvas_url, headers, query, variables=None):
+    response = http.post(f"{canvas_url}/api/graphql", headers=headers,
+                         json={"query": query, "variables": variables or {}}, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    payload = json_codec.loads(response.content)
+    if payload.get("errors"):
+        raise ValueError(f"GraphQL query returned errors: {payload['errors']}")
+    return payload.get("data") or {}
+
+def _graphql_assignments_query(count):
+    """One request for `count` courses: course ids in $c0.., page cursors in $a0.."""
+    params = ", ".join(f"$c{i}: ID!, $a{i}: String" for i in range(count))
+    fields = " ".join(f"c{i}: course(id: $c{i}) {{ {GRAPHQL_ASSIGNMENTS_FIELDS % (GRAPHQL_PAGE_SIZE, i)} }}"
+                      for i in range(count))
+    return f"query Assignments({params}) {{ {fields} }}"
+
+def fetch_graphql_assignments(canvas_url=None, token=None, http=None):
+    """
+    Fetches assignments with GraphQL, asking only for the fields the pipeline
+    uses: the course list first (cached; concluded courses and past terms are
+    dropped), then the assignments of up to GRAPHQL_BATCH courses per request,
+    following each course's page cursor until it has no more pages. Keeps
+    unsubmitted assignments due in the future.
+    """
+    http = http or rate_limit.shared_http()
+    canvas_url = canvas_url or CANVAS_URL
+    token = token or CANVAS_TOKEN
+    headers = {"Authorization": f"Bearer {token}"}
+    all_assignments = []
+    now = datetime.now(timezone.utc)
+
+    def load_courses():
+        return _graphql(http, canvas_url, headers, GRAPHQL_COURSES_QUERY).get("allCourses") or []
+
+    print("Fetching assignments with GraphQL...")
+    cache = course_cache.shared()
+    try:
+        courses, _ = cache.get(course_cache.cache_key(canvas_url, token, "graphql-courses"), load_courses)
+    except (requests.exceptions.RequestException, *json_codec.PARSE_ERRORS) as e:
+        print(f"FATAL ERROR: GraphQL course query failed. Error: {e}")
+        return []
+    # A course whose term has no end date stays active
+    active = [c for c in courses if c.get("state", "available") == "available"
+              and (not (c.get("term") or {}).get("endAt")
+                   or working_set.in_active_window(c["term"]["endAt"], now, None))]
+
+    # course id -> [course name, cursor]; a course leaves once its last page is in
+    pending = {str(c["_id"]): [c.get("name") or "Unknown Course", None] for c in active if c.get("_id")}
+    requests_made = 0
+    while pending:
+        batch = list(pending)[:GRAPHQL_BATCH]
+        variables = {}
+        for i, course_id in enumerate(batch):
+            variables[f"c{i}"] = course_id
+            variables[f"a{i}"] = pending[course_id][1]
+        try:
+            data = _graphql(http, canvas_url, headers, _graphql_assignments_query(len(batch)), variables)
+        except (requests.exceptions.RequestException, *json_codec.PARSE_ERRORS) as e:
+            print(f"FATAL ERROR: GraphQL assignment query failed. Error: {e}")
+            return all_assignments
+        requests_made += 1
+        for i, course_id in enumerate(batch):
+            course_name = pending[course_id][0]
+            connection = (data.get(f"c{i}") or {}).get("assignmentsConnection") or {}
+            for node in connection.get("nodes") or []:
+                due_at = node.get("dueAt")
+                if not working_set.in_active_window(due_at, now, None):
+                    continue
+                submissions = (node.get("submissionsConnection") or {}).get("nodes") or []
+                if any(sub.get("submittedAt") for sub in submissions):
+                    continue
+                all_assignments.append({
+                    "name": node.get("name"),
+                    "html_url": node.get("htmlUrl"),
+                    "due_at": due_at,
+                    "unlock_at": node.get("unlockAt"),
+                    "course_name": course_name,
+                })
+            page_info = connection.get("pageInfo") or {}
+            if page_info.get("hasNextPage") and page_info.get("endCursor"):
+                pending[course_id][1] = page_info["endCursor"]
+            else:
+                del pending[course_id]
 
+    print(f"  Fetched {len(all_assignments)} upcoming assignments from {len(active)} active courses "
+          f"in {requests_made} request(s)")
     return all_assignments
 
+INGEST_STRATEGIES = {
+    "courses": fetch_assignments,
+    "planner": fetch_planner_items,
+    "graphql": fetch_graphql_assignments,
+}
+
+# Incremental versions for the streaming pipeline (GraphQL needs only a few batched responses anyway)
+STREAMING_STRATEGIES = {
+    "courses": iter_assignments,
+    "planner": iter_planner_items,
+    "graphql": fetch_graphql_assignments,
+}
+
 # The create_reclaim_task function has been removed.
 
-# --- MAIN SCRIPT ---
-def main():
-    """Main function to fetch, filter, and save new Canvas assignments."""
-    seen_assignments = load_seen()
+# --- FILTERING ---
+def select_new_assignments(seen_assignments: list, events: list) -> list:
+    """
+    Returns the valid events not already in seen_assignments (matched by link)
+    as Assignment records, appending them to seen_assignments as well.
+    """
     # Use a set for quick lookup of links
-    seen_links = {a['html_url'] for a in seen_assignments if 'html_url' in a} 
+    seen_links = {a.html_url for a in seen_assignments if a.html_url} 
     new_assignments = []
 
-    events = fetch_assignments()
+    for ev in events:
+        assignment = new_assignment_from_event(ev, seen_links)
+        if assignment:
+            new_assignments.append(assignment)
+            seen_assignments.append(assignment)
+
+    return new_assignments
+
+def new_assignment_from_event(ev: dict, seen_links: set):
+    """
+    Returns an Assignment for a valid event whose link is not in seen_links
+    (adding the link to the set), or None if it is invalid or already seen.
+    """
+    # Basic validation
+    if not ev.get("html_url") or not ev.get("name") or not ev.get("due_at"):
+        return None
+
+    link = ev["html_url"]
+    if link in seen_links:
+        return None
+
+    assignment = Assignment.from_canvas(ev)
+    seen_links.add(link)
+    reclaim_title = f"[{assignment.course_name}] {assignment.name}"
+    print(f"Ready to sync NEW assignment: {reclaim_title}. (Due: {ev['due_at']})")
+    # Removed the call to create_reclaim_task() here.
+    return assignment
+
+# --- MAIN SCRIPT ---
+def main(state_dir=".", canvas_url=None, token=None, http=None, strategy=None):
+    """
+    Main function to fetch, filter, and save new Canvas assignments.
+    The JSON files are read/written inside `state_dir` (the CWD by default).
+    `strategy` picks the fetch function from INGEST_STRATEGIES.
+    Returns the list of new assignments.
+    """
+    seen_path = os.path.join(state_dir, SEEN_FILE)
+    seen_assignments = load_seen(seen_path)
+
+    # Move past-due assignments out of the working set into the cold archive
+    now = working_set.utc_now()
+    seen_assignments, expired = working_set.split_expired(seen_assignments, now)
+    working_set.archive(expired, os.path.join(state_dir, working_set.ARCHIVE_FILE))
+    if expired:
+        print(f"Archived {len(expired)} past-due assignments.")
+
+    fetch = INGEST_STRATEGIES[strategy or INGEST_STRATEGY]
+    events = fetch(canvas_url, token, http)
     print(f"\nFound {len(events)} total potential assignments. Filtering...")
 
-    for ev in events:
-        name = ev.get("name")
-        link = ev.get("html_url")
-        due_date = ev.get("due_at")
-        open_date = ev.get("unlock_at")
-        course_name = ev.get("course_name", "Unknown")
-
-        # Basic validation
-        if not link or not name or not due_date:
-            continue
-            
-        assignment_data = {
-            "name": name,
-            "html_url": link,
-            "course_name": course_name,
-            "due_at": due_date,
-            "unlock_at": open_date
-        }
-
-        if link not in seen_links:
-            new_assignments.append(assignment_data)
-            seen_assignments.append(assignment_data)
-            seen_links.add(link)
-            reclaim_title = f"[{course_name}] {name}"
-            print(f"Ready to sync NEW assignment: {reclaim_title}. (Due: {due_date})")
-            # Removed the call to create_reclaim_task() here.
-
-    save_seen(seen_assignments)
-    save_new_names_only(new_assignments)
+    events = [ev for ev in events if working_set.in_active_window(ev.get("due_at"), now, ACTIVE_WINDOW_DAYS)]
+    new_assignments = select_new_assignments(seen_assignments, events)
+
+    save_seen(seen_assignments, seen_path)
+    save_new_names_only(new_assignments, os.path.join(state_dir, NEW_NAMES_FILE))
     
     if new_assignments:
         print(f"Saved {len(new_assignments)} new assignment names to new_assignment_names.json.")
@@ -141,7 +427,21 @@ def main():
     print("\n" + "=" * 50)
     print(f"COMPLETE: Found {len(new_assignments)} new assignments.")
     print(f"Total assignments tracked: {len(seen_assignments)}")
+    for line in rate_limit.describe_metrics(getattr(http, "limiter", None)):
+        print(line)
     print("=" * 50)
+    return new_assignments
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="Fetch new Canvas assignments.")
+    parser.add_argument("--strategy", choices=list(INGEST_STRATEGIES), default=None,
+                        help=f"How to fetch assignments (default from config.py: {INGEST_STRATEGY})")
+    parser.add_argument("--refresh-courses", action="store_true",
+                        help="Ignore the cached course list and fetch it again")
+    args = parser.parse_args()
+
+    check_config()
+    if args.refresh_courses:
+        course_cache.shared().invalidate()
+    main(strategy=args.strategy)
\ No newline at end of file
@@ -5,25 +5,217 @@ import os
 import re
 import subprocess
 import threading
+import time
 import sys 
 import shutil 
 
+import snapshots
+import browser_session
+import stage_supervisor
+import progress
+from record_store import RecordStore, StaleFileError
+
 # --- Configuration File Paths (Must match the worker script's expectations) ---
 CONFIG_FILE = 'config.py'
+# Written by the settings tab; every other line of config.py is kept as it is on save
+CONFIG_HEADER_LINES = (
+    "# Local Configuration for Reclaim Sync Script",
+    "# WARNING: Do not share this file. It contains sensitive credentials.",
+)
+CONFIG_FIELDS = ('CANVAS_URL', 'CANVAS_TOKEN', 'RECLAIM_EMAIL', 'RECLAIM_PASSWORD',
+                 'CHROME_PROFILE_PATH', 'CHROME_PROFILE_NAME')
 NEW_ASSIGNMENTS_FILE = 'new_assignment_names.json'
 # File 1: Stored Assignment List
 SEEN_ASSIGNMENTS_FILE = 'seen_assignments.json' 
-# NEW: Backup of Stored Assignment List
+# OLD: Single-copy backup of the Stored Assignment List (now imported into sync_history/ once)
 PREV_SEEN_ASSIGNMENTS_FILE = 'prev_seen_assignments.json' 
 # File 2: Time allocation/Status Data
 TIMED_ASSIGNMENTS_FILE = 'timed_assignments.json' 
 # File 3: Time allocation Rules
 TIME_ALLOCATION_RULES_FILE = 'assignment_time_rules.json'
+# Read-only view of the newest snapshot in the data window (not a file)
+SNAPSHOT_VIEW = 'latest_snapshot'
+# Rows shown per page in the data window
+DATA_PAGE_SIZE = 100
 
 # --- Python Scripts in the Workflow ---
 SCRAPER_SCRIPT = 'canvas_scrape_assignments.py'
 ALLOCATOR_SCRIPT = 'time_allocator.py'
 RECLAIM_SCRIPT = 'reclaim_task_creator.py'
+# Runs all three stages at once, connected by queues (optional mode)
+PIPELINE_SCRIPT = 'pipeline.py'
+# Checks the allocated hours against available time before the Reclaim stage (report only)
+CAPACITY_SCRIPT = 'capacity_planner.py'
+# Applies edited time rules to the assignments (and Reclaim tasks) of those groups
+RULE_INDEX_SCRIPT = 'rule_index.py'
+# Recalibrates the time rules from actual time spent, after the Reclaim stage (no prompts)
+CALIBRATION_SCRIPT = 'time_calibration.py'
+
+# Per-stage limits in seconds: (deadline, idle timeout with no output). Time the
+# user spends answering a prompt doesn't count. A stage over a limit is stopped.
+STAGE_LIMITS = {
+    SCRAPER_SCRIPT: (600, 180),
+    ALLOCATOR_SCRIPT: (600, 300),
+    CAPACITY_SCRIPT: (120, 60),
+    CALIBRATION_SCRIPT: (300, 120),
+    RECLAIM_SCRIPT: (3600, 300),
+    PIPELINE_SCRIPT: (3600, 300),
+}
+# Longest the Reclaim stage waits for the browser pre-warmed during scraping to finish logging in
+PREWARM_WAIT = 120
+
+
+class PagedRecordView(ttk.Frame):
+    """
+    Table of one data file, showing a single page of rows at a time with a
+    search box and filter. Rows are edited one at a time in a small JSON
+    editor and written back through the RecordStore.
+    """
+    def __init__(self, parent, make_store, on_change=None):
+        super().__init__(parent, padding="10")
+        self.make_store = make_store
+        # Called after a row was saved or deleted
+        self.on_change = on_change
+        self.store = None
+        self.matches = []
+        self.page = 0
+
+        # Search and filter bar
+        bar = ttk.Frame(self)
+        bar.pack(fill='x', pady=(0, 5))
+        ttk.Label(bar, text="Search:").pack(side='left')
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(bar, textvariable=self.search_var, width=30)
+        search_entry.pack(side='left', padx=5)
+        search_entry.bind('<Return>', lambda e: self.apply_query())
+        ttk.Button(bar, text="Search", command=self.apply_query).pack(side='left')
+        ttk.Label(bar, text="Filter:").pack(side='left', padx=(15, 0))
+        self.filter_var = tk.StringVar(value="All")
+        self.filter_box = ttk.Combobox(bar, textvariable=self.filter_var, state='readonly', width=18)
+        self.filter_box.pack(side='left', padx=5)
+        self.filter_box.bind('<<ComboboxSelected>>', lambda e: self.apply_query())
+        self.count_label = ttk.Label(bar, text="")
+        self.count_label.pack(side='right')
+
+        table_frame = ttk.Frame(self)
+        table_frame.pack(fill='both', expand=True)
+        self.tree = ttk.Treeview(table_frame, show='headings', selectmode='browse')
+        scrollbar = ttk.Scrollbar(table_frame, orient='vertical', command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side='left', fill='both', expand=True)
+        scrollbar.pack(side='right', fill='y')
+        self.tree.bind('<Double-1>', lambda e: self.edit_selected())
+
+        # Paging and row actions
+        nav = ttk.Frame(self)
+        nav.pack(fill='x', pady=(5, 0))
+        ttk.Button(nav, text="◀ Prev", command=lambda: self.show_page(self.page - 1)).pack(side='left')
+        self.page_label = ttk.Label(nav, text="")
+        self.page_label.pack(side='left', padx=10)
+        ttk.Button(nav, text="Next ▶", command=lambda: self.show_page(self.page + 1)).pack(side='left')
+        ttk.Button(nav, text="Refresh", command=self.reload).pack(side='left', padx=10)
+        self.delete_button = ttk.Button(nav, text="Delete Selected", command=self.delete_selected)
+        self.delete_button.pack(side='right')
+        self.edit_button = ttk.Button(nav, text="Edit Selected", command=self.edit_selected)
+        self.edit_button.pack(side='right', padx=5)
+
+    def ensure_loaded(self):
+        if self.store is None:
+            self.reload()
+
+    def reload(self):
+        """(Re)reads the file and re-runs the current search."""
+        try:
+            if self.store is None or self.store.read_only:
+                self.store = self.make_store()
+            self.store.load()
+        except Exception as e:
+            messagebox.showerror("JSON Error", f"Could not read the file: {e}", parent=self)
+            return
+
+        columns = (("key",) if self.store.is_rules else ()) + self.store.columns
+        self.tree.configure(columns=columns)
+        for column in columns:
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=260 if column in ("key", "name") else 120, stretch=True)
+        self.filter_box.configure(values=list(self.store.filters))
+        if self.filter_var.get() not in self.store.filters:
+            self.filter_var.set("All")
+        state = 'disabled' if self.store.read_only else 'normal'
+        self.edit_button.configure(state=state)
+        self.delete_button.configure(state=state)
+        self.apply_query(keep_page=True)
+
+    def apply_query(self, keep_page=False):
+        if self.store is None:
+            return
+        self.matches = self.store.query(self.search_var.get(), self.filter_var.get())
+        self.count_label.config(text=f"{len(self.matches)} of {len(self.store)} entries")
+        self.show_page(self.page if keep_page else 0)
+
+    def show_page(self, page):
+        last_page = max(0, (len(self.matches) - 1) // DATA_PAGE_SIZE)
+        self.page = min(max(0, page), last_page)
+        # Only the rows of the current page exist as widgets
+        self.tree.delete(*self.tree.get_children())
+        start = self.page * DATA_PAGE_SIZE
+        for index, row_id in enumerate(self.matches[start:start + DATA_PAGE_SIZE]):
+            self.tree.insert('', tk.END, iid=str(start + index), values=self.store.cells(row_id))
+        self.page_label.config(text=f"Page {self.page + 1} of {last_page + 1}")
+
+    def selected_row_id(self):
+        selection = self.tree.selection()
+        return self.matches[int(selection[0])] if selection else None
+
+    def edit_selected(self):
+        row_id = self.selected_row_id()
+        if row_id is None or self.store.read_only:
+            return
+
+        editor = tk.Toplevel(self)
+        editor.title(f"Edit entry: {row_id}")
+        editor.geometry("600x450")
+        editor.transient(self)
+        editor.grab_set()
+
+        text_area = scrolledtext.ScrolledText(editor, wrap=tk.WORD, font=("Consolas", 10), bg='#ffffff', bd=1, relief="solid")
+        text_area.insert(tk.END, json.dumps(self.store.get(row_id), indent=2))
+        text_area.pack(fill='both', expand=True, padx=10, pady=10)
+
+        def save_row():
+            try:
+                value = json.loads(text_area.get("1.0", tk.END))
+                self.store.update(row_id, value)
+            except json.JSONDecodeError as e:
+                messagebox.showerror("Validation Error", f"This entry is not valid JSON: {e}", parent=editor)
+                return
+            except (ValueError, StaleFileError) as e:
+                messagebox.showerror("Save Error", str(e), parent=editor)
+                return
+            except Exception as e:
+                messagebox.showerror("Save Error", f"Failed to save entry: {e}", parent=editor)
+                return
+            editor.destroy()
+            self.apply_query(keep_page=True)
+            if self.on_change is not None:
+                self.on_change()
+
+        ttk.Button(editor, text="Save Entry", command=save_row).pack(pady=(0, 10))
+
+    def delete_selected(self):
+        row_id = self.selected_row_id()
+        if row_id is None or self.store.read_only:
+            return
+        if not messagebox.askyesno("Confirm Delete", f"Delete entry '{row_id}'?", parent=self):
+            return
+        try:
+            self.store.delete(row_id)
+        except Exception as e:
+            messagebox.showerror("Delete Error", str(e), parent=self)
+            return
+        self.apply_query(keep_page=True)
+        if self.on_change is not None:
+            self.on_change()
 
 
 class SyncConfigApp(tk.Tk):
@@ -43,17 +235,16 @@ class SyncConfigApp(tk.Tk):
         # Event for pausing the worker thread during the Selenium warning popup
         self.continue_event = threading.Event()
         self.pipeline_cancelled = False
+        # Set by the Cancel button; the running stage is asked to stop and save its progress
+        self.cancel_event = threading.Event()
 
         # Initialize data structures
         self.settings = {}
-        self.data = {
-            NEW_ASSIGNMENTS_FILE: '[]',
-            TIMED_ASSIGNMENTS_FILE: '[]',
-            SEEN_ASSIGNMENTS_FILE: '[]',
-            PREV_SEEN_ASSIGNMENTS_FILE: '[]', 
-            TIME_ALLOCATION_RULES_FILE: '{}' 
-        }
+        # Open data window views by file name; files are only read when a view is shown
+        self.data_views = {}
         self.load_all_files()
+        self.snapshot_store = snapshots.SnapshotStore()
+        self.import_legacy_backup()
 
         # Create tabs - Tab 3 removed from the main notebook
         self.create_run_tab()     # <-- 1st: Main Tab
@@ -95,6 +286,14 @@ class SyncConfigApp(tk.Tk):
             'RECLAIM_PASSWORD': r'RECLAIM_PASSWORD\s*=\s*(?:r?["\'](.+?)["\'])',
             'CHROME_PROFILE_PATH': r'CHROME_PROFILE_PATH\s*=\s*r?["\'](.+?)["\']',
             'CHROME_PROFILE_NAME': r'CHROME_PROFILE_NAME\s*=\s*(?:r?["\'](.+?)["\'])',
+            # Optional: "courses", "planner" or "graphql" (see canvas_scrape_assignments.py)
+            'CANVAS_INGEST_STRATEGY': r'CANVAS_INGEST_STRATEGY\s*=\s*(?:r?["\'](.+?)["\'])',
+            # Optional: enables reconcile mode in reclaim_task_creator.py
+            'RECLAIM_API_KEY': r'RECLAIM_API_KEY\s*=\s*(?:r?["\'](.+?)["\'])',
+            # Optional: number of days ahead to track assignments (see working_set.py)
+            'ACTIVE_WINDOW_DAYS': r'ACTIVE_WINDOW_DAYS\s*=\s*(\d+|None)',
+            # Optional: hours per day (or list of 7, Monday first) for capacity_planner.py
+            'AVAILABLE_HOURS_PER_DAY': r'AVAILABLE_HOURS_PER_DAY\s*=\s*(\[[^\]]*\]|[\d.]+)',
         }
 
         for key, pattern in mapping.items():
@@ -104,35 +303,22 @@ class SyncConfigApp(tk.Tk):
             else:
                 self.settings[key] = ''
 
-    def load_json_data(self, filename):
-        """Loads JSON data from local files."""
-        # Determine the expected default content
-        is_rules_file = filename == TIME_ALLOCATION_RULES_FILE
-        default_content = '{}' if is_rules_file else '[]'
-        
-        if os.path.exists(filename):
-            try:
-                with open(filename, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    json.loads(content) 
-                    self.data[filename] = content
-            except json.JSONDecodeError:
-                messagebox.showerror("JSON Error", f"File '{filename}' contains invalid JSON. Resetting to default.")
-                self.data[filename] = default_content
-            except Exception as e:
-                print(f"Error loading {filename}: {e}")
-        else:
-            self.data[filename] = default_content
-            print(f"INFO: {filename} not found. Created empty data.")
+    def kept_config_lines(self):
+        """The lines of config.py not managed by the settings tab (optional settings, comments)."""
+        if not os.path.exists(CONFIG_FILE):
+            return []
+        with open(CONFIG_FILE, 'r') as f:
+            lines = f.read().splitlines()
+        field = re.compile(r'\s*(' + '|'.join(CONFIG_FIELDS) + r')\s*=')
+        kept = [line for line in lines if line not in CONFIG_HEADER_LINES and not field.match(line)]
+        # The blank line after the header would otherwise pile up on every save
+        while kept and not kept[0].strip():
+            kept.pop(0)
+        return kept
 
     def load_all_files(self):
-        """Initializes settings and data by loading all local files."""
+        """Initializes settings. The JSON data files are read on demand by the data window."""
         self.load_config_py()
-        self.load_json_data(SEEN_ASSIGNMENTS_FILE)
-        self.load_json_data(PREV_SEEN_ASSIGNMENTS_FILE) # Load the new backup file
-        self.load_json_data(NEW_ASSIGNMENTS_FILE)
-        self.load_json_data(TIMED_ASSIGNMENTS_FILE)
-        self.load_json_data(TIME_ALLOCATION_RULES_FILE) 
 
     def save_settings(self):
         """Writes configuration variables to config.py."""
@@ -145,8 +331,9 @@ class SyncConfigApp(tk.Tk):
             path = self.path_entry.get()
             profile = self.profile_entry.get()
 
-            content = f"""# Local Configuration for Reclaim Sync Script
-# WARNING: Do not share this file. It contains sensitive credentials.
+            kept = self.kept_config_lines()
+            content = f"""{CONFIG_HEADER_LINES[0]}
+{CONFIG_HEADER_LINES[1]}
 
 CANVAS_URL = "{canvas_url}"
 CANVAS_TOKEN = "{token}" # <--- UPDATED to CANVAS_TOKEN
@@ -155,6 +342,9 @@ RECLAIM_PASSWORD = "{password}"
 CHROME_PROFILE_PATH = r"{path.replace('\\', '/')}" # Uses raw string for Windows path safety
 CHROME_PROFILE_NAME = "{profile}"
 """
+            # Keep the optional settings (and comments) the user set by hand
+            content += ''.join(line + '\n' for line in kept)
+
             with open(CONFIG_FILE, 'w') as f:
                 f.write(content)
 
@@ -162,27 +352,9 @@ CHROME_PROFILE_NAME = "{profile}"
         except Exception as e:
             messagebox.showerror("Save Error", f"Failed to save settings: {e}")
 
-    def save_json_data(self, filename, text_widget):
-        """Writes the content of the text area to a JSON file, after validation."""
-        content = text_widget.get("1.0", tk.END).strip()
-        
-        try:
-            json.loads(content)
-        except json.JSONDecodeError:
-            messagebox.showerror("Validation Error", f"Content in {filename} is not valid JSON. Please correct it.")
-            return
-
-        try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(content)
-            messagebox.showinfo("Success", f"Data successfully saved to {filename}.")
-            self.data[filename] = content 
-        except Exception as e:
-            messagebox.showerror("Save Error", f"Failed to save data to {filename}: {e}")
-
     # --- Utility Reset Function (Unchanged) ---
     def reset_json_file(self, filenames):
-        """Resets one or more JSON files to '[]' or '{}' and updates the data model and Data tab if open."""
+        """Resets one or more JSON files to '[]' or '{}' and updates the Data window if open."""
         
         if not isinstance(filenames, list):
             filenames = [filenames]
@@ -206,19 +378,8 @@ CHROME_PROFILE_NAME = "{profile}"
                 with open(filename, 'w', encoding='utf-8') as f:
                     f.write(content_to_write)
                 
-                self.data[filename] = content_to_write # Update internal data model
-
-                # Logic to update the correct text widget if the Data window is open
-                if hasattr(self, 'seen_assignments_text') and self.seen_assignments_text.winfo_exists():
-                    if filename == SEEN_ASSIGNMENTS_FILE:
-                        self.seen_assignments_text.delete('1.0', tk.END)
-                        self.seen_assignments_text.insert(tk.END, content_to_write)
-                    elif filename == TIMED_ASSIGNMENTS_FILE:
-                        self.timed_assignments_text.delete('1.0', tk.END)
-                        self.timed_assignments_text.insert(tk.END, content_to_write)
-                    elif filename == TIME_ALLOCATION_RULES_FILE:
-                        self.rules_assignments_text.delete('1.0', tk.END)
-                        self.rules_assignments_text.insert(tk.END, content_to_write)
+                # Update the Data window if it is open
+                self.refresh_data_views([filename])
                 
                 success_count += 1
             except Exception as e:
@@ -227,36 +388,75 @@ CHROME_PROFILE_NAME = "{profile}"
         if success_count == len(filenames):
              messagebox.showinfo("Success", f"All specified files ({file_list_str}) have been successfully reset.")
              
-    # --- Restore Function (Unchanged) ---
+    # --- Snapshot History / Restore ---
+    def import_legacy_backup(self):
+        """Turns an existing prev_seen_assignments.json into the first snapshot, once."""
+        if self.snapshot_store.latest() is not None or not os.path.exists(PREV_SEEN_ASSIGNMENTS_FILE):
+            return
+        try:
+            with open(PREV_SEEN_ASSIGNMENTS_FILE, 'r', encoding='utf-8') as f:
+                backup = json.load(f)
+            self.snapshot_store.create_from_data({SEEN_ASSIGNMENTS_FILE: backup}, label="prev_seen_assignments.json")
+        except Exception as e:
+            print(f"WARNING: Could not import {PREV_SEEN_ASSIGNMENTS_FILE} into the snapshot history: {e}")
+
+    def refresh_data_views(self, filenames):
+        """Re-reads the given files in any open data window view."""
+        for filename in filenames:
+            view = self.data_views.get(filename)
+            if view is not None and view.winfo_exists():
+                view.reload()
+
     def restore_previous_sync(self):
         """
-        Replaces seen_assignments.json content with the backup from prev_seen_assignments.json.
+        Lets the user pick a snapshot from sync_history/ (newest first; one is
+        taken before every sync) and restores the assignment files from it.
         """
-        backup_content = self.data.get(PREV_SEEN_ASSIGNMENTS_FILE, '[]') # Default to empty list string if somehow missing
-        
-        if not os.path.exists(PREV_SEEN_ASSIGNMENTS_FILE):
-            messagebox.showinfo("Restore Failed", "The backup file (prev_seen_assignments.json) does not exist to restore from.")
+        history = self.snapshot_store.list_snapshots()
+        if not history:
+            messagebox.showinfo("Restore Failed", "There are no snapshots to restore from yet. One is taken before every sync.")
             return
 
-        # Proceed with copy.
-        try:
-            # 1. Write the backup content to the main file
-            with open(SEEN_ASSIGNMENTS_FILE, 'w', encoding='utf-8') as f:
-                f.write(backup_content)
-            
-            # 2. Update the internal data model
-            self.data[SEEN_ASSIGNMENTS_FILE] = backup_content
-            
-            # 3. Update the Data Window UI if visible
-            if hasattr(self, 'seen_assignments_text') and self.seen_assignments_text.winfo_exists():
-                self.seen_assignments_text.delete('1.0', tk.END)
-                self.seen_assignments_text.insert(tk.END, backup_content)
-                
-            messagebox.showinfo("Restore Complete", "Successfully restored seen_assignments.json from the previous sync.")
-            self.append_to_console("--- RESTORE COMPLETE: seen_assignments.json has been reverted to the last successful state. ---")
-            
-        except Exception as e:
-            messagebox.showerror("Restore Error", f"Failed to restore previous sync data: {e}")
+        restore_window = tk.Toplevel(self)
+        restore_window.title("Restore a Previous Sync")
+        restore_window.geometry("700x400")
+        restore_window.transient(self)
+        restore_window.grab_set()
+
+        ttk.Label(restore_window, text="Select the point to restore to (the newest is the state before the last sync):",
+                  font=('Arial', 11)).pack(pady=10, padx=10, anchor='w')
+
+        listbox = tk.Listbox(restore_window, font=("Consolas", 10), height=12)
+        listbox.pack(fill='both', expand=True, padx=10)
+        history.reverse()
+        for snapshot in history:
+            listbox.insert(tk.END, snapshots.describe(snapshot))
+        listbox.selection_set(0)
+
+        # Rules are curated by hand, so they are only rolled back on request
+        include_rules_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(restore_window, text="Also restore assignment_time_rules.json",
+                        variable=include_rules_var).pack(pady=5, padx=10, anchor='w')
+
+        def do_restore():
+            selection = listbox.curselection()
+            if not selection:
+                return
+            snapshot = history[selection[0]]
+            files = [SEEN_ASSIGNMENTS_FILE, TIMED_ASSIGNMENTS_FILE]
+            if include_rules_var.get():
+                files.append(TIME_ALLOCATION_RULES_FILE)
+            try:
+                restored = self.snapshot_store.restore(snapshot['id'], files)
+                self.refresh_data_views(restored)
+            except Exception as e:
+                messagebox.showerror("Restore Error", f"Failed to restore snapshot #{snapshot['id']}: {e}")
+                return
+            restore_window.destroy()
+            messagebox.showinfo("Restore Complete", f"Restored {', '.join(restored)} from snapshot #{snapshot['id']}.")
+            self.append_to_console(f"--- RESTORE COMPLETE: {', '.join(restored)} reverted to snapshot #{snapshot['id']} ({snapshot['time']}). ---")
+
+        ttk.Button(restore_window, text="Restore Selected", style='Danger.TButton', command=do_restore).pack(pady=10)
 
     # --- UI Creation: Settings Tab (Updated for CANVAS_URL) ---
     def create_settings_tab(self):
@@ -415,76 +615,63 @@ CHROME_PROFILE_NAME = "{profile}"
         
         return self.user_time_input
 
-    # --- JSON Data Management Window (Unchanged) ---
+    # --- JSON Data Management Window ---
 
-    def create_json_editor(self, parent, title, filename):
-        """Helper function to create a JSON editor frame."""
-        editor_frame = ttk.LabelFrame(parent, text=title, padding="10")
-        editor_frame.pack(fill='both', expand=True, pady=10)
-
-        text_area = scrolledtext.ScrolledText(editor_frame, wrap=tk.WORD, height=15, font=("Consolas", 10), 
-                                                 bg='#ffffff', bd=1, relief="solid")
-        
-        # Load content from self.data
-        text_area.insert(tk.END, self.data.get(filename, '[]')) 
-        text_area.pack(fill='both', expand=True)
-
-        # Only allow saving the main files (not the backup file)
-        if filename != PREV_SEEN_ASSIGNMENTS_FILE:
-            save_button = ttk.Button(editor_frame, text=f"Save {filename}", 
-                                                     command=lambda: self.save_json_data(filename, text_area))
-            save_button.pack(pady=5)
-        
-        return text_area
-
-
-    def populate_data_files_ui(self, parent_frame):
-        """Populates the UI elements for editing JSON data files within a given parent frame."""
-        # 1. seen_assignments.json 
-        self.seen_assignments_text = self.create_json_editor(
-            parent_frame, 
-            "seen_assignments.json (Assignment Tracker - Current)", 
-            SEEN_ASSIGNMENTS_FILE
-        )
-        
-        # 2. Backup File (No Save Button)
-        self.create_json_editor(
-            parent_frame, 
-            "prev_seen_assignments.json (Assignment Tracker - Backup)", 
-            PREV_SEEN_ASSIGNMENTS_FILE
-        )
-
-        # 3. timed_assignments.json
-        self.timed_assignments_text = self.create_json_editor(
-            parent_frame, 
-            "timed_assignments.json (Time Allocated/Synced Status)", 
-            TIMED_ASSIGNMENTS_FILE
-        )
-        # 4. assignment_time_rules.json 
-        self.rules_assignments_text = self.create_json_editor(
-            parent_frame, 
-            "assignment_time_rules.json (Time Allocation Rules)", 
-            TIME_ALLOCATION_RULES_FILE
-        )
+    def latest_snapshot_store(self):
+        """Read-only store over seen_assignments.json as of the newest snapshot."""
+        latest = self.snapshot_store.latest()
+        data = self.snapshot_store.materialize(latest, SEEN_ASSIGNMENTS_FILE) if latest else None
+        return RecordStore(None, data or [])
 
     def open_data_files_window(self):
-        """Creates a Toplevel window to display and edit all JSON data files."""
+        """
+        Creates a Toplevel window with one paged table per JSON data file.
+        Each file is only read when its tab is first shown.
+        """
         data_window = tk.Toplevel(self)
         data_window.title("Configuration Data Files (*.json)")
-        data_window.geometry("800x800")
+        data_window.geometry("900x700")
         data_window.grab_set() 
         data_window.transient(self)
 
-        # Frame to hold all editors
-        data_frame = ttk.Frame(data_window, padding="10")
-        data_frame.pack(expand=True, fill='both')
-
-        # Populate the content of the old Tab 3
-        self.populate_data_files_ui(data_frame)
+        files_notebook = ttk.Notebook(data_window)
+        files_notebook.pack(expand=True, fill='both', padx=10, pady=10)
+
+        tabs = [
+            ("seen_assignments.json", SEEN_ASSIGNMENTS_FILE, lambda: RecordStore(SEEN_ASSIGNMENTS_FILE)),
+            ("timed_assignments.json", TIMED_ASSIGNMENTS_FILE, lambda: RecordStore(TIMED_ASSIGNMENTS_FILE)),
+            ("assignment_time_rules.json", TIME_ALLOCATION_RULES_FILE, lambda: RecordStore(TIME_ALLOCATION_RULES_FILE)),
+            ("Latest snapshot (Backup)", SNAPSHOT_VIEW, self.latest_snapshot_store),
+        ]
+        self.data_views = {}
+        for title, key, make_store in tabs:
+            # A rule edit is applied to the assignments of that group right away
+            on_change = self.apply_rule_changes if key == TIME_ALLOCATION_RULES_FILE else None
+            view = PagedRecordView(files_notebook, make_store, on_change)
+            files_notebook.add(view, text=title)
+            self.data_views[key] = view
+
+        def on_tab_changed(event):
+            files_notebook.nametowidget(files_notebook.select()).ensure_loaded()
+
+        files_notebook.bind("<<NotebookTabChanged>>", on_tab_changed)
+        self.data_views[SEEN_ASSIGNMENTS_FILE].ensure_loaded()
         
         close_button = ttk.Button(data_window, text="Close Window", command=data_window.destroy)
         close_button.pack(pady=10)
 
+    def apply_rule_changes(self):
+        """Re-times the assignments of edited rule groups (and their Reclaim tasks) in the background."""
+        def run():
+            try:
+                result = subprocess.run(['python', RULE_INDEX_SCRIPT], capture_output=True, text=True, timeout=300)
+                output = (result.stdout + result.stderr).strip()
+            except (OSError, subprocess.TimeoutExpired) as e:
+                output = f"Could not apply the rule change: {e}"
+            self.after(0, self.append_to_console, f"\n--- Rule edit ---\n{output}")
+            self.after(0, self.refresh_data_views, [TIMED_ASSIGNMENTS_FILE])
+        threading.Thread(target=run, daemon=True).start()
+
     # --- New Warning Pop-up (UPDATED) ---
     def display_selenium_warning(self):
         """Displays the crucial warning before starting Selenium and waits for user acknowledgment."""
@@ -579,11 +766,24 @@ CHROME_PROFILE_NAME = "{profile}"
                                                  command=self.start_sync_thread, 
                                                  style='Accent.TButton')
         self.run_button.pack(pady=20, ipadx=20, ipady=10)
+
+        # Cancel Button (only shown while a sync is running)
+        self.cancel_button = ttk.Button(run_frame, text="■ Cancel Sync", style='Danger.TButton',
+                                        command=self.cancel_sync)
+
+        # Streaming mode: tasks are created while Canvas is still being fetched
+        self.streaming_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(run_frame, text="Streaming mode (sync new tasks while still fetching)",
+                        variable=self.streaming_var).pack()
         
         # Progress Bar 
         self.progress_bar = ttk.Progressbar(run_frame, orient='horizontal', length=400, mode='determinate', maximum=3)
         self.progress_bar.pack(pady=10)
         self.progress_bar.pack_forget() # Hide it initially
+        # Per-item status of the running stage (counts, rate, ETA)
+        self.progress_label = ttk.Label(run_frame, text="", foreground='gray')
+        # Stages finished so far; the bar shows this plus the running stage's fraction
+        self.progress_base = 0
         
         # Done Message Label 
         self.done_label = ttk.Label(run_frame, text="✅ SYNC DONE! ✅", font=('Arial', 14, 'bold'), 
@@ -605,10 +805,16 @@ CHROME_PROFILE_NAME = "{profile}"
         """Starts the full sync process in a separate thread to keep the UI responsive."""
         self.run_button.config(state=tk.DISABLED, text="SYNC IN PROGRESS...")
         self.console_output.delete('1.0', tk.END)
+        self.cancel_event.clear()
+        self.cancel_button.config(state=tk.NORMAL, text="■ Cancel Sync")
+        self.cancel_button.pack(pady=(0, 10), after=self.run_button)
         
         # Progress Bar Setup (NEW)
         self.progress_bar.pack(pady=10, after=self.run_button) # Show the progress bar
         self.progress_bar.config(value=0)
+        self.progress_base = 0
+        self.progress_label.config(text="")
+        self.progress_label.pack(after=self.progress_bar)
         
         # Hide the DONE message if restarting sync
         self.after(0, lambda: self.done_label.pack_forget())
@@ -617,34 +823,60 @@ CHROME_PROFILE_NAME = "{profile}"
         sync_thread = threading.Thread(target=self.run_full_sync)
         sync_thread.start()
 
+    def show_progress(self, event):
+        """Renders a stage's progress event on the bar and status label."""
+        self.progress_label.config(text=progress.describe(event))
+        total = event.get('total')
+        if total:
+            fraction = min(1.0, event['done'] / total)
+            self.progress_bar.config(value=self.progress_base + fraction)
+
+    def complete_progress_stage(self):
+        self.progress_base += 1
+        self.progress_bar.config(value=self.progress_base)
+
+    def cancel_sync(self):
+        """Stops the running sync after the current item; finished work is saved."""
+        self.cancel_button.config(state=tk.DISABLED, text="Cancelling...")
+        self.append_to_console("\n--- CANCEL REQUESTED: stopping after the current step and saving progress... ---")
+        self.cancel_event.set()
+        # Also release the worker if it is waiting on the Selenium warning
+        self.pipeline_cancelled = True
+        self.continue_event.set()
+
     def run_script_and_capture_output(self, script_name):
         """Helper to run a Python script and redirect its output to the console,
-           and check for user prompt requests."""
+           and check for user prompt requests. The stage is supervised: stdout and
+           stderr are read at the same time, and it is stopped on cancel or when
+           it goes over its STAGE_LIMITS."""
         self.append_to_console(f"\n--- Running Stage: {script_name} ---")
+        if self.cancel_event.is_set():
+            return False
         
-        # Only implement interrupt/prompt logic for the Allocator script
-        is_allocator = (script_name == ALLOCATOR_SCRIPT)
+        # Only implement interrupt/prompt logic for the scripts that allocate time
+        is_allocator = script_name in (ALLOCATOR_SCRIPT, PIPELINE_SCRIPT)
+        deadline, idle_timeout = STAGE_LIMITS.get(script_name, (None, None))
         
         try:
             # We use stdin=subprocess.PIPE for the allocator so we can send the input back
-            stdin_pipe = subprocess.PIPE if is_allocator else None
-            
-            # Execute the script using the same Python interpreter
-            process = subprocess.Popen(['python', script_name], 
-                                         stdin=stdin_pipe,       # Added stdin pipe
-                                         stdout=subprocess.PIPE, 
-                                         stderr=subprocess.PIPE, 
-                                         text=True, 
-                                         bufsize=1) 
+            # Ask the stage for structured progress events, unbuffered so they arrive live
+            env = dict(os.environ, PYTHONUNBUFFERED='1')
+            env[progress.EVENTS_ENV] = 'events'
+            run = stage_supervisor.StageRun(['python', script_name], deadline=deadline,
+                                            idle_timeout=idle_timeout, stdin=is_allocator, env=env)
             
             # Pattern to detect the assignment group detection message
             assignment_pattern = re.compile(r"NEW ASSIGNMENT TYPE: '(.+?)'")
 
-            # Read and display output line by line in real-time
-            for line in process.stdout:
+            # Read and display output line by line in real-time (stderr is shown as it arrives)
+            for stream, line in run.lines(self.cancel_event):
+                event = progress.parse_event(line)
+                if event is not None:
+                    self.after(0, self.show_progress, event)
+                    continue
                 
                 # Check for the specific pattern if running the Allocator script
-                if is_allocator:
+                if is_allocator and stream == 'stdout':
                     match = assignment_pattern.search(line)
                     if match:
                         assignment_type = match.group(1)
@@ -653,47 +885,47 @@ CHROME_PROFILE_NAME = "{profile}"
                         self.append_to_console(line.strip())
                         self.append_to_console("--- USER INPUT REQUIRED ---")
                         
-                        # PAUSE EXECUTION and launch the prompt widget
+                        # PAUSE EXECUTION and launch the prompt widget (the stage's clock is paused too)
+                        asked_at = time.monotonic()
                         user_time = self.prompt_for_time_estimate(assignment_type)
+                        run.extend(time.monotonic() - asked_at)
 
                         if user_time is None:
                             self.append_to_console("!!! User cancelled time allocation. Halting sync. !!!")
-                            process.terminate()
-                            return False
+                            self.cancel_event.set()
+                            continue
                         
                         # Send the user's input back to the allocator script via stdin
                         try:
-                            time_str = str(user_time) + '\n'
-                            process.stdin.write(time_str)
-                            process.stdin.flush()
+                            run.write(str(user_time) + '\n')
                             self.append_to_console(f"--- Sent input to script: {user_time} hours ---")
                         except Exception as write_error:
                             self.append_to_console(f"!!! Error sending input back: {write_error} !!!")
-                            process.terminate()
-                            return False
+                            run.stop()
+                        continue
 
                 # Append line to console after checking for pattern
                 self.console_output.insert(tk.END, line)
                 self.console_output.see(tk.END)
-            
-            # Close stdin pipe if it was opened
-            if is_allocator:
-                process.stdin.close()
                 
             # Wait for the process to finish
-            process.wait()
+            returncode = run.finish()
+
+            if run.stop_reason is not None:
+                self.append_to_console(f"!!! STAGE STOPPED: {script_name} {run.stop_reason} (exit code {returncode}) !!!")
+                return False
 
             # Check for errors from stderr
-            stderr_output = process.stderr.read().strip()
+            stderr_output = ''.join(run.stderr_lines).strip()
             if stderr_output:
-                self.append_to_console(f"!!! SCRIPT ERROR in {script_name} !!!\n{stderr_output}")
+                self.append_to_console(f"!!! SCRIPT ERROR in {script_name} (see output above) !!!")
                 return False 
 
-            if process.returncode != 0:
-                self.append_to_console(f"!!! SCRIPT FAILED: {script_name} exited with code {process.returncode} !!!")
+            if returncode != 0:
+                self.append_to_console(f"!!! SCRIPT FAILED: {script_name} exited with code {returncode} !!!")
                 return False
 
-            self.append_to_console(f"--- Stage {script_name} Complete (Code {process.returncode}) ---")
+            self.append_to_console(f"--- Stage {script_name} Complete (Code {returncode}) ---")
             return True
 
         except FileNotFoundError:
@@ -703,9 +935,53 @@ CHROME_PROFILE_NAME = "{profile}"
             self.append_to_console(f"FATAL EXCEPTION running {script_name}: {e}")
             return False
 
+    def start_browser_prewarm(self):
+        """Launches and logs into the Reclaim browser in the background while the
+           earlier stages run. Returns the process, or None when it isn't needed."""
+        if self.settings.get('RECLAIM_API_KEY'):
+            # Reconcile mode talks to the Reclaim API; no browser needed
+            return None
+        try:
+            process = subprocess.Popen(['python', RECLAIM_SCRIPT, '--prewarm'],
+                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                                       env=dict(os.environ, PYTHONUNBUFFERED='1'))
+        except OSError as e:
+            self.append_to_console(f"WARNING: Could not pre-warm the browser: {e}")
+            return None
+        self.append_to_console("--- Pre-warming the Reclaim browser in the background. DO NOT INTERACT with it. ---")
+
+        def relay():
+            for line in process.stdout:
+                self.after(0, self.append_to_console, f"[pre-warm] {line.rstrip()}")
+        threading.Thread(target=relay, daemon=True).start()
+        return process
+
+    def wait_for_browser_prewarm(self, process):
+        """Lets the pre-warm finish logging in before the Reclaim stage attaches to it."""
+        if process is None or process.poll() is not None:
+            return
+        self.append_to_console("--- Waiting for the pre-warmed browser to finish logging in... ---")
+        try:
+            process.wait(timeout=PREWARM_WAIT)
+        except subprocess.TimeoutExpired:
+            # The stage starts its own browser instead
+            process.kill()
+            browser_session.discard()
+
+    def discard_browser_prewarm(self, process):
+        """Closes a pre-warmed browser the Reclaim stage didn't use (e.g. the sync stopped early)."""
+        if process is not None:
+            try:
+                process.wait(timeout=PREWARM_WAIT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        browser_session.discard()
+
     def update_run_tab_end_state(self, pipeline_success):
         """Handles final UI updates on the main thread after sync completion."""
         self.progress_bar.pack_forget()
+        self.progress_label.pack_forget()
+        self.cancel_button.pack_forget()
         self.run_button.config(state=tk.NORMAL, text="▶ START FULL SYNC WORKFLOW")
         
         # Show the DONE message if successful
@@ -715,35 +991,68 @@ CHROME_PROFILE_NAME = "{profile}"
         # Note: If it failed, the done label remains hidden.
 
 
+    def final_sync_message(self, pipeline_success):
+        if pipeline_success:
+            return "✅ FULL SYNC WORKFLOW COMPLETED SUCCESSFULLY ✅"
+        if self.cancel_event.is_set():
+            return "⏹ SYNC CANCELLED (completed work was saved) ⏹"
+        return "❌ FULL SYNC WORKFLOW FAILED ❌"
+
+    def run_streaming_sync(self):
+        """Streaming mode: runs pipeline.py, which scrapes, allocates and syncs concurrently."""
+        # The browser may open as soon as the first task is ready, so warn up front
+        self.after(0, self.display_selenium_warning)
+        self.continue_event.wait()
+        pipeline_success = not self.pipeline_cancelled
+
+        if pipeline_success:
+            self.append_to_console("\n--- Starting STREAMING PIPELINE (scrape + allocate + Reclaim) ---")
+            self.append_to_console("A browser window may open while assignments are still being fetched. DO NOT INTERACT with it.")
+            pipeline_success = self.run_script_and_capture_output(PIPELINE_SCRIPT)
+            if pipeline_success:
+                self.after(0, lambda: self.progress_bar.config(value=3))
+                self.run_script_and_capture_output(CALIBRATION_SCRIPT)
+
+        final_message = self.final_sync_message(pipeline_success)
+        self.append_to_console(f"\n====================================\n{final_message}\n====================================")
+        self.after(0, self.update_run_tab_end_state, pipeline_success)
+
     def run_full_sync(self):
         """The main synchronization pipeline execution function."""
         pipeline_success = True
         
-        # --- PRE-SYNC STEP: BACKUP SEEN_ASSIGNMENTS ---
+        # --- PRE-SYNC STEP: SNAPSHOT THE ASSIGNMENT FILES ---
         try:
-            with open(SEEN_ASSIGNMENTS_FILE, 'r', encoding='utf-8') as src:
-                content = src.read()
-            with open(PREV_SEEN_ASSIGNMENTS_FILE, 'w', encoding='utf-8') as dst:
-                dst.write(content)
-            self.load_json_data(PREV_SEEN_ASSIGNMENTS_FILE)
-            self.append_to_console("--- Backup: seen_assignments.json content successfully copied to prev_seen_assignments.json. (LITERAL COPY) ---")
-
-        except FileNotFoundError:
-            self.append_to_console("--- Backup: Source file seen_assignments.json not found, skipping content copy. ---")
+            snapshot = self.snapshot_store.create(label="before sync")
+            if snapshot is None:
+                self.append_to_console("--- Backup: No assignment files found, skipping snapshot. ---")
+            else:
+                self.append_to_console(f"--- Backup: {snapshots.describe(snapshot)} saved to {snapshots.HISTORY_DIR}/. ---")
         except Exception as e:
-            self.append_to_console(f"WARNING: Failed to create backup of assignments (Pure Python Read/Write error): {e}")
+            self.append_to_console(f"WARNING: Failed to create snapshot of assignments: {e}")
             
+        if self.streaming_var.get():
+            self.run_streaming_sync()
+            return
+
+        # Chrome starts and logs in while the scraper and allocator run
+        prewarm = self.start_browser_prewarm()
+
         # 1. Canvas Scraper
         if pipeline_success:
             pipeline_success = self.run_script_and_capture_output(SCRAPER_SCRIPT)
             if pipeline_success:
-                self.after(0, lambda: self.progress_bar.step(1))
+                self.after(0, self.complete_progress_stage)
 
         # 2. Time Allocator
         if pipeline_success:
             pipeline_success = self.run_script_and_capture_output(ALLOCATOR_SCRIPT)
             if pipeline_success:
-                self.after(0, lambda: self.progress_bar.step(1))
+                self.after(0, self.complete_progress_stage)
+
+        # 2b. Capacity check (only warns; an overloaded week doesn't stop the sync)
+        if pipeline_success and not self.cancel_event.is_set():
+            self.run_script_and_capture_output(CAPACITY_SCRIPT)
 
         # --- Intermediary Popup Warning ---
         if pipeline_success:
@@ -759,17 +1068,25 @@ CHROME_PROFILE_NAME = "{profile}"
         if pipeline_success:
             self.append_to_console("\n--- Starting Stage: RECLAIM TASK CREATOR (Selenium Automation) ---")
             self.append_to_console("A browser window will open now. DO NOT INTERACT with the browser until the script finishes.")
+            self.wait_for_browser_prewarm(prewarm)
             pipeline_success = self.run_script_and_capture_output(RECLAIM_SCRIPT)
             if pipeline_success:
-                self.after(0, lambda: self.progress_bar.step(1))
+                self.after(0, self.complete_progress_stage)
+
+        # 4. Learn from the time actually spent (only adjusts rules; a failure doesn't fail the sync)
+        if pipeline_success and not self.cancel_event.is_set():
+            self.run_script_and_capture_output(CALIBRATION_SCRIPT)
 
         # Final Status Update
-        final_message = "✅ FULL SYNC WORKFLOW COMPLETED SUCCESSFULLY ✅" if pipeline_success else "❌ FULL SYNC WORKFLOW FAILED ❌"
+        final_message = self.final_sync_message(pipeline_success)
         self.append_to_console(f"\n====================================\n{final_message}\n====================================")
         
         # Call the dedicated update function in the main thread
         self.after(0, self.update_run_tab_end_state, pipeline_success)
 
+        # The Reclaim stage closes the browser it used; this covers a sync that stopped before it
+        self.discard_browser_prewarm(prewarm)
+
 
 if __name__ == "__main__":
     app = SyncConfigApp()
@@ -0,0 +1,119 @@
+"""
+Assignment record shared by the scraper, allocator and Reclaim task creator.
+
+Each stage used to pass assignments around as free-form dicts, copying them
+and re-parsing the ISO timestamps at every step. An `Assignment` is a slotted
+dataclass with the dates parsed once on load, and converts back to the same
+dict layout that is stored in seen_assignments.json / timed_assignments.json.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+# Keys written for every assignment, in on-disk order
+CORE_FIELDS = ("name", "html_url", "course_name", "due_at", "unlock_at")
+# Keys only written once a later stage has filled them in
+PIPELINE_FIELDS = ("start_at", "group_key", "time_allocated_hours", "reclaim_synced")
+KNOWN_FIELDS = frozenset(CORE_FIELDS + PIPELINE_FIELDS)
+
+
+def parse_datetime(value: Any) -> Optional[datetime]:
+    """Parses a Canvas ISO-8601 timestamp ("2024-09-01T03:59:59Z"). Returns None if missing/invalid."""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    try:
+        # fromisoformat only accepts the "Z" suffix from Python 3.11 on
+        if isinstance(value, str) and value.endswith(("Z", "z")):
+            value = value[:-1] + "+00:00"
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def format_datetime(value: Optional[datetime]) -> Optional[str]:
+    """Formats a datetime back to the Canvas ISO-8601 form ('Z' suffix for UTC)."""
+    if value is None:
+        return None
+    if value.tzinfo is not None and value.utcoffset() == timezone.utc.utcoffset(None):
+        return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return value.isoformat()
+
+
+@dataclass(slots=True)
+class Assignment:
+    name: str
+    html_url: str
+    course_name: str = "Unknown"
+    due_at: Optional[datetime] = None
+    unlock_at: Optional[datetime] = None
+    start_at: Optional[datetime] = None
+    group_key: Optional[str] = None
+    time_allocated_hours: Optional[float] = None
+    reclaim_synced: bool = False
+    # Any unrecognised keys from a hand-edited file, kept so they round-trip
+    extra: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_canvas(cls, item: Dict[str, Any]) -> "Assignment":
+        """Builds a record from a (projected) Canvas API assignment object."""
+        return cls(
+            name=item.get("name"),
+            html_url=item.get("html_url"),
+            course_name=item.get("course_name", "Unknown"),
+            due_at=parse_datetime(item.get("due_at")),
+            unlock_at=parse_datetime(item.get("unlock_at")),
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Assignment":
+        """Builds a record from an entry of seen_assignments.json / timed_assignments.json."""
+        extra = {k: v for k, v in data.items() if k not in KNOWN_FIELDS} or None
+        return cls(
+            name=data.get("name", "Unnamed Assignment"),
+            html_url=data.get("html_url"),
+            course_name=data.get("course_name", "Unknown"),
+            due_at=parse_datetime(data.get("due_at")),
+            unlock_at=parse_datetime(data.get("unlock_at")),
+            start_at=parse_datetime(data.get("start_at")),
+            group_key=data.get("group_key"),
+            time_allocated_hours=data.get("time_allocated_hours"),
+            reclaim_synced=bool(data.get("reclaim_synced", False)),
+            extra=extra,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns the on-disk dict layout. Pipeline fields are only written once set."""
+        data = {
+            "name": self.name,
+            "html_url": self.html_url,
+            "course_name": self.course_name,
+            "due_at": format_datetime(self.due_at),
+            "unlock_at": format_datetime(self.unlock_at),
+        }
+        if self.start_at is not None:
+            data["start_at"] = format_datetime(self.start_at)
+        if self.group_key is not None:
+            data["group_key"] = self.group_key
+        if self.time_allocated_hours is not None:
+            data["time_allocated_hours"] = self.time_allocated_hours
+        if self.reclaim_synced:
+            data["reclaim_synced"] = True
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def date_str(self, field: str) -> Optional[str]:
+        """Returns one of the date fields formatted as on disk (for form input / display)."""
+        return format_datetime(getattr(self, field))
+
+
+def load_records(items) -> list:
+    """Converts a list of on-disk dicts into Assignment records."""
+    return [Assignment.from_dict(item) for item in items if isinstance(item, dict)]
+
+
+def dump_records(records) -> list:
+    """Converts Assignment records back into on-disk dicts."""
+    return [record.to_dict() for record in records]
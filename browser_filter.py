@@ -0,0 +1,193 @@
+"""
+Network filtering for the Reclaim browser automation.
+
+Only the planner's task form is needed, so images, fonts, media and
+third-party scripts (analytics, chat widgets, error reporting) are blocked
+before Chrome requests them, through the DevTools protocol
+(Network.setBlockedURLs). Requests to BROWSER_ALLOWED_DOMAINS are never
+blocked, so the Reclaim app and its login keep working: they are listed
+first as exceptions (block: false) and the first matching pattern wins.
+File types are matched on the end of the URL path (".png", not any URL
+containing ".png"). Chrome versions without pattern exceptions only get
+the domain blocking, so they never block the app's own files.
+
+Chrome's performance log is read back at the end of the session to report
+how many requests were made, how many bytes came in and how many requests
+were blocked (by resource type). Blocked responses are never downloaded, so
+their size isn't known; compare the bytes with a run with BROWSER_FILTER =
+False to see the full saving.
+
+config.py settings (all optional):
+    BROWSER_FILTER = True
+    BROWSER_BLOCK_RESOURCE_TYPES = ["image", "font", "media"]
+    BROWSER_BLOCKED_DOMAINS = [...]   # replaces DEFAULT_BLOCKED_DOMAINS
+    BROWSER_ALLOWED_DOMAINS = [...]   # replaces DEFAULT_ALLOWED_DOMAINS
+"""
+import json
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence
+from urllib.parse import urlparse
+
+try:
+    import config
+except ImportError:
+    config = None
+
+# File extensions per resource type (setBlockedURLs matches URLs, not types)
+RESOURCE_TYPE_EXTENSIONS: Dict[str, Sequence[str]] = {
+    "image": ("png", "jpg", "jpeg", "gif", "webp", "ico", "avif"),
+    "font": ("woff", "woff2", "ttf", "otf", "eot"),
+    "media": ("mp4", "webm", "mp3", "ogg", "wav"),
+}
+
+DEFAULT_BLOCKED_DOMAINS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "segment.com",
+    "segment.io",
+    "intercom.io",
+    "intercomcdn.com",
+    "hotjar.com",
+    "fullstory.com",
+    "heapanalytics.com",
+    "mixpanel.com",
+    "sentry.io",
+    "facebook.net",
+    "hs-scripts.com",
+    "hs-analytics.net",
+    "youtube.com",
+    "vimeo.com",
+)
+DEFAULT_ALLOWED_DOMAINS = ("reclaim.ai", "accounts.google.com")
+
+FILTER_ENABLED = getattr(config, "BROWSER_FILTER", True)
+BLOCK_RESOURCE_TYPES = list(getattr(config, "BROWSER_BLOCK_RESOURCE_TYPES", ["image", "font", "media"]))
+BLOCKED_DOMAINS = list(getattr(config, "BROWSER_BLOCKED_DOMAINS", DEFAULT_BLOCKED_DOMAINS))
+ALLOWED_DOMAINS = list(getattr(config, "BROWSER_ALLOWED_DOMAINS", DEFAULT_ALLOWED_DOMAINS))
+
+
+def domain_matches(host: str, domain: str) -> bool:
+    host, domain = host.lower(), domain.lower().lstrip(".")
+    return host == domain or host.endswith("." + domain)
+
+
+def _domain_patterns(domain: str) -> List[str]:
+    return [f"*://{domain}/*", f"*://*.{domain}/*"]
+
+
+def blocked_patterns(blocked_domains: Iterable[str] = None, allowed_domains: Iterable[str] = None) -> List[str]:
+    """Domain patterns to block. Blocked domains covered by the allow-list are skipped."""
+    blocked_domains = BLOCKED_DOMAINS if blocked_domains is None else blocked_domains
+    allowed_domains = list(ALLOWED_DOMAINS if allowed_domains is None else allowed_domains)
+    patterns = []
+    for domain in blocked_domains:
+        if any(domain_matches(domain, allowed) for allowed in allowed_domains):
+            continue
+        patterns.extend(_domain_patterns(domain))
+    return patterns
+
+
+def block_rules(resource_types: Iterable[str] = None, blocked_domains: Iterable[str] = None,
+                allowed_domains: Iterable[str] = None) -> List[Dict[str, object]]:
+    """
+    setBlockedURLs urlPatterns, first match wins: the allowed domains (never
+    blocked), the blocked domains, then file types by path extension, with
+    or without a query string.
+    """
+    resource_types = BLOCK_RESOURCE_TYPES if resource_types is None else resource_types
+    allowed_domains = list(ALLOWED_DOMAINS if allowed_domains is None else allowed_domains)
+
+    rules = [{"urlPattern": pattern, "block": False}
+             for domain in allowed_domains for pattern in _domain_patterns(domain)]
+    rules += [{"urlPattern": pattern, "block": True}
+              for pattern in blocked_patterns(blocked_domains, allowed_domains)]
+    for resource_type in resource_types:
+        for extension in RESOURCE_TYPE_EXTENSIONS.get(resource_type, ()):
+            rules += [{"urlPattern": f"*://*/*.{extension}", "block": True},
+                      {"urlPattern": f"*://*/*.{extension}?*", "block": True}]
+    return rules
+
+
+def prepare_options(chrome_options):
+    """Turns on Chrome's performance log, which the network report is read from."""
+    if FILTER_ENABLED:
+        chrome_options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
+
+def install(driver, rules: Optional[List[Dict[str, object]]] = None) -> int:
+    """Starts blocking on a running driver. Returns the number of patterns (0 when off)."""
+    if not FILTER_ENABLED:
+        return 0
+    rules = block_rules() if rules is None else rules
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+    except Exception as e:
+        # Not Chrome/Chromium (no DevTools protocol): run unfiltered
+        print(f"WARNING: Could not enable network filtering: {e}")
+        return 0
+    try:
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urlPatterns": rules})
+        return len(rules)
+    except Exception:
+        pass
+    # Older Chrome: plain wildcards have no exceptions, so file types would hit
+    # the app's own origin too; block the third-party domains only
+    patterns = [rule["urlPattern"] for rule in rules
+                if rule["block"] and not rule["urlPattern"].startswith("*://*/")]
+    try:
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+    except Exception as e:
+        print(f"WARNING: Could not enable network filtering: {e}")
+        return 0
+    print("Network filtering: this Chrome only supports domain blocking; images and fonts are not blocked.")
+    return len(patterns)
+
+
+@dataclass
+class NetworkStats:
+    requests: int = 0
+    bytes_received: int = 0
+    blocked: int = 0
+    blocked_by_type: Counter = field(default_factory=Counter)
+    blocked_hosts: Counter = field(default_factory=Counter)
+    _requests: Dict[str, tuple] = field(default_factory=dict, repr=False)
+
+    def add_entries(self, entries: Iterable[dict]):
+        """Counts the Network events of Chrome performance-log entries."""
+        for entry in entries:
+            try:
+                message = json.loads(entry["message"])["message"]
+            except (KeyError, TypeError, ValueError):
+                continue
+            method, params = message.get("method"), message.get("params", {})
+            if method == "Network.requestWillBeSent":
+                if params.get("requestId") not in self._requests:
+                    self.requests += 1
+                self._requests[params.get("requestId")] = (params.get("type", "Other"),
+                                                           params.get("request", {}).get("url", ""))
+            elif method == "Network.loadingFinished":
+                self.bytes_received += int(params.get("encodedDataLength") or 0)
+            elif method == "Network.loadingFailed" and params.get("blockedReason"):
+                resource_type, url = self._requests.get(params.get("requestId"), (params.get("type", "Other"), ""))
+                self.blocked += 1
+                self.blocked_by_type[resource_type] += 1
+                self.blocked_hosts[urlparse(url).netloc] += 1
+
+    def collect(self, driver):
+        """Drains the driver's performance log (call it now and then so the log stays small)."""
+        if not FILTER_ENABLED:
+            return
+        try:
+            self.add_entries(driver.get_log("performance"))
+        except Exception:
+            pass
+
+    def summary(self) -> str:
+        if not self.requests:
+            return "Network: no requests recorded."
+        types = ", ".join(f"{t.lower()} {n}" for t, n in self.blocked_by_type.most_common())
+        text = (f"Network: {self.requests} requests, {self.bytes_received / 1024:.0f} KB received; "
+                f"{self.blocked} blocked ({self.blocked / self.requests:.0%})")
+        return text + (f": {types}" if types else "")
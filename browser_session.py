@@ -0,0 +1,106 @@
+"""
+Hand-off of a pre-warmed Reclaim browser between processes.
+
+While the scraper and allocator run, the GUI starts
+`python reclaim_task_creator.py --prewarm`, which launches Chrome with a
+DevTools port, logs into Reclaim and exits, leaving Chrome open. The
+address of that Chrome is written to SESSION_FILE. The Reclaim stage then
+attaches to it instead of starting a new one (start_session), and closes
+it when done. If there turns out to be nothing to sync, or the sync stops
+early, discard() closes it.
+
+Closing goes through Chrome's DevTools HTTP endpoints (close every page, so
+the browser exits), with killing the browser process as the fallback, so
+it works without Selenium.
+"""
+import json
+import os
+import signal
+import socket
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, Optional
+
+SESSION_FILE = ".browser_session.json"
+HTTP_TIMEOUT = 2 # Seconds for each DevTools HTTP request
+CLOSE_WAIT = 5 # Seconds to wait for Chrome to exit after its pages are closed
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def save(address: str, browser_pid: Optional[int], state_dir: str = "."):
+    data = {"debugger_address": address, "browser_pid": browser_pid, "created": time.time()}
+    with open(os.path.join(state_dir, SESSION_FILE), "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def load(state_dir: str = ".") -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(state_dir, SESSION_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def clear(state_dir: str = "."):
+    try:
+        os.remove(os.path.join(state_dir, SESSION_FILE))
+    except FileNotFoundError:
+        pass
+
+
+def _devtools(address: str, path: str):
+    with urllib.request.urlopen(f"http://{address}{path}", timeout=HTTP_TIMEOUT) as response:
+        body = response.read()
+    try:
+        return json.loads(body)
+    except ValueError:
+        return body
+
+
+def is_alive(session: Optional[Dict[str, Any]]) -> bool:
+    """True if the pre-warmed Chrome still answers on its DevTools port."""
+    if not session:
+        return False
+    try:
+        _devtools(session["debugger_address"], "/json/version")
+        return True
+    except (OSError, urllib.error.URLError, KeyError):
+        return False
+
+
+def close(session: Optional[Dict[str, Any]]):
+    """Closes a pre-warmed Chrome: every page through DevTools, then the process if needed."""
+    if not session:
+        return
+    address = session.get("debugger_address")
+    try:
+        for target in _devtools(address, "/json/list"):
+            if target.get("type") == "page":
+                _devtools(address, f"/json/close/{target['id']}")
+    except (OSError, urllib.error.URLError, TypeError, KeyError):
+        pass
+
+    deadline = time.monotonic() + CLOSE_WAIT
+    while time.monotonic() < deadline and is_alive(session):
+        time.sleep(0.2)
+    pid = session.get("browser_pid")
+    if pid and is_alive(session):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+
+def discard(state_dir: str = "."):
+    """Closes the pre-warmed browser (if any) and forgets it."""
+    session = load(state_dir)
+    if session is None:
+        return
+    close(session)
+    clear(state_dir)
@@ -0,0 +1,226 @@
+"""
+Push-based Canvas ingest: a local receiver for assignment events.
+
+Instead of re-polling every course, Canvas (Live Events through a relay, or
+any webhook-style sender) POSTs assignment_created / assignment_updated
+events to
+    http://127.0.0.1:<CANVAS_EVENTS_PORT>/canvas/events
+`python pipeline.py --watch` runs the receiver and feeds each event into the
+same dedup -> allocate -> Reclaim path as a scrape, with a full poll every
+CANVAS_EVENTS_FULL_POLL_HOURS as a consistency check for missed events.
+
+Accepted bodies (one object or a list of them):
+    Live Events:  {"metadata": {"event_name": "assignment_created", ...},
+                   "body": {"assignment_id": "12", "title": "HW 3", "context_id": "4",
+                            "context_type": "Course", "due_at": "...", "unlock_at": "...",
+                            "workflow_state": "published"}}
+    Flat:         {"event_name": "assignment_updated",
+                   "assignment": {"id": 12, "name": "HW 3", "html_url": "...", "due_at": "...",
+                                  "course_id": 4, "course_name": "..."}}
+
+If CANVAS_EVENTS_SECRET is set in config.py, requests must carry it in the
+X-Sync-Secret header.
+
+Stand-in sender for testing (against the receiver started by --watch):
+    python canvas_events.py send --name "HW 9" --course-id 1 --due 2026-11-01T23:59:00Z
+"""
+import argparse
+import hmac
+import json
+import queue
+import threading
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import config
+except ImportError:
+    config = None
+
+EVENTS_PATH = "/canvas/events"
+SECRET_HEADER = "X-Sync-Secret"
+DEFAULT_PORT = 8780
+EVENTS_PORT = getattr(config, "CANVAS_EVENTS_PORT", DEFAULT_PORT)
+EVENTS_SECRET = getattr(config, "CANVAS_EVENTS_SECRET", "")
+# Hours between full polls while watching (a consistency check, not the main source)
+FULL_POLL_HOURS = getattr(config, "CANVAS_EVENTS_FULL_POLL_HOURS", 6)
+MAX_BODY_BYTES = 1_000_000
+
+CREATED = "assignment_created"
+UPDATED = "assignment_updated"
+ASSIGNMENT_EVENTS = (CREATED, UPDATED)
+
+
+def _course_id(value) -> Optional[str]:
+    # Live Events send global ids like "10000000000004"; links use the local id
+    if value in (None, ""):
+        return None
+    value = str(value)
+    return str(int(value) % 10_000_000_000_000) if value.isdigit() and len(value) > 13 else value
+
+
+def parse_event(payload: Dict[str, Any], canvas_url: str,
+                course_name: Callable[[str], str] = lambda course_id: f"Course {course_id}") -> Optional[Dict[str, Any]]:
+    """
+    Normalizes one event into the assignment dict the scraper produces (name,
+    html_url, due_at, unlock_at, course_name) plus "event_name". Returns None
+    for other events and for unpublished/deleted assignments.
+    """
+    if not isinstance(payload, dict):
+        return None
+    metadata = payload.get("metadata") or {}
+    event_name = metadata.get("event_name") or payload.get("event_name") or payload.get("event")
+    if event_name not in ASSIGNMENT_EVENTS:
+        return None
+
+    if "body" in payload:
+        body = payload.get("body") or {}
+        if body.get("workflow_state") not in (None, "published"):
+            return None
+        if body.get("context_type", "Course") != "Course":
+            return None
+        course_id = _course_id(body.get("context_id") or metadata.get("context_id"))
+        assignment_id = _course_id(body.get("assignment_id"))
+        name = body.get("title")
+        html_url = body.get("html_url")
+        name_of_course = None
+    else:
+        body = payload.get("assignment") or {}
+        course_id = _course_id(body.get("course_id"))
+        assignment_id = _course_id(body.get("id"))
+        name = body.get("name") or body.get("title")
+        html_url = body.get("html_url")
+        name_of_course = body.get("course_name")
+
+    if not html_url and course_id and assignment_id:
+        html_url = f"{canvas_url.rstrip('/')}/courses/{course_id}/assignments/{assignment_id}"
+    if not html_url or not name:
+        return None
+    if not name_of_course:
+        name_of_course = course_name(course_id) if course_id else "Unknown Course"
+    return {
+        "event_name": event_name,
+        "name": name,
+        "html_url": html_url,
+        "due_at": body.get("due_at"),
+        "unlock_at": body.get("unlock_at"),
+        "course_name": name_of_course,
+    }
+
+
+class EventReceiver:
+    """HTTP endpoint that queues incoming payloads (parsed by the consumer, off the request thread)."""
+
+    def __init__(self, port: int = EVENTS_PORT, secret: str = EVENTS_SECRET, host: str = "127.0.0.1"):
+        self.secret = secret
+        self.payloads: "queue.Queue" = queue.Queue()
+        self.received = 0
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.port = self.server.server_port
+        self._thread: Optional[threading.Thread] = None
+
+    def _make_handler(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def reply(self, status: int, data: Dict[str, Any]):
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                if self.path.split("?")[0] != EVENTS_PATH:
+                    return self.reply(404, {"error": "not found"})
+                if receiver.secret and not hmac.compare_digest(self.headers.get(SECRET_HEADER, ""), receiver.secret):
+                    return self.reply(401, {"error": "bad secret"})
+                length = int(self.headers.get("Content-Length") or 0)
+                if length > MAX_BODY_BYTES:
+                    return self.reply(413, {"error": "too large"})
+                try:
+                    data = json.loads(self.rfile.read(length) or b"null")
+                except ValueError:
+                    return self.reply(400, {"error": "invalid JSON"})
+                items = data if isinstance(data, list) else [data]
+                for item in items:
+                    receiver.payloads.put(item)
+                receiver.received += len(items)
+                self.reply(202, {"accepted": len(items)})
+
+        return Handler
+
+    def start(self) -> "EventReceiver":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        try:
+            return self.payloads.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+# --- stand-in sender ---
+def live_event(name: str, course_id, assignment_id, due_at: Optional[str], unlock_at: Optional[str] = None,
+               event_name: str = CREATED) -> Dict[str, Any]:
+    """Builds a Canvas Live Events style payload."""
+    return {
+        "metadata": {"event_name": event_name, "context_type": "Course", "context_id": str(course_id),
+                     "event_time": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")},
+        "body": {"assignment_id": str(assignment_id), "title": name, "context_id": str(course_id),
+                 "context_type": "Course", "due_at": due_at, "unlock_at": unlock_at,
+                 "workflow_state": "published"},
+    }
+
+
+def send_events(payloads: List[Dict[str, Any]], port: int = EVENTS_PORT, secret: str = EVENTS_SECRET,
+                host: str = "127.0.0.1") -> int:
+    """POSTs payloads to a receiver. Returns the number it accepted."""
+    request = urllib.request.Request(f"http://{host}:{port}{EVENTS_PATH}", data=json.dumps(payloads).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+    if secret:
+        request.add_header(SECRET_HEADER, secret)
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read()).get("accepted", 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a test assignment event to the local receiver.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    send = sub.add_parser("send", help="Send one assignment event")
+    send.add_argument("--name", required=True)
+    send.add_argument("--course-id", required=True)
+    send.add_argument("--assignment-id", default=None, help="Defaults to a time-based id")
+    send.add_argument("--due", default=None, help="ISO due date (default: a week from now)")
+    send.add_argument("--unlock", default=None)
+    send.add_argument("--update", action="store_true", help="Send assignment_updated instead of _created")
+    send.add_argument("--port", type=int, default=EVENTS_PORT)
+    args = parser.parse_args()
+
+    due = args.due or (datetime.now(timezone.utc) + timedelta(days=7)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    assignment_id = args.assignment_id or str(int(datetime.now().timestamp()))
+    payload = live_event(args.name, args.course_id, assignment_id, due, args.unlock,
+                         UPDATED if args.update else CREATED)
+    try:
+        accepted = send_events([payload], port=args.port)
+    except (urllib.error.URLError, OSError) as e:
+        print(f"ERROR: Could not reach the receiver on port {args.port} (is 'pipeline.py --watch' running?): {e}")
+        raise SystemExit(1)
+    print(f"Sent {payload['metadata']['event_name']} for '{args.name}' (accepted: {accepted}).")
+
+
+if __name__ == "__main__":
+    main()
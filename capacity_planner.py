@@ -0,0 +1,268 @@
+"""
+Capacity check between time allocation and the Reclaim stage.
+
+Every pending timed assignment (not yet past due) needs its allocated hours
+somewhere between the day it can be started (start_at, else unlock_at, else
+today) and the day it is due. Days are indexed from today, and the hours
+available on each day come from AVAILABLE_HOURS_PER_DAY in config.py: a
+number, or a list of 7 values for Monday..Sunday (default 4 hours a day).
+
+Three passes, all linear in tasks + days so a whole semester is cheap:
+  * load per day: each task's hours spread evenly over its window, summed
+    with a difference array, then compared with that day's availability
+  * deadline check: in due-date order, the hours due by each deadline
+    against the hours available from today until then
+  * earliest-deadline-first placement: each task's hours go into the
+    earliest days of its window that still have time left (a "next day with
+    time left" pointer skips full days). Whatever doesn't fit is a shortfall.
+
+By default this only reports. With --respread, unsynced tasks without a
+start date get start_at set to the first day the placement gives them, so
+Reclaim works through them in deadline order instead of all at once.
+
+Usage: python capacity_planner.py [--respread]
+"""
+import argparse
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import json_codec
+from assignment_record import Assignment, load_records, dump_records
+
+try:
+    import config
+except ImportError:
+    config = None
+
+TIMED_FILE = "timed_assignments.json"
+DEFAULT_HOURS_PER_DAY = 4.0
+# Available hours per weekday (Monday first), or a single number for every day
+AVAILABLE_HOURS_PER_DAY = getattr(config, "AVAILABLE_HOURS_PER_DAY", DEFAULT_HOURS_PER_DAY)
+EPSILON = 1e-9
+
+
+def weekly_availability(value=AVAILABLE_HOURS_PER_DAY) -> List[float]:
+    """Normalizes the config value into 7 daily hour budgets (Monday first)."""
+    if isinstance(value, (int, float)):
+        return [float(value)] * 7
+    hours = [float(h) for h in value]
+    if len(hours) != 7:
+        raise ValueError("AVAILABLE_HOURS_PER_DAY must be a number or a list of 7 numbers (Monday..Sunday).")
+    return hours
+
+
+def local_date(value: datetime) -> date:
+    # Naive values are treated as local time; aware ones are converted to it
+    return value.astimezone().date() if value.tzinfo is not None else value.date()
+
+
+@dataclass
+class TaskWindow:
+    task: Assignment
+    first: int # day index the task can start (0 = today)
+    last: int # day index it is due
+    hours: float
+
+
+@dataclass
+class CapacityReport:
+    today: date
+    capacity: List[float]
+    load: List[float]
+    # (first day index, last day index, hours over capacity) for consecutive overloaded days
+    overloaded_windows: List[Tuple[int, int, float]] = field(default_factory=list)
+    # (task, hours short) where all the work due by its deadline can't fit before it
+    deadline_shortfalls: List[Tuple[Assignment, float]] = field(default_factory=list)
+    # (task, hours that could not be placed) from the deadline-ordered placement
+    unplaced: List[Tuple[Assignment, float]] = field(default_factory=list)
+    # id(task) -> first day the placement uses, for tasks it starts later than their window
+    planned_start: Dict[int, int] = field(default_factory=dict)
+
+    def day(self, index: int) -> date:
+        return self.today + timedelta(days=index)
+
+    @property
+    def feasible(self) -> bool:
+        return not self.deadline_shortfalls and not self.unplaced
+
+
+def build_windows(tasks: Sequence[Assignment], today: date) -> List[TaskWindow]:
+    """Day windows of the pending tasks (those with hours and a due date not before today)."""
+    windows = []
+    for task in tasks:
+        if not task.time_allocated_hours or task.due_at is None:
+            continue
+        last = (local_date(task.due_at) - today).days
+        if last < 0:
+            continue
+        begin = task.start_at or task.unlock_at
+        first = max(0, (local_date(begin) - today).days) if begin is not None else 0
+        windows.append(TaskWindow(task, min(first, last), last, float(task.time_allocated_hours)))
+    return windows
+
+
+def build_capacity(num_days: int, today: date, weekly: List[float]) -> List[float]:
+    return [weekly[(today + timedelta(days=d)).weekday()] for d in range(num_days)]
+
+
+def spread_load(windows: List[TaskWindow], num_days: int) -> List[float]:
+    """Hours per day with each task spread evenly over its window (difference array)."""
+    diff = [0.0] * (num_days + 1)
+    for w in windows:
+        per_day = w.hours / (w.last - w.first + 1)
+        diff[w.first] += per_day
+        diff[w.last + 1] -= per_day
+    load, running = [], 0.0
+    for d in range(num_days):
+        running += diff[d]
+        load.append(running)
+    return load
+
+
+def overloaded_windows(load: List[float], capacity: List[float]) -> List[Tuple[int, int, float]]:
+    """Groups consecutive days whose load exceeds capacity."""
+    windows = []
+    start, excess = None, 0.0
+    for d, (used, available) in enumerate(zip(load, capacity)):
+        if used > available + EPSILON:
+            if start is None:
+                start, excess = d, 0.0
+            excess += used - available
+        elif start is not None:
+            windows.append((start, d - 1, excess))
+            start = None
+    if start is not None:
+        windows.append((start, len(load) - 1, excess))
+    return windows
+
+
+def deadline_shortfalls(windows: List[TaskWindow], capacity: List[float]) -> List[Tuple[Assignment, float]]:
+    """Tasks whose deadline comes before enough hours exist for everything due by then."""
+    prefix = [0.0]
+    for available in capacity:
+        prefix.append(prefix[-1] + available)
+    shortfalls, demand = [], 0.0
+    for w in sorted(windows, key=lambda w: w.last):
+        demand += w.hours
+        missing = demand - prefix[w.last + 1]
+        if missing > EPSILON:
+            shortfalls.append((w.task, missing))
+    return shortfalls
+
+
+def place_earliest_deadline_first(windows: List[TaskWindow], capacity: List[float]):
+    """
+    Fills each task's hours into the earliest days of its window with time
+    left, in due-date order. Returns (planned start day per task id, unplaced).
+    """
+    remaining = list(capacity)
+    # next_free[d] leads to the first day >= d with time left (path-compressed)
+    next_free = list(range(len(capacity) + 1))
+
+    def find(d: int) -> int:
+        root = d
+        while next_free[root] != root:
+            root = next_free[root]
+        while next_free[d] != root:
+            next_free[d], d = root, next_free[d]
+        return root
+
+    planned_start, unplaced = {}, []
+    for w in sorted(windows, key=lambda w: (w.last, w.first)):
+        needed, start = w.hours, None
+        d = find(w.first)
+        while needed > EPSILON and d <= w.last:
+            used = min(needed, remaining[d])
+            if used > 0:
+                start = d if start is None else start
+                remaining[d] -= used
+                needed -= used
+            if remaining[d] <= EPSILON:
+                next_free[d] = d + 1
+            d = find(d + 1)
+        if start is not None and start > w.first:
+            # Pushed back by work with earlier deadlines
+            planned_start[id(w.task)] = start
+        if needed > EPSILON:
+            unplaced.append((w.task, needed))
+    return planned_start, unplaced
+
+
+def plan_capacity(tasks: Sequence[Assignment], today: Optional[date] = None,
+                  weekly: Optional[List[float]] = None) -> CapacityReport:
+    today = today or date.today()
+    weekly = weekly if weekly is not None else weekly_availability()
+    windows = build_windows(tasks, today)
+    num_days = max((w.last for w in windows), default=-1) + 1
+
+    capacity = build_capacity(num_days, today, weekly)
+    load = spread_load(windows, num_days)
+    report = CapacityReport(today, capacity, load)
+    report.overloaded_windows = overloaded_windows(load, capacity)
+    report.deadline_shortfalls = deadline_shortfalls(windows, capacity)
+    report.planned_start, report.unplaced = place_earliest_deadline_first(windows, capacity)
+    return report
+
+
+def respread(tasks: Sequence[Assignment], report: CapacityReport) -> int:
+    """Sets start_at on unsynced tasks without one to their planned first day. Returns the count."""
+    changed = 0
+    for task in tasks:
+        start_day = report.planned_start.get(id(task))
+        if task.reclaim_synced or task.start_at is not None or not start_day:
+            continue
+        start = datetime.combine(report.day(start_day), time.min).astimezone()
+        if task.due_at is not None and start >= task.due_at.astimezone():
+            continue
+        task.start_at = start
+        changed += 1
+    return changed
+
+
+def print_report(report: CapacityReport):
+    total_load = sum(report.load)
+    total_capacity = sum(report.capacity)
+    print(f"Pending work: {total_load:.1f}h over {len(report.capacity)} days "
+          f"({total_capacity:.1f}h available)")
+
+    for first, last, excess in report.overloaded_windows:
+        span = report.day(first).isoformat() if first == last else f"{report.day(first)} to {report.day(last)}"
+        print(f"OVERLOADED: {span} needs {excess:.1f}h more than available if work is spread evenly")
+
+    for task, missing in report.deadline_shortfalls:
+        print(f"WARNING: Not enough time before '{task.name}' is due ({task.date_str('due_at')}): "
+              f"{missing:.1f}h short for everything due by then")
+
+    for task, missing in report.unplaced:
+        print(f"WARNING: '{task.name}' can't be fully scheduled in its window: {missing:.1f}h left over")
+
+    if report.feasible:
+        print("Capacity check passed: all pending work fits before its due dates.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check pending assignment hours against available time.")
+    parser.add_argument("--respread", action="store_true",
+                        help="Set start dates on unsynced tasks so they are worked on in deadline order")
+    args = parser.parse_args()
+
+    print("--- Capacity Planner Running ---")
+    try:
+        tasks = load_records(json_codec.load_file(TIMED_FILE))
+    except (FileNotFoundError, json_codec.JSONDecodeError):
+        print(f"{TIMED_FILE} not found or unreadable. Nothing to check.")
+        return
+
+    report = plan_capacity(tasks)
+    print_report(report)
+
+    if args.respread:
+        changed = respread(tasks, report)
+        if changed:
+            json_codec.save_file(TIMED_FILE, dump_records(tasks))
+        print(f"Re-spread: start dates set on {changed} task(s).")
+
+
+if __name__ == "__main__":
+    main()
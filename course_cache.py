@@ -0,0 +1,166 @@
+"""
+Persistent cache for Canvas course metadata (course list, names, terms).
+
+Enrollments change a few times a semester, so the course list doesn't need
+to be fetched on every scrape. Entries are kept in CACHE_FILE, keyed by
+Canvas URL and a hash of the token (so accounts sharing a folder don't mix):
+  * younger than COURSE_CACHE_TTL_HOURS: used as is, no request
+  * older, but within COURSE_CACHE_STALE_HOURS more: used right away, and
+    refreshed in the background for the next run (stale-while-revalidate)
+  * older than that, or missing: fetched before continuing
+
+invalidate() drops entries, e.g. when a course's assignments come back 401,
+403 or 404 (dropped course), or with `python course_cache.py --clear`.
+"""
+import argparse
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import json_codec
+
+try:
+    import config
+except ImportError:
+    config = None
+
+CACHE_FILE = "canvas_course_cache.json"
+TTL_HOURS = getattr(config, "COURSE_CACHE_TTL_HOURS", 24)
+STALE_HOURS = getattr(config, "COURSE_CACHE_STALE_HOURS", 7 * 24)
+
+# Results of get()
+FRESH = "fresh"
+STALE = "stale"
+FETCHED = "fetched"
+
+
+def cache_key(canvas_url: str, token: str, name: str) -> str:
+    account = hashlib.sha256((token or "").encode("utf-8")).hexdigest()[:12]
+    return f"{canvas_url.rstrip('/')}|{account}|{name}"
+
+
+class CourseCache:
+    def __init__(self, path: str = CACHE_FILE, ttl_hours: float = TTL_HOURS, stale_hours: float = STALE_HOURS):
+        self.path = path
+        self.ttl = ttl_hours * 3600
+        self.stale = stale_hours * 3600
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._refreshing = set()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            try:
+                entries = json_codec.load_file(self.path)
+                self._entries = entries if isinstance(entries, dict) else {}
+            except (FileNotFoundError, json_codec.JSONDecodeError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        try:
+            json_codec.save_file(self.path, self._entries)
+        except OSError as e:
+            print(f"Warning: Could not save {self.path}: {e}")
+
+    def put(self, key: str, value: Any):
+        with self._lock:
+            self._load()[key] = {"value": value, "fetched_at": time.time()}
+            self._save()
+
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return dict(self._load())
+
+    def peek(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._load().get(key)
+
+    def invalidate(self, key: Optional[str] = None, prefix: Optional[str] = None):
+        """Drops one entry, every entry starting with `prefix`, or (with neither) everything."""
+        with self._lock:
+            entries = self._load()
+            if key is None and prefix is None:
+                entries.clear()
+            else:
+                for k in [k for k in entries if k == key or (prefix is not None and k.startswith(prefix))]:
+                    del entries[k]
+            self._save()
+
+    def get(self, key: str, loader: Callable[[], Any]):
+        """
+        Returns (value, FRESH | STALE | FETCHED). `loader` fetches the value and
+        should raise on failure; a stale value is returned if it fails.
+        """
+        entry = self.peek(key)
+        age = time.time() - entry["fetched_at"] if entry else None
+        if entry is not None and age < self.ttl:
+            return entry["value"], FRESH
+        if entry is not None and age < self.ttl + self.stale:
+            self._refresh_in_background(key, loader)
+            return entry["value"], STALE
+        try:
+            value = loader()
+        except Exception:
+            if entry is not None:
+                # Too old, but better than nothing while Canvas is unreachable
+                return entry["value"], STALE
+            raise
+        self.put(key, value)
+        return value, FETCHED
+
+    def _refresh_in_background(self, key: str, loader: Callable[[], Any]):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.put(key, loader())
+            except Exception:
+                pass # Keep the stale entry; the next run tries again
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        # Not a daemon, so a script finishing first still lets the refresh be saved
+        threading.Thread(target=refresh).start()
+
+
+_shared: Dict[str, CourseCache] = {}
+_shared_lock = threading.Lock()
+
+
+def shared(path: str = CACHE_FILE) -> CourseCache:
+    """One cache object per file in this process (so concurrent accounts share the lock)."""
+    path = os.path.abspath(path)
+    with _shared_lock:
+        if path not in _shared:
+            _shared[path] = CourseCache(path)
+        return _shared[path]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the Canvas course cache.")
+    parser.add_argument("--clear", action="store_true", help="Forget all cached course data")
+    args = parser.parse_args()
+
+    cache = shared()
+    if args.clear:
+        cache.invalidate()
+        print(f"Cleared {CACHE_FILE}.")
+        return
+    entries = cache.entries()
+    if not entries:
+        print("Course cache is empty.")
+    for key, entry in entries.items():
+        age_hours = (time.time() - entry["fetched_at"]) / 3600
+        size = len(entry["value"]) if isinstance(entry["value"], (list, dict)) else 1
+        print(f"{key.rsplit('|', 1)[-1]:<20} {size:>4} item(s), {age_hours:.1f}h old")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Local stand-in for the Canvas API, for trying the scraper without a real account.
+
+Serves a generated set of courses and assignments (with realistically large
+`description` blobs) on the endpoints the scraper uses:
+    GET  /api/v1/courses
+    GET  /api/v1/courses/<id>
+    GET  /api/v1/courses/<id>/assignments
+    GET  /api/v1/planner/items        (paginated with a Link header)
+    POST /api/graphql
+    GET  /__stats                     (requests and bytes served so far)
+
+Usage: python fake_canvas.py [--port 8765] [--courses 8] [--assignments 40]
+then set CANVAS_URL = "http://127.0.0.1:8765" (any token works).
+"""
+import argparse
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+DESCRIPTION_SIZE = 4000 # bytes of filler HTML per assignment, like a real Canvas description
+GRAPHQL_PAGE_SIZE = 25 # Smaller than a real server's, so paging gets exercised
+
+
+def build_dataset(num_courses: int = 8, per_course: int = 40):
+    """Returns (courses, assignments_by_course_id) with due dates spread around now."""
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    courses = []
+    assignments = {}
+    kinds = ["HW", "Lab", "Reading", "Quiz", "Project"]
+    for c in range(1, num_courses + 1):
+        courses.append({
+            "id": c,
+            "name": f"Course {c}",
+            "course_code": f"C{c}",
+            "workflow_state": "available",
+            "syllabus_body": "<p>" + "x" * DESCRIPTION_SIZE + "</p>",
+        })
+        items = []
+        for a in range(1, per_course + 1):
+            # Half in the past, half upcoming
+            due = now + timedelta(days=a - per_course // 2)
+            items.append({
+                "id": c * 1000 + a,
+                "name": f"{kinds[a % len(kinds)]} {a}",
+                "html_url": f"/courses/{c}/assignments/{c * 1000 + a}",
+                "due_at": due.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "unlock_at": (due - timedelta(days=7)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "points_possible": 10,
+                "description": "<p>" + "lorem ipsum " * (DESCRIPTION_SIZE // 12) + "</p>",
+                "submitted": a % 7 == 0,
+            })
+        assignments[c] = items
+    return courses, assignments
+
+
+class FakeCanvas:
+    """Dataset plus request/byte counters, shared by the handler threads."""
+
+    def __init__(self, num_courses: int = 8, per_course: int = 40):
+        self.courses, self.assignments = build_dataset(num_courses, per_course)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+
+    def count(self, size: int):
+        with self.lock:
+            self.requests += 1
+            self.bytes_sent += size
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests = 0
+            self.bytes_sent = 0
+
+
+def make_handler(fake: FakeCanvas, base_url: str):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, data, status=200, headers=None, counted=True):
+            body = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            if counted:
+                fake.count(len(body))
+            self.wfile.write(body)
+
+        def absolute(self, assignment):
+            item = dict(assignment)
+            item["html_url"] = base_url + item["html_url"]
+            item.pop("submitted", None)
+            return item
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            query = parse_qs(parsed.query)
+            parts = parsed.path.strip("/").split("/")
+
+            if parsed.path == "/__stats":
+                return self.send_json({"requests": fake.requests, "bytes": fake.bytes_sent}, counted=False)
+            if parsed.path == "/api/v1/courses":
+                return self.send_json(fake.courses)
+            if len(parts) == 4 and parts[:3] == ["api", "v1", "courses"] and parts[3].isdigit():
+                course = next((c for c in fake.courses if c["id"] == int(parts[3])), None)
+                if course is not None:
+                    return self.send_json(course)
+            if len(parts) == 5 and parts[:3] == ["api", "v1", "courses"] and parts[4] == "assignments":
+                items = fake.assignments.get(int(parts[3]), [])
+                if query.get("bucket") == ["unsubmitted"]:
+                    items = [a for a in items if not a["submitted"]]
+                return self.send_json([self.absolute(a) for a in items])
+            if parsed.path == "/api/v1/planner/items":
+                return self.planner_items(query)
+            self.send_json({"errors": [{"message": "not found"}]}, status=404)
+
+        def planner_items(self, query):
+            start = query.get("start_date", [""])[0]
+            per_page = int(query.get("per_page", ["10"])[0])
+            page = int(query.get("page", ["1"])[0])
+            items = []
+            for course in fake.courses:
+                for a in fake.assignments[course["id"]]:
+                    if a["due_at"] < start:
+                        continue
+                    items.append({
+                        "context_name": course["name"],
+                        "plannable_type": "assignment",
+                        "plannable_date": a["due_at"],
+                        "html_url": a["html_url"],
+                        "submissions": {"submitted": a["submitted"]},
+                        "plannable": {"id": a["id"], "title": a["name"], "due_at": a["due_at"],
+                                      "unlock_at": a["unlock_at"], "points_possible": a["points_possible"]},
+                    })
+            items.sort(key=lambda i: i["plannable_date"])
+            chunk = items[(page - 1) * per_page: page * per_page]
+            headers = {}
+            if page * per_page < len(items):
+                next_url = f"{base_url}/api/v1/planner/items?start_date={start}&per_page={per_page}&page={page + 1}"
+                headers["Link"] = f'<{next_url}>; rel="next"'
+            self.send_json(chunk, headers=headers)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if urlparse(self.path).path != "/api/graphql":
+                return self.send_json({"errors": [{"message": "not found"}]}, status=404)
+            if "allCourses" in body.get("query", ""):
+                courses = [{"_id": str(course["id"]), "name": course["name"], "state": "available",
+                            "term": {"endAt": None}} for course in fake.courses]
+                return self.send_json({"data": {"allCourses": courses}})
+
+            # Aliased course(id: $cN) fields, each paged by the cursor in $aN
+            variables = body.get("variables") or {}
+            data = {}
+            for key, course_id in variables.items():
+                if not key.startswith("c"):
+                    continue
+                start = int(variables.get("a" + key[1:]) or 0)
+                items = fake.assignments.get(int(course_id), [])
+                page = items[start:start + GRAPHQL_PAGE_SIZE]
+                data[key] = {"assignmentsConnection": {
+                    "nodes": [{"name": a["name"], "htmlUrl": base_url + a["html_url"],
+                               "dueAt": a["due_at"], "unlockAt": a["unlock_at"],
+                               "submissionsConnection": {"nodes": [
+                                   {"submittedAt": a["due_at"] if a["submitted"] else None}]}} for a in page],
+                    "pageInfo": {"hasNextPage": start + GRAPHQL_PAGE_SIZE < len(items),
+                                 "endCursor": str(start + GRAPHQL_PAGE_SIZE)},
+                }}
+            self.send_json({"data": data})
+
+    return Handler
+
+
+def make_server(port: int = 8765, num_courses: int = 8, per_course: int = 40, fake: FakeCanvas = None):
+    """Creates (but doesn't start) the fake server. Returns (server, fake)."""
+    fake = fake or FakeCanvas(num_courses, per_course)
+    base_url = f"http://127.0.0.1:{port}"
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(fake, base_url))
+    return server, fake
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local fake Canvas API.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--courses", type=int, default=8)
+    parser.add_argument("--assignments", type=int, default=40, help="Assignments per course")
+    args = parser.parse_args()
+
+    server, _ = make_server(args.port, args.courses, args.assignments)
+    print(f"Fake Canvas running on http://127.0.0.1:{args.port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,475 @@
+"""
+Durable job queue for syncing large fleets of accounts.
+
+multi_account.py syncs a roster in one process. For rosters too large for
+that, each account's sync is split into jobs (scrape -> allocate -> sync) in
+a durable queue, and any number of worker processes on the same machine take
+them from it:
+
+    python job_queue.py enqueue [accounts.json]     # e.g. from cron, every 30 minutes
+    python job_queue.py worker [--threads N]        # as many as needed
+    python job_queue.py status
+
+A worker leases one job at a time for LEASE_SECONDS and renews the lease
+(heartbeat) while the job runs, so the job of a crashed worker goes back to
+the queue when its lease runs out. A failing job is retried up to
+MAX_ATTEMPTS times with exponential backoff; after that it is marked failed
+and the rest of that account's run is cancelled. Jobs of one account always
+run in order, one at a time: a job is only leased once every earlier job of
+its account has finished. Interactive accounts (see multi_account.py) are
+leased ahead of bulk ones.
+
+The queue is reached through a Broker, picked by URL (JOB_QUEUE in config.py,
+or --queue): "sqlite://jobs.db" or just a file path uses SqliteBroker, the
+only broker included. It is safe across processes on ONE machine only: it
+runs SQLite in WAL mode, which needs shared memory and doesn't work on a
+network file system. Workers on several machines are NOT supported. Adding
+that would take a Broker on a database server (registered in BROKERS) and
+the accounts/ folder (the state files) on storage every machine shares.
+
+Runs whose jobs have all finished are deleted JOB_RETENTION_DAYS after
+their last change, when the next runs are queued.
+
+The queue stores each account's roster entry, credentials included, so
+protect it like accounts.json.
+"""
+import abc
+import argparse
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import Canvas_scrape_assignments as scraper
+import json_codec
+import multi_account
+import sync_queue
+import time_allocator
+from assignment_record import load_records
+from rate_limit import RateLimitedHttp, RequestScheduler
+
+try:
+    import config
+except ImportError:
+    config = None
+
+QUEUE_URL = getattr(config, "JOB_QUEUE", "sqlite://jobs.db")
+LEASE_SECONDS = getattr(config, "JOB_LEASE_SECONDS", 300)
+MAX_ATTEMPTS = getattr(config, "JOB_MAX_ATTEMPTS", 3)
+RETENTION_DAYS = getattr(config, "JOB_RETENTION_DAYS", 7)
+RETRY_DELAY_SECONDS = 30 # Doubled after every failed attempt
+POLL_SECONDS = 2.0 # Idle workers check for new jobs this often
+
+STAGES = ("scrape", "allocate", "sync")
+
+# Job states
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed" # Out of attempts
+CANCELLED = "cancelled" # An earlier job of the run failed
+SKIPPED = "skipped" # Nothing left to do (e.g. no new assignments)
+UNFINISHED = (QUEUED, LEASED)
+FINISHED = (DONE, FAILED, CANCELLED, SKIPPED)
+
+
+@dataclass
+class Job:
+    id: int
+    run_id: str
+    account_id: str
+    stage: str
+    payload: Dict[str, Any]
+    attempts: int
+    max_attempts: int
+
+
+class Broker(abc.ABC):
+    """Where jobs live. Subclasses implement these; see SqliteBroker."""
+
+    @abc.abstractmethod
+    def enqueue_run(self, account_id: str, stages: List[str], payload: Dict[str, Any], priority: int,
+                    max_attempts: int = MAX_ATTEMPTS) -> Optional[str]:
+        """Queues one job per stage, in order. Returns the run id, or None if the account has unfinished jobs."""
+
+    @abc.abstractmethod
+    def lease(self, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> Optional[Job]:
+        """The next job that may run now, leased to worker_id, or None."""
+
+    @abc.abstractmethod
+    def heartbeat(self, job: Job, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> bool:
+        """Extends the lease. False if the worker no longer holds it."""
+
+    @abc.abstractmethod
+    def complete(self, job: Job, worker_id: str, result: Dict[str, Any], skip_rest: bool = False) -> bool:
+        """Marks the job done (and with skip_rest, the rest of its run skipped)."""
+
+    @abc.abstractmethod
+    def fail(self, job: Job, worker_id: str, error: str) -> bool:
+        """Schedules a retry, or marks the job failed and cancels the rest of its run."""
+
+    @abc.abstractmethod
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """stage -> state -> number of jobs."""
+
+    @abc.abstractmethod
+    def failures(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """The most recent failed jobs with their last error."""
+
+    @abc.abstractmethod
+    def purge(self, before: float) -> int:
+        """Deletes runs whose jobs have all finished, last changed before `before`. Returns the jobs deleted."""
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_after REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    last_error TEXT,
+    result TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_account ON jobs (account_id, state, id);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, priority, id);
+"""
+
+
+class SqliteBroker(Broker):
+    """
+    Broker on a SQLite database; every change is one IMMEDIATE transaction.
+    Single host only (WAL mode): don't put the database on a network share.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._db().executescript(SCHEMA)
+
+    def _db(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # IMMEDIATE takes the write lock up front, so two workers can't lease the same job
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def enqueue_run(self, account_id, stages, payload, priority, max_attempts=MAX_ATTEMPTS):
+        now = time.time()
+        with self._transaction() as db:
+            busy = db.execute("SELECT 1 FROM jobs WHERE account_id = ? AND state IN (?, ?) LIMIT 1",
+                              (account_id, *UNFINISHED)).fetchone()
+            if busy:
+                return None
+            run_id = uuid.uuid4().hex
+            data = json_codec.dumps(payload, indent=None)
+            db.executemany(
+                "INSERT INTO jobs (run_id, account_id, stage, payload, priority, state, max_attempts, run_after,"
+                " created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, account_id, stage, data, priority, QUEUED, max_attempts, now, now, now) for stage in stages])
+        return run_id
+
+    def _expire_leases(self, db: sqlite3.Connection, now: float):
+        expired = db.execute("SELECT id, run_id, attempts, max_attempts FROM jobs WHERE state = ? AND lease_expires < ?",
+                             (LEASED, now)).fetchall()
+        for row in expired:
+            self._retry_or_fail(db, row, "lease expired (worker stopped?)", now)
+
+    def _retry_or_fail(self, db: sqlite3.Connection, row, error: str, now: float):
+        if row["attempts"] < row["max_attempts"]:
+            delay = RETRY_DELAY_SECONDS * 2 ** (row["attempts"] - 1)
+            db.execute("UPDATE jobs SET state = ?, lease_owner = NULL, lease_expires = NULL, last_error = ?,"
+                       " run_after = ?, updated_at = ? WHERE id = ?", (QUEUED, error, now + delay, now, row["id"]))
+            return
+        db.execute("UPDATE jobs SET state = ?, lease_owner = NULL, lease_expires = NULL, last_error = ?,"
+                   " updated_at = ? WHERE id = ?", (FAILED, error, now, row["id"]))
+        db.execute("UPDATE jobs SET state = ?, updated_at = ? WHERE run_id = ? AND id > ? AND state = ?",
+                   (CANCELLED, now, row["run_id"], row["id"], QUEUED))
+
+    def lease(self, worker_id, lease_seconds=LEASE_SECONDS):
+        now = time.time()
+        with self._transaction() as db:
+            self._expire_leases(db, now)
+            # The oldest job of each account is the only one that may run
+            row = db.execute(
+                "SELECT * FROM jobs AS j WHERE j.state = ? AND j.run_after <= ?"
+                " AND NOT EXISTS (SELECT 1 FROM jobs AS e WHERE e.account_id = j.account_id AND e.id < j.id"
+                " AND e.state IN (?, ?)) ORDER BY j.priority, j.id LIMIT 1",
+                (QUEUED, now, *UNFINISHED)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE jobs SET state = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + 1,"
+                       " updated_at = ? WHERE id = ?", (LEASED, worker_id, now + lease_seconds, now, row["id"]))
+        return Job(row["id"], row["run_id"], row["account_id"], row["stage"], json_codec.loads(row["payload"]),
+                   row["attempts"] + 1, row["max_attempts"])
+
+    def _owned(self, db: sqlite3.Connection, job: Job, worker_id: str):
+        return db.execute("SELECT * FROM jobs WHERE id = ? AND state = ? AND lease_owner = ?",
+                          (job.id, LEASED, worker_id)).fetchone()
+
+    def heartbeat(self, job, worker_id, lease_seconds=LEASE_SECONDS):
+        now = time.time()
+        with self._transaction() as db:
+            updated = db.execute("UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND state = ?"
+                                 " AND lease_owner = ?", (now + lease_seconds, now, job.id, LEASED, worker_id))
+            return updated.rowcount == 1
+
+    def complete(self, job, worker_id, result, skip_rest=False):
+        now = time.time()
+        with self._transaction() as db:
+            if self._owned(db, job, worker_id) is None:
+                return False
+            db.execute("UPDATE jobs SET state = ?, lease_owner = NULL, lease_expires = NULL, result = ?,"
+                       " updated_at = ? WHERE id = ?", (DONE, json_codec.dumps(result, indent=None), now, job.id))
+            if skip_rest:
+                db.execute("UPDATE jobs SET state = ?, updated_at = ? WHERE run_id = ? AND id > ? AND state = ?",
+                           (SKIPPED, now, job.run_id, job.id, QUEUED))
+        return True
+
+    def fail(self, job, worker_id, error):
+        now = time.time()
+        with self._transaction() as db:
+            row = self._owned(db, job, worker_id)
+            if row is None:
+                return False
+            self._retry_or_fail(db, row, error, now)
+        return True
+
+    def counts(self):
+        result: Dict[str, Dict[str, int]] = {}
+        for row in self._db().execute("SELECT stage, state, COUNT(*) AS n FROM jobs GROUP BY stage, state"):
+            result.setdefault(row["stage"], {})[row["state"]] = row["n"]
+        return result
+
+    def failures(self, limit=20):
+        rows = self._db().execute("SELECT id, account_id, stage, attempts, last_error, updated_at FROM jobs"
+                                  " WHERE state = ? ORDER BY updated_at DESC LIMIT ?", (FAILED, limit))
+        return [dict(row) for row in rows]
+
+    def purge(self, before):
+        with self._transaction() as db:
+            deleted = db.execute(
+                "DELETE FROM jobs WHERE run_id IN (SELECT run_id FROM jobs GROUP BY run_id"
+                " HAVING MAX(updated_at) < ? AND SUM(state NOT IN (?, ?, ?, ?)) = 0)", (before, *FINISHED))
+            return deleted.rowcount
+
+
+# scheme -> Broker class taking the rest of the URL
+BROKERS: Dict[str, Callable[[str], Broker]] = {
+    "sqlite": SqliteBroker,
+}
+
+
+def open_broker(url: str = QUEUE_URL) -> Broker:
+    """"sqlite://jobs.db" (or a bare path) -> SqliteBroker("jobs.db")."""
+    scheme, _, location = url.partition("://") if "://" in url else ("sqlite", "", url)
+    if scheme not in BROKERS:
+        raise ValueError(f"Unknown job queue '{scheme}'. Available: {', '.join(BROKERS)}")
+    return BROKERS[scheme](location)
+
+
+def enqueue_roster(broker: Broker, roster: List[Dict[str, Any]], skip_reclaim: bool = False) -> int:
+    """Queues a run for every account that has none pending. Returns the number queued."""
+    purged = broker.purge(time.time() - RETENTION_DAYS * 86400)
+    if purged:
+        print(f"Deleted {purged} finished job(s) older than {RETENTION_DAYS} days.")
+    stages = [s for s in STAGES if not (skip_reclaim and s == "sync")]
+    queued = 0
+    for account in roster:
+        run_id = broker.enqueue_run(str(account["id"]), stages, {"account": account},
+                                    multi_account.account_priority(account))
+        if run_id is None:
+            print(f"{account['id']}: previous run still pending, not queued again.")
+        else:
+            queued += 1
+    return queued
+
+
+# --- stage handlers: (job, scheduler) -> result; a result with "skip_rest" ends the run early ---
+def _account_state(job: Job) -> str:
+    state_dir = multi_account.account_dir(job.payload["account"])
+    multi_account.write_account_config(job.payload["account"], state_dir)
+    return state_dir
+
+
+def scrape_stage(job: Job, limiter: RequestScheduler) -> Dict[str, Any]:
+    account = job.payload["account"]
+    state_dir = _account_state(job)
+    http = RateLimitedHttp(limiter, priority=multi_account.account_priority(account))
+    new_assignments = scraper.main(state_dir, account["canvas_url"], account["canvas_token"], http,
+                                   account.get("ingest_strategy"))
+    # Tasks an earlier run didn't get into Reclaim (budget, failure) still need the sync job
+    timed = load_records(time_allocator.load_json(os.path.join(state_dir, time_allocator.TIMED_FILE)))
+    unsynced = len(sync_queue.unsynced(timed))
+    # Nothing new or left over: the allocate and sync jobs would have nothing to do
+    return {"new": len(new_assignments), "unsynced": unsynced, "skip_rest": not new_assignments and not unsynced}
+
+
+def allocate_stage(job: Job, limiter: RequestScheduler) -> Dict[str, Any]:
+    allocated = time_allocator.allocate_time(_account_state(job), time_allocator.get_default_time)
+    return {"allocated": allocated or 0}
+
+
+def sync_stage(job: Job, limiter: RequestScheduler) -> Dict[str, Any]:
+    state_dir = _account_state(job)
+    with limiter.slot(multi_account.RECLAIM_HOST, multi_account.account_priority(job.payload["account"])):
+        completed = multi_account.run_reclaim_stage(state_dir)
+    with open(os.path.join(state_dir, "reclaim_log.txt"), "w", encoding="utf-8") as f:
+        f.write(completed.stdout)
+        f.write(completed.stderr)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Reclaim stage exited with {completed.returncode} (see reclaim_log.txt)")
+    return {"reclaim": "ok"}
+
+
+STAGE_HANDLERS: Dict[str, Callable[[Job, RequestScheduler], Dict[str, Any]]] = {
+    "scrape": scrape_stage,
+    "allocate": allocate_stage,
+    "sync": sync_stage,
+}
+
+
+class Worker:
+    """Leases and runs jobs until stopped (or, with drain, until none are ready)."""
+
+    def __init__(self, broker: Broker, worker_id: Optional[str] = None, limiter: Optional[RequestScheduler] = None,
+                 lease_seconds: float = LEASE_SECONDS, handlers=None):
+        self.broker = broker
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.limiter = limiter or multi_account.make_scheduler()
+        self.lease_seconds = lease_seconds
+        self.handlers = handlers or STAGE_HANDLERS
+        self.stop = threading.Event()
+        self.processed = 0
+
+    def _heartbeat(self, job: Job, done: threading.Event):
+        while not done.wait(self.lease_seconds / 3):
+            if not self.broker.heartbeat(job, self.worker_id, self.lease_seconds):
+                print(f"[{self.worker_id}] WARNING: Lost the lease on job {job.id}; its result will be discarded.")
+                return
+
+    def run_one(self) -> bool:
+        """Runs one job. False if none was ready."""
+        job = self.broker.lease(self.worker_id, self.lease_seconds)
+        if job is None:
+            return False
+        label = f"[{self.worker_id}] {job.account_id} {job.stage} (job {job.id}, attempt {job.attempts}/{job.max_attempts})"
+        print(f"{label} started")
+        done = threading.Event()
+        beat = threading.Thread(target=self._heartbeat, args=(job, done), daemon=True)
+        beat.start()
+        try:
+            handler = self.handlers.get(job.stage)
+            if handler is None:
+                raise ValueError(f"Unknown stage '{job.stage}'")
+            result = handler(job, self.limiter)
+        except Exception as e:
+            done.set()
+            self.broker.fail(job, self.worker_id, f"{type(e).__name__}: {e}")
+            print(f"{label} FAILED: {e}")
+        else:
+            done.set()
+            skip_rest = bool(result.pop("skip_rest", False))
+            self.broker.complete(job, self.worker_id, result, skip_rest)
+            print(f"{label} done: {result}")
+        beat.join()
+        self.processed += 1
+        return True
+
+    def run(self, drain: bool = False):
+        while not self.stop.is_set():
+            if not self.run_one():
+                if drain:
+                    return
+                self.stop.wait(POLL_SECONDS)
+
+
+def run_workers(broker: Broker, threads: int = 1, drain: bool = False) -> int:
+    """Runs `threads` workers sharing one request scheduler. Returns the number of jobs processed."""
+    limiter = multi_account.make_scheduler()
+    base_id = f"{socket.gethostname()}:{os.getpid()}"
+    workers = [Worker(broker, f"{base_id}:{i}" if threads > 1 else base_id, limiter) for i in range(threads)]
+    pool = [threading.Thread(target=w.run, args=(drain,)) for w in workers]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        while thread.is_alive():
+            try:
+                thread.join(0.5)
+            except KeyboardInterrupt:
+                print("\nStopping: finishing the running jobs...")
+                for worker in workers:
+                    worker.stop.set()
+    return sum(w.processed for w in workers)
+
+
+def print_status(broker: Broker):
+    counts = broker.counts()
+    states = (QUEUED, LEASED, DONE, SKIPPED, FAILED, CANCELLED)
+    print(f"{'stage':<10}" + "".join(f"{state:>10}" for state in states))
+    for stage in STAGES:
+        print(f"{stage:<10}" + "".join(f"{counts.get(stage, {}).get(state, 0):>10}" for state in states))
+    failures = broker.failures()
+    if failures:
+        print("\nFailed jobs:")
+    for job in failures:
+        print(f" {job['account_id']} {job['stage']} (job {job['id']}, {job['attempts']} attempts): {job['last_error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Queue account syncs as jobs and run workers for them.")
+    parser.add_argument("--queue", default=QUEUE_URL, help=f"Job queue URL (default: {QUEUE_URL})")
+    sub = parser.add_subparsers(dest="command", required=True)
+    enqueue = sub.add_parser("enqueue", help="Queue a sync run for every account in the roster")
+    enqueue.add_argument("roster", nargs="?", default=multi_account.ROSTER_FILE)
+    enqueue.add_argument("--skip-reclaim", action="store_true", help="Only scrape and allocate")
+    worker = sub.add_parser("worker", help="Lease and run jobs")
+    worker.add_argument("--threads", type=int, default=1, help="Jobs run at the same time by this process")
+    worker.add_argument("--drain", action="store_true", help="Exit once no job is ready instead of waiting")
+    sub.add_parser("status", help="Show job counts and failures")
+    args = parser.parse_args()
+
+    broker = open_broker(args.queue)
+    if args.command == "enqueue":
+        roster = multi_account.load_roster(args.roster)
+        queued = enqueue_roster(broker, roster, args.skip_reclaim)
+        print(f"Queued {queued} of {len(roster)} accounts.")
+    elif args.command == "worker":
+        print(f"--- Worker running on {args.queue} ({args.threads} thread(s), Ctrl+C to stop) ---")
+        processed = run_workers(broker, args.threads, args.drain)
+        print(f"Processed {processed} job(s).")
+    else:
+        print_status(broker)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Shared JSON helpers for the sync scripts.
+
+Uses orjson for parsing/dumping when it is installed and falls back to the
+standard library json module otherwise. Also provides a streaming parser
+(ijson, if installed) that trims each Canvas assignment down to the fields
+the pipeline actually uses while the response is being read, so large
+`description` HTML blobs are never kept in memory.
+"""
+import json
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Only these keys of a Canvas assignment object are used downstream
+ASSIGNMENT_FIELDS = ("id", "name", "html_url", "due_at", "unlock_at")
+
+# Both orjson and json raise a subclass of this on bad input
+JSONDecodeError = json.JSONDecodeError
+
+# Everything a streamed parse can raise on malformed input
+PARSE_ERRORS = (ValueError, ijson.JSONError) if ijson is not None else (ValueError,)
+
+
+def loads(data: Any) -> Any:
+    """Parses a JSON str/bytes document."""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, (bytes, bytearray)):
+        data = data.decode("utf-8")
+    return json.loads(data)
+
+
+def dumps(data: Any, indent: Optional[int] = 2) -> str:
+    """Serializes data to a JSON string."""
+    # orjson only supports 2-space indentation
+    if orjson is not None and indent in (None, 2):
+        option = orjson.OPT_INDENT_2 if indent else 0
+        return orjson.dumps(data, option=option).decode("utf-8")
+    return json.dumps(data, indent=indent)
+
+
+def load_file(filename: str) -> Any:
+    """Reads and parses a JSON file. Raises FileNotFoundError / JSONDecodeError."""
+    with open(filename, "rb") as f:
+        return loads(f.read())
+
+
+def save_file(filename: str, data: Any, indent: Optional[int] = 2):
+    """Writes data to a JSON file."""
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(dumps(data, indent=indent))
+
+
+def project(item: Dict[str, Any], fields: Iterable[str] = ASSIGNMENT_FIELDS) -> Dict[str, Any]:
+    """Returns a new dict holding only the given keys of item."""
+    return {key: item.get(key) for key in fields}
+
+
+def iter_projected(stream, fields: Iterable[str] = ASSIGNMENT_FIELDS) -> Iterator[Dict[str, Any]]:
+    """
+    Yields each object of a top-level JSON array read from a binary file-like
+    stream, projected down to `fields`. With ijson installed the array is
+    parsed incrementally; otherwise the whole body is parsed then projected.
+    """
+    fields = tuple(fields)
+    if ijson is not None:
+        for item in ijson.items(stream, "item", use_float=True):
+            yield project(item, fields)
+        return
+
+    for item in loads(stream.read()):
+        yield project(item, fields)
@@ -0,0 +1,220 @@
+"""
+Multi-account batch sync.
+
+Runs the scrape -> allocate -> Reclaim pipeline for every account in a roster
+file (accounts.json) on one shared worker pool, instead of one process and
+one set of JSON files per student.
+
+Roster format (a JSON list):
+    [
+      {
+        "id": "alice",
+        "canvas_url": "https://canvas.vt.edu",
+        "canvas_token": "...",
+        "reclaim_email": "...",
+        "reclaim_password": "...",
+        "chrome_profile_path": "...",
+        "chrome_profile_name": "Default",
+        "ingest_strategy": "planner",
+        "priority": "interactive"
+      }
+    ]
+
+"ingest_strategy" is optional and picks the Canvas fetch method (see
+INGEST_STRATEGIES in Canvas_scrape_assignments.py). "priority" is optional:
+"interactive" accounts get their requests scheduled ahead of the default
+"bulk" ones (backfills) when they wait on the same host.
+
+Every account keeps its own state files (seen/timed/rules/new names) and a
+generated config.py under accounts/<id>/. Canvas requests from all accounts
+share one request scheduler (per-host token buckets and adaptive in-flight caps, see rate_limit.py), allocation runs on a process pool sized to the
+machine's cores, and Reclaim browser sessions are capped per host as well.
+New assignment groups get time_allocator.DEFAULT_TIME_HOURS since nobody is
+there to answer the prompt.
+
+Usage: python multi_account.py [accounts.json] [--workers N]
+For fleets spread over several processes or machines, see job_queue.py.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List
+
+import json_codec
+import time_allocator
+import Canvas_scrape_assignments as scraper
+from rate_limit import RequestScheduler, RateLimitedHttp, INTERACTIVE, BULK, describe_metrics
+
+ROSTER_FILE = "accounts.json"
+ACCOUNTS_DIR = "accounts"
+RECLAIM_SCRIPT = "reclaim_task_creator.py"
+RECLAIM_HOST = "app.reclaim.ai"
+
+# Canvas: 5 requests/second (bursts of up to 10) and 4 in flight per host to start with (shared by all accounts;
+# the in-flight cap then follows Canvas's response times and throttling).
+CANVAS_RATE_PER_SECOND = 5.0
+CANVAS_MAX_IN_FLIGHT = 4
+CANVAS_BURST = 10
+# Reclaim: at most 2 browsers at once, started at least 5 seconds apart.
+RECLAIM_RATE_PER_SECOND = 0.2
+RECLAIM_MAX_IN_FLIGHT = 2
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+REQUIRED_KEYS = ("id", "canvas_url", "canvas_token")
+
+# Runs a stage script with the account directory (and its config.py) first on
+# sys.path, followed by the repo directory for the shared modules.
+STAGE_RUNNER = (
+    "import runpy, sys; sys.path[:1] = ['', sys.argv[2]]; "
+    "runpy.run_path(sys.argv[1], run_name='__main__')"
+)
+
+
+def load_roster(path: str) -> List[Dict[str, Any]]:
+    """Loads and validates the account roster."""
+    roster = json_codec.load_file(path)
+    if not isinstance(roster, list):
+        raise ValueError(f"{path} must contain a JSON list of accounts.")
+
+    seen_ids = set()
+    for account in roster:
+        missing = [key for key in REQUIRED_KEYS if not account.get(key)]
+        if missing:
+            raise ValueError(f"Account {account.get('id', '?')} is missing: {', '.join(missing)}")
+        if account["id"] in seen_ids:
+            raise ValueError(f"Duplicate account id: {account['id']}")
+        seen_ids.add(account["id"])
+    return roster
+
+
+def account_dir(account: Dict[str, Any], base_dir: str = ACCOUNTS_DIR) -> str:
+    """Returns (and creates) the isolated state directory for an account."""
+    safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", str(account["id"]))
+    path = os.path.join(base_dir, safe_id)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def write_account_config(account: Dict[str, Any], state_dir: str):
+    """Writes the config.py the stage scripts import when run for this account."""
+    values = {
+        "CANVAS_URL": account.get("canvas_url", ""),
+        "CANVAS_TOKEN": account.get("canvas_token", ""),
+        "RECLAIM_EMAIL": account.get("reclaim_email", ""),
+        "RECLAIM_PASSWORD": account.get("reclaim_password", ""),
+        "CHROME_PROFILE_PATH": account.get("chrome_profile_path", ""),
+        "CHROME_PROFILE_NAME": account.get("chrome_profile_name", ""),
+    }
+    lines = [
+        f"# Generated by multi_account.py for account '{account['id']}'",
+        "# WARNING: Do not share this file. It contains sensitive credentials.",
+        "",
+    ]
+    lines += [f"{key} = {value!r}" for key, value in values.items()]
+    with open(os.path.join(state_dir, "config.py"), "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def run_reclaim_stage(state_dir: str) -> subprocess.CompletedProcess:
+    """Runs the Reclaim task creator for one account inside its state directory."""
+    script = os.path.join(REPO_DIR, RECLAIM_SCRIPT)
+    return subprocess.run([sys.executable, "-c", STAGE_RUNNER, script, REPO_DIR],
+                          cwd=state_dir, capture_output=True, text=True)
+
+
+def sync_account(account: Dict[str, Any], limiter: RequestScheduler,
+                 alloc_pool: ProcessPoolExecutor, skip_reclaim: bool = False) -> Dict[str, Any]:
+    """Runs the full pipeline for one account. Returns a small result summary."""
+    state_dir = account_dir(account)
+    write_account_config(account, state_dir)
+    result = {"id": account["id"], "new": 0, "allocated": 0, "reclaim": "skipped"}
+
+    priority = account_priority(account)
+
+    # 1. Canvas scrape (rate limited per host across all accounts)
+    http = RateLimitedHttp(limiter, priority=priority)
+    new_assignments = scraper.main(state_dir, account["canvas_url"], account["canvas_token"], http,
+                                   account.get("ingest_strategy"))
+    result["new"] = len(new_assignments)
+
+    # 2. Time allocation (CPU bound -> shared process pool)
+    allocated = alloc_pool.submit(time_allocator.allocate_time, state_dir,
+                                  time_allocator.get_default_time).result()
+    result["allocated"] = allocated or 0
+
+    # 3. Reclaim sync (browser sessions limited per host)
+    if new_assignments and not skip_reclaim:
+        with limiter.slot(RECLAIM_HOST, priority):
+            completed = run_reclaim_stage(state_dir)
+        with open(os.path.join(state_dir, "reclaim_log.txt"), "w", encoding="utf-8") as f:
+            f.write(completed.stdout)
+            f.write(completed.stderr)
+        result["reclaim"] = "ok" if completed.returncode == 0 else f"failed ({completed.returncode})"
+
+    return result
+
+
+def account_priority(account: Dict[str, Any]) -> int:
+    return INTERACTIVE if account.get("priority") == "interactive" else BULK
+
+
+def make_scheduler() -> RequestScheduler:
+    """The request scheduler shared by all accounts synced in this process."""
+    return RequestScheduler(
+        rate_per_second=CANVAS_RATE_PER_SECOND,
+        max_in_flight=CANVAS_MAX_IN_FLIGHT,
+        burst=CANVAS_BURST,
+        overrides={RECLAIM_HOST: (RECLAIM_RATE_PER_SECOND, RECLAIM_MAX_IN_FLIGHT, 1)},
+    )
+
+
+def run_batch(roster_path: str = ROSTER_FILE, workers: int = None, skip_reclaim: bool = False) -> List[Dict[str, Any]]:
+    """Syncs every account in the roster on a shared worker pool."""
+    roster = load_roster(roster_path)
+    cores = os.cpu_count() or 1
+    # Most of the work is waiting on the network, so use more threads than cores
+    workers = workers or min(len(roster), cores * 4) or 1
+
+    limiter = make_scheduler()
+
+    print(f"--- Batch sync: {len(roster)} accounts, {workers} workers, {cores} allocator processes ---")
+    results = []
+    with ProcessPoolExecutor(max_workers=cores) as alloc_pool, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(sync_account, account, limiter, alloc_pool, skip_reclaim): account
+                   for account in roster}
+        for future in as_completed(futures):
+            account = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append({"id": account["id"], "error": str(e)})
+
+    print("\n" + "=" * 50)
+    for result in sorted(results, key=lambda r: str(r["id"])):
+        if "error" in result:
+            print(f"{result['id']}: ERROR {result['error']}")
+        else:
+            print(f"{result['id']}: {result['new']} new, {result['allocated']} allocated, Reclaim {result['reclaim']}")
+    for line in describe_metrics(limiter):
+        print(line)
+    print("=" * 50)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync many Canvas/Reclaim accounts in one process.")
+    parser.add_argument("roster", nargs="?", default=ROSTER_FILE, help="Account roster JSON file")
+    parser.add_argument("--workers", type=int, default=None, help="Number of concurrent account workers")
+    parser.add_argument("--skip-reclaim", action="store_true", help="Only scrape and allocate")
+    args = parser.parse_args()
+
+    results = run_batch(args.roster, args.workers, args.skip_reclaim)
+    if any("error" in r for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,460 @@
+"""
+Streaming sync pipeline: scrape, allocate and create Reclaim tasks at once.
+
+The normal workflow runs the three scripts one after another with a JSON file
+written and re-read in between, so nothing reaches Reclaim until the slowest
+course has been fetched and every assignment has been grouped. Here the three
+stages run as threads connected by bounded queues:
+
+    Canvas fetch  --(new assignments)-->  grouping/time  --(timed)-->  Reclaim
+
+A new assignment is grouped and synced while later courses are still being
+fetched. Grouping is incremental (each name is matched against the rules and
+the groups created so far, like `time_allocator.py --no-cluster`), since
+clustering needs the whole batch up front.
+
+The Reclaim stage uses the API (reconcile-style duplicate check) when
+RECLAIM_API_KEY is set, otherwise the browser automation, which is only
+launched once the first task is ready.
+
+With --watch the fetch stage doesn't end after one pass: it listens for
+pushed Canvas assignment events (see canvas_events.py) and runs a full
+poll only at start and every CANVAS_EVENTS_FULL_POLL_HOURS to catch missed
+events. Files are saved every SAVE_INTERVAL seconds; Ctrl+C stops
+listening, lets the queued assignments finish, and saves.
+
+Usage: python pipeline.py [--strategy courses|planner|graphql] [--batch] [--watch]
+    --batch  use the default time for new groups instead of prompting
+    --watch  keep running and ingest pushed Canvas events
+"""
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Any, Dict, List
+
+import canvas_events
+import rate_limit
+import rule_index
+import stage_supervisor
+import sync_queue
+from progress import Progress
+import time_allocator
+import working_set
+import Canvas_scrape_assignments as scraper
+from assignment_record import Assignment, load_records, dump_records, format_datetime, parse_datetime
+
+QUEUE_SIZE = 50 # Bounded so a fast producer can't run far ahead of a slow consumer
+_DONE = object() # End-of-stream marker passed down the queues
+SAVE_INTERVAL = 60 # Seconds between saves while watching for events
+
+
+class StreamingPipeline:
+    def __init__(self, state_dir: str = ".", strategy: str = None, prompt=time_allocator.get_time_from_user,
+                 watch: bool = False, receiver: "canvas_events.EventReceiver" = None):
+        self.state_dir = state_dir
+        self.strategy = strategy or scraper.INGEST_STRATEGY
+        self.prompt = prompt
+        self.watch = watch
+        self.receiver = receiver
+        # Set to stop listening for events; unlike stop, queued work still finishes
+        self.end_watch = threading.Event()
+        self.course_names: Dict[str, str] = {}
+        # html_url -> record updated by an assignment_updated event (applied to timed tasks on save)
+        self.updated: Dict[str, Assignment] = {}
+        self.reclaim_api = None # Created on the first update that needs it
+        self.new_queue: "queue.Queue" = queue.Queue(maxsize=QUEUE_SIZE)
+        self.timed_queue: "queue.Queue" = queue.Queue(maxsize=QUEUE_SIZE)
+        # Set when any stage fails so the others stop instead of blocking forever
+        self.stop = threading.Event()
+        self.errors: List[str] = []
+
+        # Files are only written back by the stages that managed to load them
+        self.seen_loaded = False
+        self.rules_loaded = False
+        self.seen_assignments: List[Assignment] = []
+        self.new_assignments: List[Assignment] = []
+        self.timed_new: List[Assignment] = []
+        # html_url -> unsynced task from an earlier run, queued again by the sync stage
+        self.carried: Dict[str, Assignment] = {}
+        # Set during a full Canvas poll, so its tasks share one sync budget while watching
+        self.polling = threading.Event()
+        self.time_rules: Dict[str, Any] = {}
+        self.synced = 0
+        self.allocation_done = False
+        self.started_at = 0.0
+        self.first_task_at = None
+
+    def path(self, filename: str) -> str:
+        return os.path.join(self.state_dir, filename)
+
+    def stopping(self) -> bool:
+        """True once a stage failed or the GUI asked the pipeline to stop."""
+        if not self.stop.is_set() and stage_supervisor.cancel_requested(self.state_dir):
+            print("Cancel requested: stopping and saving progress...")
+            self.errors.append("cancelled")
+            self.stop.set()
+        return self.stop.is_set()
+
+    # --- queue helpers ---
+    def put(self, q: "queue.Queue", item) -> bool:
+        while not self.stopping():
+            try:
+                q.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q: "queue.Queue"):
+        while not self.stopping():
+            try:
+                return q.get(timeout=0.2)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def run_stage(self, name: str, target, output_queue=None):
+        """Runs a stage, recording failures and always passing the end marker on."""
+        try:
+            target()
+        except BaseException as e:
+            self.errors.append(f"{name}: {e}")
+            print(f"FATAL ERROR in {name} stage: {e}")
+            self.stop.set()
+        finally:
+            if output_queue is not None:
+                self.put(output_queue, _DONE)
+
+    # --- stage 1: Canvas fetch ---
+    def fetch_stage(self):
+        seen = scraper.load_seen(self.path(scraper.SEEN_FILE))
+        now = working_set.utc_now()
+        seen, expired = working_set.split_expired(seen, now)
+        working_set.archive(expired, self.path(working_set.ARCHIVE_FILE))
+        self.seen_assignments = seen
+        self.seen_loaded = True
+        self.seen_links = {a.html_url for a in seen if a.html_url}
+
+        self.poll()
+        if self.watch:
+            self.watch_events()
+
+    def poll(self):
+        """One full pass over Canvas with the configured strategy."""
+        fetch = scraper.STREAMING_STRATEGIES[self.strategy]
+        self.polling.set()
+        try:
+            for ev in fetch():
+                if self.stopping():
+                    return
+                self.ingest(ev)
+        finally:
+            self.polling.clear()
+
+    def ingest(self, ev: Dict[str, Any]):
+        """Dedups one assignment and passes it on to allocation if it is new."""
+        if not working_set.in_active_window(ev.get("due_at"), working_set.utc_now(), scraper.ACTIVE_WINDOW_DAYS):
+            return
+        assignment = scraper.new_assignment_from_event(ev, self.seen_links)
+        if assignment:
+            self.seen_assignments.append(assignment)
+            self.new_assignments.append(assignment)
+            self.put(self.new_queue, assignment)
+
+    def course_name(self, course_id: str) -> str:
+        if course_id not in self.course_names:
+            self.course_names[course_id] = scraper.fetch_course_name(course_id)
+        return self.course_names[course_id]
+
+    def apply_update(self, ev: Dict[str, Any]) -> bool:
+        """Updates a known assignment's name/dates from an event. False if it isn't known yet."""
+        record = next((a for a in self.seen_assignments if a.html_url == ev["html_url"]), None)
+        if record is None:
+            return False
+        import reclaim_reconcile
+        old_title = reclaim_reconcile.task_title(record)
+        changed = Assignment.from_canvas(ev)
+        record.name = changed.name
+        record.due_at, record.unlock_at = changed.due_at, changed.unlock_at
+        self.updated[record.html_url] = record
+        print(f"Updated assignment from event: [{record.course_name}] {record.name} (Due: {ev.get('due_at')})")
+        self.update_remote(old_title, record)
+        return True
+
+    def update_remote(self, old_title: str, record: Assignment):
+        """Renames/re-dates the assignment's Reclaim task right away (needs RECLAIM_API_KEY)."""
+        import requests
+        import reclaim_reconcile
+        import reclaim_task_creator as creator
+
+        if not creator.RECONCILE_MODE:
+            print(" Its Reclaim task keeps the old name and due date: set RECLAIM_API_KEY to update it automatically.")
+            return
+        if self.reclaim_api is None:
+            self.reclaim_api = reclaim_reconcile.ReclaimApi(creator.RECLAIM_API_KEY)
+        try:
+            remote = reclaim_reconcile.live_task(self.reclaim_api.list_canvas_tasks(), old_title)
+            if remote is None:
+                # Not synced yet: it is created with the new details
+                return
+            changes = {}
+            if remote.get("title") != reclaim_reconcile.task_title(record):
+                changes["title"] = reclaim_reconcile.task_title(record)
+            # An assignment without a due date keeps the task's deadline
+            if record.due_at is not None and parse_datetime(remote.get("due")) != record.due_at:
+                changes["due"] = format_datetime(record.due_at)
+            if changes:
+                self.reclaim_api.update_task(remote.get("id"), changes)
+                print(f" Task updated: {reclaim_reconcile.task_title(record)} ({', '.join(changes)})")
+        except requests.exceptions.RequestException as e:
+            print(f"WARNING: Could not update the Reclaim task '{old_title}': {e}")
+
+    def watch_events(self):
+        receiver = self.receiver or canvas_events.EventReceiver().start()
+        print(f"--- Listening for Canvas events on port {receiver.port} (Ctrl+C to stop) ---")
+        next_poll = time.monotonic() + canvas_events.FULL_POLL_HOURS * 3600
+        next_save = time.monotonic() + SAVE_INTERVAL
+        try:
+            while not self.end_watch.is_set() and not self.stopping():
+                payload = receiver.get(timeout=0.5)
+                if payload is not None:
+                    ev = canvas_events.parse_event(payload, scraper.CANVAS_URL, self.course_name)
+                    if ev is not None and not (ev["event_name"] == canvas_events.UPDATED and self.apply_update(ev)):
+                        self.ingest(ev)
+                now = time.monotonic()
+                if now >= next_poll:
+                    print("--- Consistency check: full Canvas poll ---")
+                    self.poll()
+                    next_poll = now + canvas_events.FULL_POLL_HOURS * 3600
+                if now >= next_save:
+                    self.save()
+                    next_save = now + SAVE_INTERVAL
+        finally:
+            if self.receiver is None:
+                receiver.stop()
+
+    # --- stage 2: grouping and time allocation ---
+    def allocate_stage(self):
+        self.time_rules = time_allocator.load_json(self.path(time_allocator.RULES_FILE))
+        self.rules_loaded = True
+        while True:
+            assignment = self.get(self.new_queue)
+            if assignment is _DONE:
+                return
+            name = assignment.name or "Unnamed Assignment"
+            group_key = time_allocator.get_similarity_group_key(name, self.time_rules)
+            if not group_key:
+                group_key = name
+                time_allocator.ensure_group_rule(group_key, self.time_rules, self.prompt)
+            assignment.group_key = group_key
+
+            time_taken = (self.time_rules.get(group_key) or {}).get("time_taken")
+            if time_taken is None:
+                print(f"Warning: Could not assign time to '{assignment.name}' (Missing rule). Skipping.")
+                continue
+            assignment.time_allocated_hours = time_taken
+            self.timed_new.append(assignment)
+            self.put(self.timed_queue, assignment)
+
+    # --- stage 3: Reclaim ---
+    def sync_stage(self):
+        import reclaim_task_creator as creator
+
+        problem = creator.config_problem()
+        if problem:
+            raise RuntimeError(problem)
+        if creator.RECONCILE_MODE:
+            import reclaim_reconcile
+            api = reclaim_reconcile.ReclaimApi(creator.RECLAIM_API_KEY)
+            existing = {t.get("title") for t in api.list_canvas_tasks()}
+            create = lambda task: self._create_via_api(api, existing, task)
+        else:
+            create = self._create_via_browser
+
+        # Tasks an earlier run didn't get to (budget, failure) go in with the new ones
+        now = working_set.utc_now()
+        previous = load_records(time_allocator.load_json(self.path(time_allocator.TIMED_FILE)))
+        self.carried = {t.html_url: t for t in sync_queue.unsynced(previous)
+                        if working_set.in_active_window(t.due_at, now, scraper.ACTIVE_WINDOW_DAYS)}
+
+        # The total isn't known while Canvas is still being fetched
+        bar = Progress("Pipeline", "tasks synced")
+        pending = sync_queue.SyncQueue(self.carried.values())
+        budget = sync_queue.Budget()
+        deferred: List[Assignment] = []
+        try:
+            while True:
+                # While watching, each batch of events gets its own budget
+                new_batch = self.watch and not len(pending) and not self.polling.is_set()
+                task = self.next_task(pending)
+                if task is _DONE:
+                    bar.finish()
+                    return
+                if new_batch:
+                    budget = sync_queue.Budget()
+                    for left_over in deferred:
+                        pending.push(left_over)
+                    deferred = []
+                    pending.push(task)
+                    task = pending.pop()
+                reason = budget.exhausted()
+                if reason:
+                    if not self.watch:
+                        print(f"Sync budget: {reason}; the remaining tasks are left for the next sync.")
+                        self.drain(self.timed_queue)
+                        bar.finish()
+                        return
+                    print(f"Sync budget: {reason}; the remaining tasks wait for the next batch.")
+                    deferred.append(task)
+                    while len(pending):
+                        deferred.append(pending.pop())
+                    continue
+                with budget.spend():
+                    created = create(task)
+                if created:
+                    self.synced += 1
+                    bar.advance()
+                    if self.first_task_at is None:
+                        self.first_task_at = time.monotonic()
+                        print(f"--- First task synced {self.first_task_at - self.started_at:.1f}s after start ---")
+        finally:
+            if not creator.RECONCILE_MODE:
+                creator.end_session()
+
+    def next_task(self, pending: sync_queue.SyncQueue):
+        """
+        Moves every task allocated so far into `pending` and returns the most
+        urgent one, or _DONE once allocation has finished and nothing is left.
+        """
+        while not self.allocation_done:
+            if len(pending):
+                try:
+                    item = self.timed_queue.get_nowait()
+                except queue.Empty:
+                    break
+            else:
+                item = self.get(self.timed_queue)
+            if item is _DONE:
+                self.allocation_done = True
+            else:
+                pending.push(item)
+        if self.stopping() or not len(pending):
+            return _DONE
+        return pending.pop()
+
+    def drain(self, q: "queue.Queue"):
+        """Keeps consuming so the upstream stages can finish (their output is still saved)."""
+        while not self.allocation_done and self.get(q) is not _DONE:
+            pass
+        self.allocation_done = True
+
+    def _create_via_api(self, api, existing_titles, task) -> bool:
+        import reclaim_reconcile
+        title = reclaim_reconcile.task_title(task)
+        if title in existing_titles:
+            # Already in Reclaim (e.g. local state was restored): don't duplicate it
+            task.reclaim_synced = True
+            return False
+        api.create_task(reclaim_reconcile.task_payload(task))
+        existing_titles.add(title)
+        task.reclaim_synced = True
+        print(f" Task created: {title}")
+        return True
+
+    def _create_via_browser(self, task) -> bool:
+        import reclaim_task_creator as creator
+        if creator.driver is None:
+            # Only launch Chrome once there is actually something to create
+            creator.start_session()
+        with rate_limit.shared_scheduler().slot(rate_limit.BROWSER_HOST):
+            creator.create_reclaim_task(task)
+        creator.network_stats.collect(creator.driver)
+        return task.reclaim_synced
+
+    # --- run ---
+    def save(self):
+        if not self.seen_loaded:
+            return
+        # Copies, since other stages may still be appending while watching
+        scraper.save_seen(list(self.seen_assignments), self.path(scraper.SEEN_FILE))
+        scraper.save_new_names_only(list(self.new_assignments), self.path(scraper.NEW_NAMES_FILE))
+        if self.rules_loaded:
+            time_allocator.save_json(self.path(time_allocator.RULES_FILE), dict(self.time_rules))
+
+        # Previously timed assignments that are still in the working set, plus the new ones
+        active_links = {a.html_url for a in self.seen_assignments}
+        timed = [t for t in load_records(time_allocator.load_json(self.path(time_allocator.TIMED_FILE)))
+                 if t.html_url in active_links]
+        for task in timed:
+            updated = self.updated.get(task.html_url)
+            if updated is not None:
+                task.name, task.due_at, task.unlock_at = updated.name, updated.due_at, updated.unlock_at
+            carried = self.carried.get(task.html_url)
+            if carried is not None and carried.reclaim_synced:
+                task.reclaim_synced = True
+        timed_links = {t.html_url for t in timed}
+        timed += [t for t in list(self.timed_new) if t.html_url not in timed_links]
+        time_allocator.save_json(self.path(time_allocator.TIMED_FILE), dump_records(timed))
+        if self.rules_loaded:
+            rule_index.update_index(self.state_dir, timed, dict(self.time_rules))
+
+    def run(self) -> bool:
+        print("--- Streaming Pipeline Running ---")
+        self.started_at = time.monotonic()
+        threads = [
+            threading.Thread(target=self.run_stage, args=("fetch", self.fetch_stage, self.new_queue)),
+            threading.Thread(target=self.run_stage, args=("allocate", self.allocate_stage, self.timed_queue)),
+            threading.Thread(target=self.run_stage, args=("sync", self.sync_stage)),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                try:
+                    thread.join(0.5)
+                except KeyboardInterrupt:
+                    if self.end_watch.is_set():
+                        # Second Ctrl+C: don't wait for the queued work
+                        self.errors.append("interrupted")
+                        self.stop.set()
+                    else:
+                        print("\nStopping: finishing the queued assignments (Ctrl+C again to quit now)...")
+                        self.end_watch.set()
+
+        # Whatever made it through is kept, even if a stage failed
+        self.save()
+
+        elapsed = time.monotonic() - self.started_at
+        print("\n" + "=" * 50)
+        print(f"COMPLETE: {len(self.new_assignments)} new, {len(self.timed_new)} allocated, "
+              f"{self.synced} synced in {elapsed:.1f}s")
+        for line in rate_limit.describe_metrics():
+            print(line)
+        print("=" * 50)
+        return not self.errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape, allocate and sync in one streaming pass.")
+    parser.add_argument("--strategy", choices=list(scraper.STREAMING_STRATEGIES), default=None)
+    parser.add_argument("--batch", action="store_true", help="Use the default time for new groups")
+    parser.add_argument("--watch", action="store_true", help="Keep running and ingest pushed Canvas events")
+    args = parser.parse_args()
+
+    scraper.check_config()
+    import reclaim_task_creator as creator
+    problem = creator.config_problem()
+    if problem:
+        # Before fetching and asking for times, not once the sync stage starts
+        print(f"ERROR: {problem}")
+        sys.exit(1)
+    prompt = time_allocator.get_default_time if args.batch else time_allocator.get_time_from_user
+    if not StreamingPipeline(strategy=args.strategy, prompt=prompt, watch=args.watch).run():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
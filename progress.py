@@ -0,0 +1,137 @@
+"""
+Per-item progress events for the sync stages.
+
+A stage creates a Progress for each countable step (courses fetched, names
+grouped, tasks created) and calls advance() per item. The rate is a moving
+average of the observed time per item, and the ETA is the remaining items
+divided by that rate.
+
+When the GUI runs a stage it sets SYNC_PROGRESS=events, and each update is
+printed as one machine-readable stdout line:
+    @@PROGRESS {"stage": "Reclaim", "unit": "tasks", "done": 3, "total": 12, "rate": 0.8, "eta": 11.2}
+which the GUI turns into its progress bar and status text instead of
+showing it in the console. On the command line the same update is printed
+as a readable line, e.g. "[Reclaim] 3/12 tasks (0.8/s, ETA 0:11)".
+"""
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+EVENT_PREFIX = "@@PROGRESS "
+EVENTS_ENV = "SYNC_PROGRESS"
+MIN_INTERVAL = 0.25 # Seconds between GUI updates (the first and last are always sent)
+READABLE_INTERVAL = 2.0 # Seconds between readable lines on the command line
+SMOOTHING = 0.3 # Weight of the newest per-item time in the rate's moving average
+
+
+def events_enabled() -> bool:
+    return os.environ.get(EVENTS_ENV) == "events"
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "?"
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def describe(event: Dict[str, Any]) -> str:
+    """Readable one-line form of an event."""
+    done, total = event["done"], event.get("total")
+    count = f"{done}/{total}" if total is not None else str(done)
+    details = []
+    if event.get("rate"):
+        details.append(f"{event['rate']:.1f}/s")
+    if total is not None and done < total:
+        details.append(f"ETA {format_eta(event.get('eta'))}")
+    suffix = f" ({', '.join(details)})" if details else ""
+    return f"[{event['stage']}] {count} {event['unit']}{suffix}"
+
+
+def parse_event(line: str) -> Optional[Dict[str, Any]]:
+    """Returns the event on a stage output line, or None for normal output."""
+    if not line.startswith(EVENT_PREFIX):
+        return None
+    try:
+        return json.loads(line[len(EVENT_PREFIX):])
+    except json.JSONDecodeError:
+        return None
+
+
+class Progress:
+    def __init__(self, stage: str, unit: str, total: Optional[int] = None, emit: bool = True):
+        self.stage = stage
+        self.unit = unit
+        self.total = total
+        self.done = 0
+        self.emit_enabled = emit
+        self.started = time.monotonic()
+        self._last_item = self.started
+        self._last_emit = 0.0
+        self._seconds_per_item: Optional[float] = None
+        # The GUI shows the stage's total right away; the command line waits for the first item
+        if events_enabled():
+            self._emit(force=True)
+
+    @property
+    def rate(self) -> Optional[float]:
+        """Items per second from the smoothed time per item."""
+        if not self._seconds_per_item:
+            return None
+        return 1.0 / self._seconds_per_item
+
+    @property
+    def eta(self) -> Optional[float]:
+        if self.total is None or not self._seconds_per_item:
+            return None
+        return max(0, self.total - self.done) * self._seconds_per_item
+
+    def advance(self, count: int = 1):
+        now = time.monotonic()
+        if count > 0:
+            per_item = (now - self._last_item) / count
+            if self._seconds_per_item is None:
+                self._seconds_per_item = per_item
+            else:
+                self._seconds_per_item += SMOOTHING * (per_item - self._seconds_per_item)
+            self._last_item = now
+        self.done += count
+        self._emit(force=self.total is not None and self.done >= self.total)
+
+    def set_total(self, total: Optional[int]):
+        self.total = total
+        self._emit(force=True)
+
+    def finish(self):
+        """Prints the final count (e.g. when the total wasn't known up front)."""
+        if self.total is None:
+            self.total = self.done
+        self._emit(force=True)
+
+    def event(self) -> Dict[str, Any]:
+        rate, eta = self.rate, self.eta
+        return {
+            "stage": self.stage,
+            "unit": self.unit,
+            "done": self.done,
+            "total": self.total,
+            "rate": round(rate, 3) if rate is not None else None,
+            "eta": round(eta, 1) if eta is not None else None,
+        }
+
+    def _emit(self, force: bool = False):
+        if not self.emit_enabled:
+            return
+        now = time.monotonic()
+        events = events_enabled()
+        if not force and now - self._last_emit < (MIN_INTERVAL if events else READABLE_INTERVAL):
+            return
+        self._last_emit = now
+        event = self.event()
+        if events:
+            print(EVENT_PREFIX + json.dumps(event), flush=True)
+        else:
+            print(describe(event), flush=True)
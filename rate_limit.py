@@ -0,0 +1,396 @@
+"""
+Request scheduling shared by everything that talks to Canvas or Reclaim.
+
+Each host gets a token bucket (a steady rate plus a small burst) and a cap on
+how many requests may be in flight at once, no matter how many worker
+threads are issuing them. Requests waiting on the same host are let through
+in priority order, so an interactive sync goes ahead of bulk backfills that
+share the scheduler (e.g. multi_account.py); within a priority it is first
+come, first served.
+
+The Reclaim browser automation is scheduled too, under the pseudo-host
+BROWSER_HOST, which paces task creation (the creator still waits briefly
+for the page to settle after each task).
+
+A 429 (or Canvas's "403 Rate Limit Exceeded") pauses the whole host for the
+Retry-After time before the request is retried, so one throttled request
+slows every caller down instead of all of them hitting the limit.
+
+The in-flight cap of an HTTP host adapts to how it responds (AIMD): every
+healthy response raises the limit by 1/limit (about +1 per round of
+requests, up to ADAPTIVE_MAX_IN_FLIGHT), while a throttle, a 5xx, a
+connection error or a p95 latency well above the host's baseline cuts it
+(x0.5 or x0.9). A cut starts a fresh latency window, and responses to
+requests sent before it are left out, so one congestion event costs one
+decrease. The configured max_in_flight is the starting point. metrics()
+reports the current limits.
+
+A streamed response (stream=True) keeps its slot, and its timing runs,
+until the body has been read to the end or the response is closed.
+"""
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+# Priorities: lower goes first
+INTERACTIVE = 0
+BULK = 10
+
+DEFAULT_RATE_PER_SECOND = 5.0
+DEFAULT_MAX_IN_FLIGHT = 4
+
+RECLAIM_API_HOST = "api.app.reclaim.ai"
+# Not a real host: one browser action (task creation) at a time, at most one per second
+BROWSER_HOST = "reclaim-browser"
+
+# host -> (rate per second, max in flight, burst)
+KNOWN_HOST_LIMITS: Dict[str, Tuple[float, int, int]] = {
+    RECLAIM_API_HOST: (5.0, 2, 5),
+    BROWSER_HOST: (1.0, 1, 1),
+}
+
+MAX_THROTTLE_RETRIES = 3
+DEFAULT_RETRY_AFTER = 5.0 # Seconds to back off when a 429 has no Retry-After header
+
+# Adaptive concurrency
+ADAPTIVE_MAX_IN_FLIGHT = 16
+LATENCY_WINDOW = 50 # Recent response times kept per host
+MIN_LATENCY_SAMPLES = 10 # Before the latency check kicks in
+LATENCY_TOLERANCE = 2.0 # p95 above this multiple of the baseline counts as congestion
+BACKOFF_FACTOR = 0.5 # On throttling, 5xx and connection errors
+LATENCY_BACKOFF_FACTOR = 0.9 # On rising latency
+# Hosts whose limit is a policy (not a guess), e.g. one browser at a time
+NON_ADAPTIVE_HOSTS = {BROWSER_HOST}
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class AdaptiveLimit:
+    """AIMD concurrency limit with a latency-gradient check, fed one response at a time."""
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = ADAPTIVE_MAX_IN_FLIGHT):
+        self.minimum = minimum
+        self.maximum = max(maximum, initial)
+        self.limit = float(initial)
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        # Typical healthy latency: follows the median down at once, up only slowly
+        self.baseline: Optional[float] = None
+        self.last_decrease = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+
+    @property
+    def cap(self) -> int:
+        return max(self.minimum, int(self.limit))
+
+    def p95(self) -> Optional[float]:
+        return _percentile(list(self.latencies), 0.95) if self.latencies else None
+
+    def on_result(self, latency: float, ok: bool, throttled: bool = False, now: Optional[float] = None):
+        now = now if now is not None else time.monotonic()
+        self.requests += 1
+        if not ok:
+            if throttled:
+                self.throttled += 1
+            else:
+                self.errors += 1
+            self._decrease(BACKOFF_FACTOR, now - latency, now)
+            return
+        if now - latency < self.last_decrease:
+            # Sent before the last cut: says nothing about the new limit
+            return
+
+        self.latencies.append(latency)
+        if len(self.latencies) >= MIN_LATENCY_SAMPLES:
+            median = _percentile(list(self.latencies), 0.5)
+            self.baseline = median if self.baseline is None else min(median, self.baseline + 0.01 * (median - self.baseline))
+            if self.p95() > self.baseline * LATENCY_TOLERANCE:
+                self._decrease(LATENCY_BACKOFF_FACTOR, now - latency, now)
+                return
+        self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def _decrease(self, factor: float, sent: float, now: float):
+        if sent < self.last_decrease:
+            return
+        self.limit = max(self.minimum, self.limit * factor)
+        self.last_decrease = now
+        # The slow samples that caused the cut would otherwise trigger the next one too
+        self.latencies.clear()
+
+
+class _HostState:
+    def __init__(self, rate: float, max_in_flight: int, burst: int, adaptive: bool = False):
+        self.rate = rate
+        self.configured_in_flight = max_in_flight
+        self.adaptive = AdaptiveLimit(max_in_flight) if adaptive else None
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.in_flight = 0
+        # Heap of (priority, arrival number) tickets waiting for this host
+        self.waiters = []
+
+    @property
+    def max_in_flight(self) -> int:
+        return self.adaptive.cap if self.adaptive is not None else self.configured_in_flight
+
+    def refill(self, now: float):
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def has_token(self) -> bool:
+        return self.rate <= 0 or self.tokens >= 1
+
+
+class RequestScheduler:
+    """Thread-safe per-host token buckets, concurrency caps and priority queues."""
+
+    def __init__(self, rate_per_second: float = DEFAULT_RATE_PER_SECOND,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, burst: Optional[int] = None,
+                 overrides: Optional[Dict[str, tuple]] = None, adaptive: bool = True):
+        self.adaptive = adaptive
+        self.rate_per_second = rate_per_second
+        self.max_in_flight = max_in_flight
+        self.burst = burst if burst is not None else max_in_flight
+        # host -> (rate_per_second, max_in_flight[, burst])
+        self.overrides = dict(KNOWN_HOST_LIMITS)
+        self.overrides.update(overrides or {})
+        self._cond = threading.Condition()
+        self._hosts: Dict[str, _HostState] = {}
+        self._arrivals = itertools.count()
+
+    def _state(self, host: str) -> _HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            limits = self.overrides.get(host, (self.rate_per_second, self.max_in_flight, self.burst))
+            rate, max_in_flight = limits[0], limits[1]
+            burst = limits[2] if len(limits) > 2 else max_in_flight
+            adaptive = self.adaptive and host not in NON_ADAPTIVE_HOSTS
+            state = self._hosts[host] = _HostState(rate, max_in_flight, burst, adaptive)
+        return state
+
+    def acquire(self, host: str, priority: int = INTERACTIVE):
+        """Blocks until a request to `host` may start; must be paired with release()."""
+        with self._cond:
+            state = self._state(host)
+            ticket = (priority, next(self._arrivals))
+            heapq.heappush(state.waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    state.refill(now)
+                    first = state.waiters[0] == ticket
+                    if first and state.in_flight < state.max_in_flight and state.has_token():
+                        heapq.heappop(state.waiters)
+                        if state.rate > 0:
+                            state.tokens -= 1
+                        state.in_flight += 1
+                        # The next waiter may be able to go as well
+                        self._cond.notify_all()
+                        return
+                    timeout = None
+                    if first and state.in_flight < state.max_in_flight:
+                        # Only waiting for the bucket to refill
+                        timeout = (1 - state.tokens) / state.rate
+                    self._cond.wait(timeout)
+            except BaseException:
+                if ticket in state.waiters:
+                    state.waiters.remove(ticket)
+                    heapq.heapify(state.waiters)
+                    self._cond.notify_all()
+                raise
+
+    def release(self, host: str):
+        with self._cond:
+            self._state(host).in_flight -= 1
+            self._cond.notify_all()
+
+    def pause(self, host: str, seconds: float):
+        """Holds back every request to `host` for `seconds` (e.g. after a 429)."""
+        with self._cond:
+            state = self._state(host)
+            if state.rate > 0:
+                state.refill(time.monotonic())
+                state.tokens = min(state.tokens, 0) - seconds * state.rate
+            self._cond.notify_all()
+
+    def record(self, host: str, latency: float, ok: bool, throttled: bool = False):
+        """Feeds one response (or failure) into the host's adaptive limit."""
+        with self._cond:
+            state = self._state(host)
+            if state.adaptive is None:
+                return
+            before = state.max_in_flight
+            state.adaptive.on_result(latency, ok, throttled)
+            if state.max_in_flight > before:
+                self._cond.notify_all()
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Current limit and response statistics per host (for the run summary)."""
+        with self._cond:
+            result = {}
+            for host, state in self._hosts.items():
+                entry = {"limit": state.max_in_flight, "in_flight": state.in_flight}
+                if state.adaptive is not None:
+                    p95 = state.adaptive.p95()
+                    entry.update(requests=state.adaptive.requests, throttled=state.adaptive.throttled,
+                                 errors=state.adaptive.errors, p95_ms=round(p95 * 1000) if p95 is not None else None)
+                result[host] = entry
+            return result
+
+    @contextmanager
+    def slot(self, host: str, priority: int = INTERACTIVE):
+        """Blocks until a request to `host` may start, and holds an in-flight slot."""
+        self.acquire(host, priority)
+        try:
+            yield
+        finally:
+            self.release(host)
+
+
+def _is_throttled(response) -> bool:
+    if response.status_code == 429:
+        return True
+    # Canvas answers 403 with this text when its request bucket is empty
+    return response.status_code == 403 and "Rate Limit Exceeded" in (getattr(response, "text", "") or "")
+
+
+def _retry_after(response) -> float:
+    try:
+        return float(response.headers.get("Retry-After", DEFAULT_RETRY_AFTER))
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+class _StreamedBody:
+    """Wraps a streamed response's raw body, calling `done(ok)` once it is read to the end or closed."""
+
+    def __init__(self, raw, done):
+        self._raw = raw
+        self._done = done
+
+    def _finish(self, ok: bool):
+        done, self._done = self._done, None
+        if done is not None:
+            done(ok)
+
+    def read(self, *args, **kwargs):
+        try:
+            data = self._raw.read(*args, **kwargs)
+        except Exception:
+            self._finish(False)
+            raise
+        amt = args[0] if args else kwargs.get("amt")
+        # read(0) is only a probe (ijson uses it to check the stream type)
+        if amt is None or (not data and amt != 0):
+            self._finish(True)
+        return data
+
+    def close(self):
+        self._finish(True)
+        self._raw.close()
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+        else:
+            # e.g. decode_content
+            setattr(self._raw, name, value)
+
+
+class RateLimitedHttp:
+    """Minimal requests-style client whose calls go through a RequestScheduler."""
+
+    def __init__(self, limiter: RequestScheduler, session=None, priority: int = INTERACTIVE):
+        if session is None:
+            import requests
+            session = requests.Session()
+        self.limiter = limiter
+        self.session = session
+        self.priority = priority
+
+    def request(self, method: str, url: str, **kwargs):
+        host = urlparse(url).netloc
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            self.limiter.acquire(host, self.priority)
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except Exception:
+                # Timeouts and connection errors count as congestion too
+                self.limiter.record(host, time.monotonic() - started, ok=False)
+                self.limiter.release(host)
+                raise
+            throttled = _is_throttled(response)
+            ok = not throttled and response.status_code < 500
+            if ok and kwargs.get("stream"):
+                # session.request returned at the headers: the body is still to come
+                def done(body_ok: bool, started=started):
+                    self.limiter.record(host, time.monotonic() - started, body_ok)
+                    self.limiter.release(host)
+                response.raw = _StreamedBody(response.raw, done)
+                return response
+            self.limiter.record(host, time.monotonic() - started, ok, throttled)
+            self.limiter.release(host)
+            if not throttled or attempt == MAX_THROTTLE_RETRIES:
+                return response
+            response.close()
+            self.limiter.pause(host, _retry_after(response))
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+
+_shared_scheduler: Optional[RequestScheduler] = None
+_shared_lock = threading.Lock()
+
+
+def shared_scheduler() -> RequestScheduler:
+    """The process-wide scheduler used by the scripts when no other is passed in."""
+    global _shared_scheduler
+    with _shared_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = RequestScheduler()
+        return _shared_scheduler
+
+
+def shared_http(priority: int = INTERACTIVE) -> RateLimitedHttp:
+    return RateLimitedHttp(shared_scheduler(), priority=priority)
+
+
+def describe_metrics(scheduler: Optional[RequestScheduler] = None) -> List[str]:
+    """One line per host that made requests, e.g. for the end of a stage's output."""
+    scheduler = scheduler or _shared_scheduler
+    if scheduler is None:
+        return []
+    lines = []
+    for host, m in scheduler.metrics().items():
+        if not m.get("requests"):
+            continue
+        p95 = f"{m['p95_ms']}ms" if m["p95_ms"] is not None else "-"
+        lines.append(f"[{host}] concurrency limit {m['limit']}, {m['requests']} requests, "
+                     f"p95 {p95}, {m['throttled']} throttled, {m['errors']} errors")
+    return lines
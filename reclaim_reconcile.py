@@ -0,0 +1,236 @@
+"""
+Reconcile mode for the Reclaim stage.
+
+Instead of trusting the local `reclaim_synced` flags, the existing
+"[Canvas] ..." tasks are listed from the Reclaim API once, indexed by title,
+and compared with the local timed assignments. Only the resulting minimal
+plan is executed:
+    create - new assignments with no task in Reclaim yet
+    update - tasks whose due date, start date or duration no longer match
+    delete - duplicate tasks (more tasks with a title than local assignments)
+Tasks with titles that don't belong to any local assignment are left alone,
+and so are completed and archived ones.
+
+Needs RECLAIM_API_KEY in config.py (Reclaim -> Settings -> Developer).
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import requests
+
+import json_codec
+import rate_limit
+import sync_queue
+from progress import Progress
+from assignment_record import Assignment, parse_datetime, format_datetime
+
+RECLAIM_API_URL = "https://api.app.reclaim.ai/api"
+TASK_PREFIX = "[Canvas] "
+# Reclaim measures durations in 15 minute chunks
+MINUTES_PER_CHUNK = 15
+# Completed/archived tasks still count as existing, so they are not recreated
+LISTED_STATUSES = "NEW,SCHEDULED,IN_PROGRESS,COMPLETE,ARCHIVED"
+# ...but they are never updated or deleted: only the open tasks are paired for that
+FINISHED_STATUSES = ("COMPLETE", "ARCHIVED")
+REQUEST_TIMEOUT = 30 # Seconds before a stalled API call is given up on
+
+
+def task_title(assignment: Assignment) -> str:
+    return f"{TASK_PREFIX}{assignment.name}"
+
+
+def hours_to_chunks(hours: float) -> int:
+    return max(1, round(hours * 60 / MINUTES_PER_CHUNK))
+
+
+def task_payload(assignment: Assignment) -> Dict[str, Any]:
+    """The Reclaim task fields the pipeline controls for an assignment."""
+    payload = {
+        "title": task_title(assignment),
+        "timeChunksRequired": hours_to_chunks(assignment.time_allocated_hours),
+        "due": format_datetime(assignment.due_at),
+        "eventCategory": "WORK",
+    }
+    start = assignment.start_at
+    if start is not None:
+        payload["snoozeUntil"] = format_datetime(start)
+    return payload
+
+
+def _same_time(a: Any, b: Any) -> bool:
+    return parse_datetime(a) == parse_datetime(b)
+
+
+def needs_update(assignment: Assignment, remote: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the fields that differ between the local assignment and its remote task."""
+    wanted = task_payload(assignment)
+    changes = {}
+    if remote.get("timeChunksRequired") != wanted["timeChunksRequired"]:
+        changes["timeChunksRequired"] = wanted["timeChunksRequired"]
+    # No local due date: keep whatever deadline the task has in Reclaim
+    if wanted["due"] is not None and not _same_time(remote.get("due"), wanted["due"]):
+        changes["due"] = wanted["due"]
+    if "snoozeUntil" in wanted and not _same_time(remote.get("snoozeUntil"), wanted["snoozeUntil"]):
+        changes["snoozeUntil"] = wanted["snoozeUntil"]
+    return changes
+
+
+def live_task(remote_tasks: List[Dict[str, Any]], title: str) -> Optional[Dict[str, Any]]:
+    """The oldest task with `title` that isn't complete or archived, or None."""
+    live = [t for t in remote_tasks if t.get("title") == title and t.get("status") not in FINISHED_STATUSES]
+    return min(live, key=lambda t: str(t.get("created") or ""), default=None)
+
+
+@dataclass
+class ReconcilePlan:
+    create: List[Assignment] = field(default_factory=list)
+    # (assignment, remote task id, changed fields)
+    update: List[tuple] = field(default_factory=list)
+    # remote task ids
+    delete: List[Any] = field(default_factory=list)
+    # assignments already present remotely (their local flag gets set)
+    matched: List[Assignment] = field(default_factory=list)
+
+    def summary(self) -> str:
+        return (f"{len(self.create)} to create, {len(self.update)} to update, "
+                f"{len(self.delete)} duplicates to delete, {len(self.matched)} already in Reclaim")
+
+
+def build_plan(local: List[Assignment], remote_tasks: List[Dict[str, Any]], candidates: Optional[List[Assignment]] = None) -> ReconcilePlan:
+    """
+    Diffs local assignments (those with allocated time) against the remote
+    "[Canvas]" tasks. Only `candidates` (default: all local) may be created.
+    Open remote tasks are paired with local assignments of the same title in
+    order; open leftovers on a title that has local assignments are
+    duplicates. A finished task only stops its assignment from being created
+    again: it is never updated or deleted.
+    """
+    plan = ReconcilePlan()
+    candidate_ids = {id(a) for a in (candidates if candidates is not None else local)}
+
+    # Index remote tasks by title (oldest first, so the original survives)
+    by_title: Dict[str, List[Dict[str, Any]]] = {}
+    finished_by_title: Dict[str, List[Dict[str, Any]]] = {}
+    for task in sorted(remote_tasks, key=lambda t: str(t.get("created") or "")):
+        title = task.get("title") or ""
+        if title.startswith(TASK_PREFIX):
+            index = finished_by_title if task.get("status") in FINISHED_STATUSES else by_title
+            index.setdefault(title, []).append(task)
+
+    local_titles = set()
+    for assignment in local:
+        if not assignment.time_allocated_hours:
+            continue
+        title = task_title(assignment)
+        local_titles.add(title)
+        remaining = by_title.get(title)
+        if remaining:
+            remote = remaining.pop(0)
+            plan.matched.append(assignment)
+            changes = needs_update(assignment, remote)
+            if changes:
+                plan.update.append((assignment, remote.get("id"), changes))
+        elif finished_by_title.get(title):
+            finished_by_title[title].pop(0)
+            plan.matched.append(assignment)
+        elif id(assignment) in candidate_ids and not assignment.reclaim_synced:
+            plan.create.append(assignment)
+
+    for title in local_titles:
+        plan.delete.extend(task.get("id") for task in by_title.get(title, []))
+
+    return plan
+
+
+class ReclaimApi:
+    """Small client for the Reclaim tasks REST API."""
+
+    def __init__(self, api_key: str, http=None, base_url: str = RECLAIM_API_URL):
+        # Goes through the shared request scheduler unless a client is passed in
+        self.http = http or rate_limit.shared_http()
+        self.base_url = base_url
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+
+    def list_canvas_tasks(self) -> List[Dict[str, Any]]:
+        response = self.http.get(f"{self.base_url}/tasks", headers=self.headers,
+                                 params={"status": LISTED_STATUSES}, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return [t for t in json_codec.loads(response.content) if str(t.get("title", "")).startswith(TASK_PREFIX)]
+
+    def create_task(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        response = self.http.post(f"{self.base_url}/tasks", headers=self.headers, json=payload, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return json_codec.loads(response.content)
+
+    def update_task(self, task_id, changes: Dict[str, Any]):
+        response = self.http.patch(f"{self.base_url}/tasks/{task_id}", headers=self.headers, json=changes, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+
+    def delete_task(self, task_id):
+        response = self.http.delete(f"{self.base_url}/tasks/{task_id}", headers=self.headers, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+
+
+def execute_plan(plan: ReconcilePlan, api: ReclaimApi, budget: Optional[sync_queue.Budget] = None) -> int:
+    """
+    Runs the plan against the API, creating the most urgent tasks first
+    within `budget`. Returns the number of failed operations.
+    """
+    failures = 0
+    bar = Progress("Reclaim", "changes", len(plan.create) + len(plan.update) + len(plan.delete))
+    budget = budget or sync_queue.Budget()
+
+    for assignment in plan.matched:
+        assignment.reclaim_synced = True
+
+    queue = sync_queue.SyncQueue(plan.create)
+    while len(queue):
+        reason = budget.exhausted()
+        if reason:
+            print(f"Sync budget: {reason}; {len(queue)} later-due task(s) left for the next sync.")
+            break
+        assignment = queue.pop()
+        try:
+            with budget.spend():
+                api.create_task(task_payload(assignment))
+            assignment.reclaim_synced = True
+            print(f" Task created: {task_title(assignment)}")
+        except requests.exceptions.RequestException as e:
+            failures += 1
+            print(f"FAILURE: Could not create task '{assignment.name}': {e}")
+        bar.advance()
+
+    for assignment, task_id, changes in plan.update:
+        try:
+            api.update_task(task_id, changes)
+            print(f" Task updated: {task_title(assignment)} ({', '.join(changes)})")
+        except requests.exceptions.RequestException as e:
+            failures += 1
+            print(f"FAILURE: Could not update task '{assignment.name}': {e}")
+        bar.advance()
+
+    for task_id in plan.delete:
+        try:
+            api.delete_task(task_id)
+            print(f" Duplicate task deleted: {task_id}")
+        except requests.exceptions.RequestException as e:
+            failures += 1
+            print(f"FAILURE: Could not delete duplicate task {task_id}: {e}")
+        bar.advance()
+
+    return failures
+
+
+def reconcile(timed_assignments: List[Assignment], candidates: List[Assignment], api_key: str, http=None) -> ReconcilePlan:
+    """Lists the remote tasks once, builds the plan and executes it."""
+    api = ReclaimApi(api_key, http)
+    print("Listing existing [Canvas] tasks in Reclaim...")
+    remote_tasks = api.list_canvas_tasks()
+    plan = build_plan(timed_assignments, remote_tasks, candidates)
+    print(f"Reconcile plan: {plan.summary()}")
+    failures = execute_plan(plan, api)
+    if failures:
+        print(f"WARNING: {failures} Reclaim operations failed.")
+    for line in rate_limit.describe_metrics(getattr(api.http, "limiter", None)):
+        print(line)
+    return plan
@@ -1,5 +1,14 @@
-import json
+import os
+import sys
 import time
+import json_codec
+import stage_supervisor
+import rate_limit
+import browser_filter
+import browser_session
+import sync_queue
+from progress import Progress
+from assignment_record import load_records, dump_records
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.service import Service
@@ -10,56 +19,61 @@ from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.common.keys import Keys
 
 # --- 1. LOAD CONFIG ---
+# Only read here; checked by config_problem() when a sync actually starts,
+# so importing this module (e.g. from pipeline.py) has no side effects.
 try:
     import config
-    RECLAIM_EMAIL = config.RECLAIM_EMAIL
-    RECLAIM_PASSWORD = config.RECLAIM_PASSWORD
-    CHROME_PROFILE_PATH = config.CHROME_PROFILE_PATH
-    CHROME_PROFILE_NAME = config.CHROME_PROFILE_NAME
-
-    if not all([RECLAIM_EMAIL, RECLAIM_PASSWORD, CHROME_PROFILE_PATH]):
-        print("ERROR: Missing critical configuration in config.py.")
-        exit()
 except Exception as e:
-    print(f"FATAL ERROR: Could not load config.py: {e}")
-    exit()
+    config = None
+    CONFIG_ERROR = f"Could not load config.py: {e}"
+else:
+    CONFIG_ERROR = None
+RECLAIM_EMAIL = getattr(config, "RECLAIM_EMAIL", "")
+RECLAIM_PASSWORD = getattr(config, "RECLAIM_PASSWORD", "")
+CHROME_PROFILE_PATH = getattr(config, "CHROME_PROFILE_PATH", "")
+CHROME_PROFILE_NAME = getattr(config, "CHROME_PROFILE_NAME", "")
+# With an API key the stage reconciles through the Reclaim API instead of the browser
+RECLAIM_API_KEY = getattr(config, "RECLAIM_API_KEY", "")
+RECONCILE_MODE = bool(RECLAIM_API_KEY) and "--no-reconcile" not in sys.argv[1:]
+
+def config_problem(reconcile=RECONCILE_MODE):
+    """What is wrong with config.py for this kind of sync, or None."""
+    if CONFIG_ERROR:
+        return CONFIG_ERROR
+    if not reconcile and not all([RECLAIM_EMAIL, RECLAIM_PASSWORD, CHROME_PROFILE_PATH]):
+        return "Missing critical configuration in config.py."
+    return None
 
 # --- 2. LOAD LOCAL JSON FILES ---
 def load_json_file(filename):
     try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return json_codec.load_file(filename)
     except FileNotFoundError:
         return []
-    except json.JSONDecodeError:
+    except json_codec.JSONDecodeError:
         print(f"ERROR: File {filename} contains invalid JSON.")
         return []
 
 def save_json_file(filename, data):
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4)
+        json_codec.save_file(filename, data, indent=4)
     except Exception as e:
         print(f"ERROR: Could not save {filename}: {e}")
 
-NEW_ASSIGNMENTS = load_json_file('new_assignment_names.json')
-TIMED_ASSIGNMENTS = load_json_file('timed_assignments.json')
+TIMED_FILE = 'timed_assignments.json'
 
-tasks_to_sync = [
-    task for task in TIMED_ASSIGNMENTS 
-    if not task.get('reclaim_synced', False) 
-    and task.get('time_allocated_hours')
-    and any(task['name'] == n['name'] for n in NEW_ASSIGNMENTS)
-]
-
-if not tasks_to_sync:
-    print("No new tasks to sync.")
-    exit()
-
-print(f"Found {len(tasks_to_sync)} tasks to sync.")
+def load_tasks(state_dir="."):
+    """
+    Returns (every timed assignment, the ones to create in Reclaim): all
+    that aren't synced yet, including those a budget or failure left over
+    from an earlier run.
+    """
+    timed = load_records(load_json_file(os.path.join(state_dir, TIMED_FILE)))
+    return timed, sync_queue.unsynced(timed)
 
 # --- 3. SELENIUM SETUP ---
-def setup_driver():
+def setup_driver(debugging_port=None):
+    """Starts Chrome. With a debugging port it is left running after this process exits (pre-warm)."""
     chrome_options = Options()
     chrome_options.add_argument(f"user-data-dir={CHROME_PROFILE_PATH}")
     chrome_options.add_argument(f"profile-directory={CHROME_PROFILE_NAME}")
@@ -68,19 +82,43 @@ def setup_driver():
     chrome_options.add_argument("--disable-extensions")
     chrome_options.add_argument("--disable-popup-blocking")
     chrome_options.add_argument("--disable-gpu")
+    if debugging_port:
+        chrome_options.add_argument(f"--remote-debugging-port={debugging_port}")
+        chrome_options.add_experimental_option("detach", True)
+    browser_filter.prepare_options(chrome_options)
 
     service = Service(ChromeDriverManager().install())
     try:
         driver = webdriver.Chrome(service=service, options=chrome_options)
+        # Block images, fonts and third-party scripts the task form doesn't need
+        browser_filter.install(driver)
         return driver
     except Exception as e:
         print(f"ERROR: Chrome failed to start. {e}")
         exit()
 
-driver = setup_driver()
-# REDUCE GLOBAL WAIT TIME FROM 20 TO 10 SECONDS FOR FASTER INTERACTIONS
-wait = WebDriverWait(driver, 10) 
+def attach_driver(debugger_address):
+    """Connects to an already running (pre-warmed) Chrome. Raises if it can't."""
+    chrome_options = Options()
+    chrome_options.debugger_address = debugger_address
+    browser_filter.prepare_options(chrome_options)
+    service = Service(ChromeDriverManager().install())
+    driver = webdriver.Chrome(service=service, options=chrome_options)
+    browser_filter.install(driver)
+    return driver
+
+def browser_pid(driver):
+    try:
+        processes = driver.execute_cdp_cmd("SystemInfo.getProcessInfo", {}).get("processInfo", [])
+        return next((p["id"] for p in processes if p.get("type") == "browser"), None)
+    except Exception:
+        return None
+
+# Created in main() only when there is something to sync
+driver = None
+wait = None
 total_synced = 0
+network_stats = browser_filter.NetworkStats()
 
 # --- 4. RECLAIM LOGIN ---
 def reclaim_login(driver):
@@ -103,6 +141,80 @@ def reclaim_login(driver):
         print("Already logged in.")
 
 # --- 5. CREATE TASK FUNCTION ---
+# Pause after each task's modal has closed, so the planner has re-rendered
+# before the next "New Task" click (pacing between tasks is rate_limit's job)
+UI_SETTLE_SECONDS = 0.5
+TITLE_FIELD = (By.XPATH, "//input[@placeholder='Task name...']")
+# label -> (CSS selector for the one-shot fill, locator for the keystroke fallback)
+FORM_FIELDS = {
+    "Task Name": ("input[placeholder='Task name...']", TITLE_FIELD),
+    "Duration": ("input[name='durationMs']", (By.NAME, "durationMs")),
+    "Start Date": ("input[name='snoozeUntil']", (By.NAME, "snoozeUntil")),
+    "Due Date": ("input[name='due']", (By.NAME, "due")),
+}
+
+# Sets every field through the native value setter (so React sees the change),
+# fires input/change, then reads the values back after the page re-renders.
+FILL_FORM_SCRIPT = """
+const fields = arguments[0];
+const done = arguments[arguments.length - 1];
+const setValue = Object.getOwnPropertyDescriptor(HTMLInputElement.prototype, 'value').set;
+const inputs = {};
+for (const [label, selector, value] of fields) {
+    const input = document.querySelector(selector);
+    inputs[label] = input;
+    if (!input) continue;
+    input.focus();
+    setValue.call(input, value);
+    input.dispatchEvent(new Event('input', {bubbles: true}));
+    input.dispatchEvent(new Event('change', {bubbles: true}));
+    input.blur();
+}
+setTimeout(() => {
+    const values = {};
+    for (const label in inputs) values[label] = inputs[label] ? inputs[label].value : null;
+    done(values);
+}, 50);
+"""
+
+# Fields whose one-shot fill didn't stick; they are typed for the rest of the run
+keystroke_fields = set()
+
+def values_match(expected, actual):
+    if actual is None:
+        return False
+    return " ".join(str(actual).split()) == " ".join(str(expected).split())
+
+def fill_form(values):
+    """
+    Fills the fields in one script call. Returns the labels whose read-back
+    didn't match (those still need typing).
+    """
+    fields = [(label, FORM_FIELDS[label][0], value) for label, value in values.items()
+              if label not in keystroke_fields]
+    if not fields:
+        return set(values)
+    try:
+        actual = driver.execute_async_script(FILL_FORM_SCRIPT, fields) or {}
+    except Exception as e:
+        print(f"WARNING: One-shot form fill failed, typing instead. Error: {e}")
+        return set(values)
+    failed = {label for label, _, value in fields if not values_match(value, actual.get(label))}
+    keystroke_fields.update(failed)
+    return failed | (set(values) - {label for label, _, _ in fields})
+
+def type_field(label, value):
+    """Keystroke fallback: click, select all, delete, type."""
+    try:
+        field_input = wait.until(EC.presence_of_element_located(FORM_FIELDS[label][1]))
+        field_input.click()
+        field_input.send_keys(Keys.CONTROL + "a")
+        field_input.send_keys(Keys.DELETE)
+        field_input.send_keys(value)
+        print(f" {label} typed: {value}")
+    except Exception as e:
+        print(f"WARNING: Failed to find/fill {label} input. Error: {e}")
+
 def create_reclaim_task(task):
     global total_synced
 
@@ -112,56 +224,23 @@ def create_reclaim_task(task):
     wait.until(EC.element_to_be_clickable((By.ID, "QuickCreateTask"))).click() 
     print("Clicked New Task button.")
 
-    # 1. Task Title
-    task_title_input = wait.until(
-        EC.presence_of_element_located((By.XPATH, "//input[@placeholder='Task name...']"))
-    )
-    task_name = f"[Canvas] {task['name']}"
-    task_title_input.send_keys(task_name)
-    print(f" Task Name entered: {task_name}")
+    # One wait for the form, then all fields in a single round trip
+    wait.until(EC.presence_of_element_located(TITLE_FIELD))
+    task_name = f"[Canvas] {task.name}"
+    values = {"Task Name": task_name, "Duration": str(task.time_allocated_hours)}
+    if task.start_at:
+        values["Start Date"] = task.date_str('start_at')
+    if task.due_at:
+        values["Due Date"] = task.date_str('due_at')
 
-    # 2. Duration (Robust Clear)
-    try:
-        duration_input = wait.until(
-            EC.presence_of_element_located((By.NAME, "durationMs"))
-        )
-        duration_input.click()
-        duration_input.send_keys(Keys.CONTROL + "a")
-        duration_input.send_keys(Keys.DELETE)
-        duration_input.send_keys(str(task['time_allocated_hours']))
-        print(f" Duration entered: {task['time_allocated_hours']} hours")
-    except Exception as e:
-        print(f"WARNING: Failed to find/fill Duration input. Error: {e}")
+    failed = fill_form(values)
+    for label, value in values.items():
+        if label in failed:
+            type_field(label, value)
+        else:
+            print(f" {label} entered: {value}")
 
-    # 3. Schedule After / Start Date
-    if task.get('start_at'):
-        try:
-            start_input = wait.until(
-                EC.presence_of_element_located((By.NAME, "snoozeUntil"))
-            )
-            start_input.click()
-            start_input.send_keys(Keys.CONTROL + "a")
-            start_input.send_keys(Keys.DELETE)
-            start_input.send_keys(task['start_at'])
-            print(f" Start Date entered: {task['start_at']}")
-        except Exception as e:
-            print(f"WARNING: Failed to find/fill Start Date input. Error: {e}")
-
-    # 4. Due Date
-    if task.get('due_at'):
-        try:
-            due_date_input = wait.until(
-                EC.presence_of_element_located((By.NAME, "due"))
-            )
-            due_date_input.click()
-            due_date_input.send_keys(Keys.CONTROL + "a")
-            due_date_input.send_keys(Keys.DELETE)
-            due_date_input.send_keys(task['due_at'])
-            print(f" Due Date entered: {task['due_at']}")
-        except Exception as e:
-            print(f"WARNING: Failed to find/fill Due Date input. Error: {e}")
-
-    # 5. Click safe spot inside form to close date pickers
+    # 2. Click safe spot inside form to close date pickers
     try:
         form_safe_area = driver.find_element(By.CSS_SELECTOR, "div.AddTaskForm_section__zJF4U")
         form_safe_area.click()
@@ -169,7 +248,7 @@ def create_reclaim_task(task):
     except Exception as e:
         print(f"WARNING: Could not click safe area. Error: {e}")
 
-    # 6. Click 'Create' Button and press ESC immediately after
+    # 3. Click 'Create' Button and press ESC immediately after
     try:
         create_button = wait.until(
             EC.element_to_be_clickable(
@@ -190,10 +269,10 @@ def create_reclaim_task(task):
         wait.until(EC.invisibility_of_element_located((By.XPATH, "//input[@placeholder='Task name...']")))
         print(f" Task successfully created: {task_name}")
 
-        task['reclaim_synced'] = True
+        task.reclaim_synced = True
         total_synced += 1
     except Exception as e:
-        print(f"FAILURE: Could not create task '{task['name']}': {e}")
+        print(f"FAILURE: Could not create task '{task.name}': {e}")
         # Attempt to close failed modal
         try:
             close_button = driver.find_element(By.XPATH, "//button[@aria-label='Close']")
@@ -202,19 +281,131 @@ def create_reclaim_task(task):
             print("Attempted to close failed modal.")
         except:
             pass
+    time.sleep(UI_SETTLE_SECONDS)
 
 # --- 6. MAIN EXECUTION ---
-def main():
-    reclaim_login(driver)
-    for task in tasks_to_sync:
+def start_session():
+    """
+    Sets the module's driver/wait, logged into Reclaim: the pre-warmed Chrome
+    if one is waiting, otherwise a newly launched one.
+    """
+    global driver, wait
+    session = browser_session.load()
+    if browser_session.is_alive(session):
         try:
-            create_reclaim_task(task)
-            time.sleep(1)
+            driver = attach_driver(session["debugger_address"])
+            print("Using the pre-warmed browser session.")
         except Exception as e:
-            print(f"FAILURE: Could not create task '{task['name']}': {e}")
+            print(f"WARNING: Could not attach to the pre-warmed browser, starting a new one. Error: {e}")
+            browser_session.discard()
+    elif session is not None:
+        browser_session.clear()
+    if driver is None:
+        driver = setup_driver()
+    # REDUCE GLOBAL WAIT TIME FROM 20 TO 10 SECONDS FOR FASTER INTERACTIONS
+    wait = WebDriverWait(driver, 10) 
+    if not driver.find_elements(By.ID, "QuickCreateTask"):
+        reclaim_login(driver)
+    network_stats.collect(driver)
+    return driver
 
-    save_json_file('timed_assignments.json', TIMED_ASSIGNMENTS)
-    driver.quit()
+def end_session():
+    """Prints the network report and closes Chrome (including a pre-warmed one)."""
+    global driver
+    if driver is not None:
+        network_stats.collect(driver)
+        print(network_stats.summary())
+        driver.quit()
+        driver = None
+    # quit() only disconnects from a browser it attached to
+    browser_session.discard()
+
+def prewarm():
+    """Launches Chrome and logs in ahead of time, then leaves it running for the sync stage."""
+    global driver, wait
+    if browser_session.is_alive(browser_session.load()):
+        print("A pre-warmed browser is already running.")
+        return
+    port = browser_session.free_port()
+    driver = setup_driver(debugging_port=port)
+    # Recorded before logging in: if this process is killed during the login
+    # (e.g. the GUI's PREWARM_WAIT runs out), discard() can still close the
+    # detached Chrome instead of leaving it holding the profile
+    browser_session.save(f"127.0.0.1:{port}", browser_pid(driver))
+    wait = WebDriverWait(driver, 10)
+    try:
+        reclaim_login(driver)
+    except Exception as e:
+        print(f"WARNING: Pre-warm login did not finish ({e}); the sync stage will retry it.")
+        return
+    print("Browser pre-warmed and logged in.")
+
+def run_reconcile(timed_assignments, tasks_to_sync):
+    """Diffs against the tasks already in Reclaim and applies only the needed changes."""
+    import requests
+    import reclaim_reconcile
+    try:
+        plan = reclaim_reconcile.reconcile(timed_assignments, tasks_to_sync, RECLAIM_API_KEY)
+    except requests.exceptions.RequestException as e:
+        print(f"FATAL ERROR: Could not reach the Reclaim API: {e}")
+        sys.exit(1)
+    save_json_file(TIMED_FILE, dump_records(timed_assignments))
+    created = sum(1 for task in plan.create if task.reclaim_synced)
+    print(f"\n--- Reconcile Complete ---\nCreated: {created}, updated: {len(plan.update)}, "
+          f"duplicates deleted: {len(plan.delete)}")
+
+def main():
+    problem = config_problem()
+    if problem:
+        print(f"FATAL ERROR: {problem}")
+        exit()
+
+    if "--prewarm" in sys.argv[1:]:
+        if not RECONCILE_MODE:
+            prewarm()
+        return
+
+    timed_assignments, tasks_to_sync = load_tasks()
+    if RECONCILE_MODE:
+        browser_session.discard()
+        run_reconcile(timed_assignments, tasks_to_sync)
+        return
+
+    if not tasks_to_sync:
+        # Close a browser that was pre-warmed for nothing
+        browser_session.discard()
+        print("No new tasks to sync.")
+        return
+
+    print(f"Found {len(tasks_to_sync)} tasks to sync.")
+
+    start_session()
+    bar = Progress("Reclaim", "tasks", len(tasks_to_sync))
+    # Most urgent first, so a cut-short run has already synced what is due soonest
+    queue = sync_queue.SyncQueue(tasks_to_sync)
+    budget = sync_queue.Budget()
+    try:
+        while len(queue):
+            if stage_supervisor.cancel_requested():
+                print("Cancel requested: stopping after the tasks created so far.")
+                break
+            reason = budget.exhausted()
+            if reason:
+                print(f"Sync budget: {reason}; {len(queue)} later-due task(s) left for the next sync.")
+                break
+            task = queue.pop()
+            try:
+                # Paced by the shared scheduler instead of a fixed sleep
+                with rate_limit.shared_scheduler().slot(rate_limit.BROWSER_HOST), budget.spend():
+                    create_reclaim_task(task)
+            except Exception as e:
+                print(f"FAILURE: Could not create task '{task.name}': {e}")
+            network_stats.collect(driver)
+            bar.advance()
+    finally:
+        # The synced flags of the tasks created so far are kept even if stopped early
+        save_json_file(TIMED_FILE, dump_records(timed_assignments))
+        end_session()
     print(f"\n--- Sync Complete ---\nTotal tasks synced: {total_synced}")
 
 if __name__ == "__main__":
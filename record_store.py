@@ -0,0 +1,151 @@
+"""
+Row-level access to the JSON data files for the Data Files window.
+
+A data file is either a list of assignment records or an object of time
+rules; both are exposed as rows (list index or rule key -> value). The
+viewer asks for one page of matching row ids at a time, and an edit
+replaces or deletes a single row after validating just that row. The file
+is only parsed when its view is first opened, and a write is refused if the
+file changed on disk since it was read (e.g. by a sync running meanwhile).
+"""
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import json_codec
+
+# Columns shown for each kind of file (other fields are visible when editing a row)
+RECORD_COLUMNS = ("name", "course_name", "due_at", "time_allocated_hours", "reclaim_synced")
+RULE_COLUMNS = ("time_taken",)
+
+RECORD_FILTERS: Dict[str, Optional[Callable[[Any], bool]]] = {
+    "All": None,
+    "Not synced": lambda v: not v.get("reclaim_synced"),
+    "Synced": lambda v: bool(v.get("reclaim_synced")),
+    "No time allocated": lambda v: v.get("time_allocated_hours") is None,
+}
+RULE_FILTERS: Dict[str, Optional[Callable[[Any], bool]]] = {
+    "All": None,
+    "No time set": lambda v: v.get("time_taken") is None,
+}
+
+
+class StaleFileError(Exception):
+    """The file was changed by something else after it was loaded."""
+
+
+def _search_text(row_id, value) -> str:
+    # Only scalar fields are searched, so big nested blobs don't slow it down
+    parts = [str(row_id)] if isinstance(row_id, str) else []
+    if isinstance(value, dict):
+        parts.extend(str(v) for v in value.values() if isinstance(v, (str, int, float)))
+    else:
+        parts.append(str(value))
+    return " ".join(parts).lower()
+
+
+def validate_row(is_rules: bool, value: Any):
+    """Raises ValueError if a single row is not a valid record/rule."""
+    if not isinstance(value, dict):
+        raise ValueError("Each entry must be a JSON object ({...}).")
+    if is_rules:
+        time_taken = value.get("time_taken")
+        if time_taken is not None and (not isinstance(time_taken, (int, float)) or time_taken < 0):
+            raise ValueError("'time_taken' must be a non-negative number of hours.")
+    elif not isinstance(value.get("name"), str):
+        raise ValueError("Assignment records need a 'name' string.")
+
+
+class RecordStore:
+    def __init__(self, path: Optional[str], data: Any = None):
+        """Backed by `path`, or read-only over `data` when path is None."""
+        self.path = path
+        self.read_only = path is None
+        self._data = data
+        self._signature = None
+
+    def _file_signature(self):
+        if not os.path.exists(self.path):
+            return None
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    # --- loading ---
+    def load(self, force: bool = False):
+        """(Re)reads the file if it is not loaded yet or changed on disk."""
+        if self.read_only:
+            return
+        signature = self._file_signature()
+        if self._data is not None and not force and signature == self._signature:
+            return
+        if signature is None:
+            self._data = {} if self.is_rules_path() else []
+        else:
+            self._data = json_codec.load_file(self.path)
+        self._signature = signature
+
+    def is_rules_path(self) -> bool:
+        return self.path is not None and os.path.basename(self.path) == "assignment_time_rules.json"
+
+    @property
+    def is_rules(self) -> bool:
+        return isinstance(self._data, dict)
+
+    @property
+    def columns(self) -> Tuple[str, ...]:
+        return RULE_COLUMNS if self.is_rules else RECORD_COLUMNS
+
+    @property
+    def filters(self) -> Dict[str, Optional[Callable[[Any], bool]]]:
+        return RULE_FILTERS if self.is_rules else RECORD_FILTERS
+
+    # --- reading ---
+    def __len__(self) -> int:
+        return len(self._data or ())
+
+    def query(self, search: str = "", filter_name: str = "All") -> List[Any]:
+        """Returns the ids of the rows matching the search text and filter."""
+        data = self._data if self._data is not None else []
+        rows = data.items() if self.is_rules else enumerate(data)
+        predicate = self.filters.get(filter_name)
+        search = search.strip().lower()
+        matches = []
+        for row_id, value in rows:
+            if predicate is not None and not (isinstance(value, dict) and predicate(value)):
+                continue
+            if search and search not in _search_text(row_id, value):
+                continue
+            matches.append(row_id)
+        return matches
+
+    def get(self, row_id) -> Any:
+        return self._data[row_id]
+
+    def cells(self, row_id) -> Tuple[str, ...]:
+        """Display values of a row for the viewer's columns."""
+        value = self._data[row_id]
+        value = value if isinstance(value, dict) else {}
+        cells = tuple("" if value.get(c) is None else str(value.get(c)) for c in self.columns)
+        return ((str(row_id),) + cells) if self.is_rules else cells
+
+    # --- writing ---
+    def _check_writable(self):
+        if self.read_only:
+            raise PermissionError("This view is read-only.")
+        if self._file_signature() != self._signature:
+            raise StaleFileError(f"{os.path.basename(self.path)} was changed since it was opened. Refresh and try again.")
+
+    def _save(self):
+        json_codec.save_file(self.path, self._data)
+        self._signature = self._file_signature()
+
+    def update(self, row_id, value: Any):
+        """Validates and replaces a single row, then writes the file."""
+        self._check_writable()
+        validate_row(self.is_rules, value)
+        self._data[row_id] = value
+        self._save()
+
+    def delete(self, row_id):
+        self._check_writable()
+        del self._data[row_id]
+        self._save()
@@ -0,0 +1,198 @@
+"""
+Reverse index from time-rule groups to the assignments timed by them.
+
+INDEX_FILE maps each group_key to the links (html_url) of its timed
+assignments, plus the time_taken the group had when those assignments were
+last timed. When a rule's time_taken is edited (in the Data Files window
+or by hand), propagate() finds the changed groups by comparing the rules
+with those recorded times and re-times exactly the group's assignments;
+tasks already in Reclaim are updated through the API (one listing call,
+then one update per affected assignment with an open task of its title;
+completed and archived tasks are left as they are). A group whose tasks
+couldn't be updated (failure, or no RECLAIM_API_KEY) is tried again on the
+next run.
+
+The index is kept up to date by the allocator and the streaming pipeline
+whenever they save timed_assignments.json. Recorded times are only moved
+forward by propagate(), so an edit made before the next sync is still
+picked up after the allocator has re-timed the assignments locally.
+
+Usage: python rule_index.py [--rebuild]
+"""
+import argparse
+import os
+from typing import Any, Dict, List, Optional
+
+import json_codec
+from assignment_record import Assignment, load_records, dump_records
+
+try:
+    import config
+except ImportError:
+    config = None
+
+INDEX_FILE = "rule_index.json"
+RULES_FILE = "assignment_time_rules.json"
+TIMED_FILE = "timed_assignments.json"
+
+
+class RuleIndex:
+    def __init__(self, groups: Optional[Dict[str, List[str]]] = None,
+                 rule_times: Optional[Dict[str, Any]] = None):
+        # group_key -> html_urls of its timed assignments
+        self.groups: Dict[str, List[str]] = groups or {}
+        # group_key -> time_taken its assignments were last timed (and synced) with
+        self.rule_times: Dict[str, Any] = rule_times or {}
+
+    @classmethod
+    def load(cls, path: str = INDEX_FILE) -> Optional["RuleIndex"]:
+        try:
+            data = json_codec.load_file(path)
+        except (FileNotFoundError, json_codec.JSONDecodeError):
+            return None
+        return cls(data.get("groups"), data.get("rule_times"))
+
+    def save(self, path: str = INDEX_FILE):
+        json_codec.save_file(path, {"groups": self.groups, "rule_times": self.rule_times})
+
+    def refresh(self, timed: List[Assignment], time_rules: Dict[str, Any]):
+        """Re-derives group membership from the timed records; keeps recorded times of known groups."""
+        groups: Dict[str, List[str]] = {}
+        for assignment in timed:
+            if assignment.group_key and assignment.html_url:
+                groups.setdefault(assignment.group_key, []).append(assignment.html_url)
+        self.groups = groups
+        self.rule_times = {
+            key: self.rule_times[key] if key in self.rule_times else _time_taken(time_rules, key)
+            for key in groups
+        }
+
+    def changed_groups(self, time_rules: Dict[str, Any]) -> Dict[str, Any]:
+        """group_key -> new time_taken, for indexed groups whose rule no longer matches."""
+        changed = {}
+        for key, recorded in self.rule_times.items():
+            current = _time_taken(time_rules, key)
+            if current is not None and current != recorded:
+                changed[key] = current
+        return changed
+
+
+def _time_taken(time_rules: Dict[str, Any], key: str):
+    return (time_rules.get(key) or {}).get("time_taken")
+
+
+def update_index(state_dir: str, timed: List[Assignment], time_rules: Dict[str, Any]):
+    """Called after timed_assignments.json is saved, to keep the index in step with it."""
+    path = os.path.join(state_dir, INDEX_FILE)
+    index = RuleIndex.load(path) or RuleIndex()
+    index.refresh(timed, time_rules)
+    index.save(path)
+
+
+def propagate(state_dir: str = ".", api_key: Optional[str] = None, http=None) -> int:
+    """
+    Applies edited rules to the assignments of the changed groups only, and
+    updates their Reclaim tasks. Returns the number of assignments re-timed.
+    """
+    api_key = api_key if api_key is not None else getattr(config, "RECLAIM_API_KEY", "")
+    index_path = os.path.join(state_dir, INDEX_FILE)
+    timed_path = os.path.join(state_dir, TIMED_FILE)
+    try:
+        time_rules = json_codec.load_file(os.path.join(state_dir, RULES_FILE))
+        timed = load_records(json_codec.load_file(timed_path))
+    except (FileNotFoundError, json_codec.JSONDecodeError):
+        print("No rules or timed assignments yet. Nothing to update.")
+        return 0
+
+    index = RuleIndex.load(index_path)
+    if index is None:
+        # First run: nothing to compare with yet
+        update_index(state_dir, timed, time_rules)
+        print(f"Built {INDEX_FILE}; later rule edits will be applied to their groups.")
+        return 0
+
+    changed = index.changed_groups(time_rules)
+    if not changed:
+        print("No rule changes to apply.")
+        return 0
+
+    by_link = {t.html_url: t for t in timed}
+    affected: List[Assignment] = []
+    for key, hours in changed.items():
+        for link in index.groups.get(key, []):
+            task = by_link.get(link)
+            if task is not None:
+                task.time_allocated_hours = hours
+                affected.append(task)
+        print(f"Rule '{key}': {index.rule_times.get(key)} -> {hours} hours ({len(index.groups.get(key, []))} assignments)")
+
+    failed = set()
+    if affected and api_key:
+        # Matched by title against the open Reclaim tasks, not the local flag
+        failed = update_remote(affected, api_key, http)
+    else:
+        synced = [t for t in affected if t.reclaim_synced]
+        if synced:
+            print(f"WARNING: {len(synced)} synced task(s) keep their old duration in Reclaim: "
+                  "set RECLAIM_API_KEY to update them automatically.")
+            failed = {t.group_key for t in synced}
+
+    json_codec.save_file(timed_path, dump_records(timed))
+    for key, hours in changed.items():
+        # A group whose Reclaim tasks weren't updated is retried next time
+        if key not in failed:
+            index.rule_times[key] = hours
+    index.save(index_path)
+    print(f"Re-timed {len(affected)} assignment(s) in {len(changed)} group(s).")
+    return len(affected)
+
+
+def update_remote(tasks: List[Assignment], api_key: str, http=None) -> set:
+    """Updates the open Reclaim tasks of `tasks`. Returns the group keys with a failed update."""
+    import requests
+    import reclaim_reconcile
+
+    api = reclaim_reconcile.ReclaimApi(api_key, http)
+    remote_tasks = api.list_canvas_tasks()
+    titles = {reclaim_reconcile.task_title(task) for task in tasks}
+    # Completed and archived tasks keep the duration they were done with
+    remote_by_title = {title: reclaim_reconcile.live_task(remote_tasks, title) for title in titles}
+
+    failed = set()
+    for task in tasks:
+        remote = remote_by_title.get(reclaim_reconcile.task_title(task))
+        if remote is None:
+            continue
+        changes = reclaim_reconcile.needs_update(task, remote)
+        if not changes:
+            continue
+        try:
+            api.update_task(remote.get("id"), changes)
+            print(f" Task updated: {reclaim_reconcile.task_title(task)} ({', '.join(changes)})")
+        except requests.exceptions.RequestException as e:
+            failed.add(task.group_key)
+            print(f"FAILURE: Could not update task '{task.name}': {e}")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply edited time rules to the assignments they cover.")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Rebuild the index from timed_assignments.json (recorded times are kept)")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        try:
+            time_rules = json_codec.load_file(RULES_FILE)
+            timed = load_records(json_codec.load_file(TIMED_FILE))
+        except (FileNotFoundError, json_codec.JSONDecodeError):
+            print("No rules or timed assignments yet.")
+            return
+        update_index(".", timed, time_rules)
+        print(f"Rebuilt {INDEX_FILE}.")
+        return
+    propagate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Versioned, content-addressed snapshots of the sync state files.
+
+Replaces the single literal copy in prev_seen_assignments.json. Each entry of
+a JSON list (or each key of a JSON object) is stored once as an object named
+by its hash under sync_history/objects/, and a snapshot is one line in
+sync_history/snapshots.jsonl listing the hashes of each file's entries. A new
+snapshot therefore only writes the entries that changed since any earlier
+snapshot, plus a short hash list; restoring any snapshot rebuilds the files
+from their objects. Old snapshots beyond MAX_SNAPSHOTS are pruned and objects
+no longer referenced are deleted.
+
+Usage: python snapshots.py list | create | restore <id>
+"""
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import json_codec
+
+HISTORY_DIR = "sync_history"
+MANIFEST_FILE = "snapshots.jsonl"
+MAX_SNAPSHOTS = 20
+# Files captured by default: the working set, the timed list and the rules
+DEFAULT_FILES = ("seen_assignments.json", "timed_assignments.json", "assignment_time_rules.json")
+HASH_LENGTH = 20 # hex chars of sha256 kept per object (80 bits)
+
+
+class SnapshotStore:
+    def __init__(self, state_dir: str = ".", max_snapshots: int = MAX_SNAPSHOTS):
+        self.state_dir = state_dir
+        self.history_dir = os.path.join(state_dir, HISTORY_DIR)
+        self.objects_dir = os.path.join(self.history_dir, "objects")
+        self.manifest_path = os.path.join(self.history_dir, MANIFEST_FILE)
+        self.max_snapshots = max_snapshots
+
+    # --- objects ---
+    def _object_path(self, digest: str) -> str:
+        # Two-character fan-out directories, like git, so no folder gets huge
+        return os.path.join(self.objects_dir, digest[:2], digest[2:] + ".json")
+
+    def _put_object(self, value: Any) -> str:
+        # Canonical encoding so identical entries always hash the same
+        data = json.dumps(value, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+        return digest
+
+    def _get_object(self, digest: str) -> Any:
+        with open(self._object_path(digest), "rb") as f:
+            return json_codec.loads(f.read())
+
+    # --- manifest ---
+    def list_snapshots(self) -> List[Dict[str, Any]]:
+        """Returns the snapshot manifest entries, oldest first."""
+        if not os.path.exists(self.manifest_path):
+            return []
+        snapshots = []
+        with open(self.manifest_path, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        snapshots.append(json_codec.loads(line))
+                    except json_codec.JSONDecodeError:
+                        continue
+        return snapshots
+
+    def _write_manifest(self, snapshots: List[Dict[str, Any]]):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for snapshot in snapshots:
+                f.write(json_codec.dumps(snapshot, indent=None) + "\n")
+        os.replace(tmp_path, self.manifest_path)
+
+    def get_snapshot(self, snapshot_id: int) -> Optional[Dict[str, Any]]:
+        for snapshot in self.list_snapshots():
+            if snapshot["id"] == snapshot_id:
+                return snapshot
+        return None
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        snapshots = self.list_snapshots()
+        return snapshots[-1] if snapshots else None
+
+    # --- create / restore ---
+    def create(self, files=DEFAULT_FILES, label: str = "") -> Optional[Dict[str, Any]]:
+        """Snapshots the given files (missing/corrupt ones are skipped). Returns the entry."""
+        contents = {}
+        for filename in files:
+            try:
+                contents[filename] = json_codec.load_file(os.path.join(self.state_dir, filename))
+            except (FileNotFoundError, json_codec.JSONDecodeError):
+                continue
+        return self.create_from_data(contents, label)
+
+    def create_from_data(self, contents: Dict[str, Any], label: str = "") -> Optional[Dict[str, Any]]:
+        """Snapshots already loaded data, keyed by file name. Unchanged state is not re-recorded."""
+        entry_files = {}
+        for filename, data in contents.items():
+            if isinstance(data, dict):
+                entry_files[filename] = {"type": "dict", "chunks": [self._put_object([k, v]) for k, v in data.items()]}
+            elif isinstance(data, list):
+                entry_files[filename] = {"type": "list", "chunks": [self._put_object(v) for v in data]}
+
+        if not entry_files:
+            return None
+
+        snapshots = self.list_snapshots()
+        latest = snapshots[-1] if snapshots else None
+        if latest and latest.get("files") == entry_files:
+            # Nothing changed since the last snapshot
+            return latest
+
+        entry = {
+            "id": (latest["id"] + 1) if latest else 1,
+            "time": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "label": label,
+            "files": entry_files,
+        }
+        os.makedirs(self.history_dir, exist_ok=True)
+        with open(self.manifest_path, "a", encoding="utf-8") as f:
+            f.write(json_codec.dumps(entry, indent=None) + "\n")
+        snapshots.append(entry)
+
+        if len(snapshots) > self.max_snapshots:
+            self.prune(snapshots)
+        return entry
+
+    def materialize(self, snapshot: Dict[str, Any], filename: str) -> Any:
+        """Rebuilds one file's data from a snapshot."""
+        info = snapshot["files"].get(filename)
+        if info is None:
+            return None
+        values = [self._get_object(digest) for digest in info["chunks"]]
+        if info["type"] == "dict":
+            return {key: value for key, value in values}
+        return values
+
+    def restore(self, snapshot_id: int, files=None) -> List[str]:
+        """
+        Overwrites the state files (default: every file in the snapshot) with
+        the given snapshot. Returns the restored file names.
+        """
+        snapshot = self.get_snapshot(snapshot_id)
+        if snapshot is None:
+            raise KeyError(f"No snapshot with id {snapshot_id}")
+        restored = []
+        for filename in snapshot["files"]:
+            if files is not None and filename not in files:
+                continue
+            data = self.materialize(snapshot, filename)
+            json_codec.save_file(os.path.join(self.state_dir, filename), data)
+            restored.append(filename)
+        return restored
+
+    # --- retention ---
+    def prune(self, snapshots: Optional[List[Dict[str, Any]]] = None):
+        """Keeps the newest max_snapshots entries and deletes unreferenced objects."""
+        snapshots = snapshots if snapshots is not None else self.list_snapshots()
+        kept = snapshots[-self.max_snapshots:]
+        self._write_manifest(kept)
+
+        referenced = set()
+        for snapshot in kept:
+            for info in snapshot["files"].values():
+                referenced.update(info["chunks"])
+
+        if not os.path.isdir(self.objects_dir):
+            return
+        for prefix in os.listdir(self.objects_dir):
+            folder = os.path.join(self.objects_dir, prefix)
+            for name in os.listdir(folder):
+                if prefix + name[:-len(".json")] not in referenced:
+                    os.remove(os.path.join(folder, name))
+            if not os.listdir(folder):
+                os.rmdir(folder)
+
+
+def describe(snapshot: Dict[str, Any]) -> str:
+    """One-line human readable summary of a snapshot."""
+    counts = ", ".join(f"{name}: {len(info['chunks'])}" for name, info in snapshot["files"].items())
+    label = f" [{snapshot['label']}]" if snapshot.get("label") else ""
+    return f"#{snapshot['id']}  {snapshot['time']}{label}  ({counts})"
+
+
+if __name__ == "__main__":
+    store = SnapshotStore()
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if command == "create":
+        entry = store.create(label="manual")
+        print(describe(entry) if entry else "Nothing to snapshot.")
+    elif command == "restore" and len(sys.argv) > 2:
+        print(f"Restored: {', '.join(store.restore(int(sys.argv[2])))}")
+    else:
+        for snapshot in store.list_snapshots():
+            print(describe(snapshot))
@@ -0,0 +1,158 @@
+"""
+Runs the sync stages as supervised subprocesses.
+
+stdout and stderr are each drained by their own thread into one queue, so a
+stage that writes a lot to stderr can't block on a full pipe while the
+caller is still reading stdout. Each stage can have a deadline (total
+seconds) and an idle timeout (seconds without any output, e.g. a hung Chrome
+or Canvas request); the caller can also cancel it.
+
+Stopping is cooperative first: a cancel file is written, which the stage
+scripts check between items (see cancel_requested) so they can save what
+they have done and exit. If the stage is still running after GRACE_SECONDS
+it is terminated, then killed.
+"""
+import os
+import queue
+import subprocess
+import threading
+import time
+from typing import Iterator, List, Optional, Tuple
+
+CANCEL_FILE = ".sync_cancel"
+GRACE_SECONDS = 10 # Time a stage gets to save its progress after a cancel request
+KILL_SECONDS = 5 # Time between terminate() and kill()
+POLL_SECONDS = 0.5
+
+# Reasons a stage was stopped
+CANCELLED = "cancelled"
+TIMED_OUT = "timed out"
+IDLE = "stopped responding"
+
+
+def cancel_requested(state_dir: str = ".") -> bool:
+    """True once the supervisor asked the running stage to stop."""
+    return os.path.exists(os.path.join(state_dir, CANCEL_FILE))
+
+
+def request_cancel(state_dir: str = "."):
+    with open(os.path.join(state_dir, CANCEL_FILE), "w", encoding="utf-8") as f:
+        f.write(str(time.time()))
+
+
+def clear_cancel(state_dir: str = "."):
+    try:
+        os.remove(os.path.join(state_dir, CANCEL_FILE))
+    except FileNotFoundError:
+        pass
+
+
+class StageRun:
+    """One running stage. Iterate lines() for its output, then check stop_reason/returncode."""
+
+    def __init__(self, args: List[str], deadline: Optional[float] = None, idle_timeout: Optional[float] = None,
+                 stdin: bool = False, state_dir: str = ".", env: Optional[dict] = None):
+        self.state_dir = state_dir
+        clear_cancel(state_dir)
+        self.process = subprocess.Popen(args,
+                                        stdin=subprocess.PIPE if stdin else None,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE,
+                                        text=True,
+                                        bufsize=1,
+                                        env=env)
+        self.started = time.monotonic()
+        self.deadline = self.started + deadline if deadline else None
+        self.idle_timeout = idle_timeout
+        self.last_output = self.started
+        self.stop_reason: Optional[str] = None
+        self.stderr_lines: List[str] = []
+        self._output: "queue.Queue" = queue.Queue()
+        for name, stream in (("stdout", self.process.stdout), ("stderr", self.process.stderr)):
+            threading.Thread(target=self._drain, args=(name, stream), daemon=True).start()
+
+    def _drain(self, name: str, stream):
+        try:
+            for line in stream:
+                self._output.put((name, line))
+        finally:
+            self._output.put((name, None))
+
+    def extend(self, seconds: float):
+        """Gives the stage extra time, e.g. while the user answered one of its prompts."""
+        if self.deadline is not None:
+            self.deadline += seconds
+        self.last_output += seconds
+
+    def write(self, text: str):
+        self.process.stdin.write(text)
+        self.process.stdin.flush()
+
+    def lines(self, cancel_event: Optional[threading.Event] = None) -> Iterator[Tuple[str, str]]:
+        """Yields (stream name, line) until both streams close, enforcing the limits."""
+        open_streams = 2
+        while open_streams:
+            try:
+                name, line = self._output.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                if self.stop_reason is not None and self.process.poll() is not None:
+                    # A stopped stage's children (e.g. Chrome) may still hold the pipes open
+                    return
+                self._check_limits(cancel_event)
+                continue
+            if line is None:
+                open_streams -= 1
+                continue
+            self.last_output = time.monotonic()
+            if name == "stderr":
+                self.stderr_lines.append(line)
+            yield name, line
+            self._check_limits(cancel_event)
+
+    def _check_limits(self, cancel_event: Optional[threading.Event]):
+        if self.stop_reason is not None:
+            return
+        now = time.monotonic()
+        if cancel_event is not None and cancel_event.is_set():
+            self.stop(CANCELLED)
+        elif self.deadline is not None and now > self.deadline:
+            self.stop(TIMED_OUT)
+        elif self.idle_timeout and now - self.last_output > self.idle_timeout:
+            self.stop(IDLE)
+
+    def stop(self, reason: str = CANCELLED):
+        """Asks the stage to stop, escalating to terminate/kill in the background."""
+        if self.stop_reason is not None:
+            return
+        self.stop_reason = reason
+        request_cancel(self.state_dir)
+        # A stage blocked on input() gets EOF instead of waiting for an answer
+        self._close_stdin()
+        threading.Thread(target=self._escalate, daemon=True).start()
+
+    def _escalate(self):
+        for action, wait in ((None, GRACE_SECONDS), (self.process.terminate, KILL_SECONDS), (self.process.kill, None)):
+            if action is not None:
+                try:
+                    action()
+                except OSError:
+                    return
+            try:
+                self.process.wait(timeout=wait)
+                return
+            except subprocess.TimeoutExpired:
+                continue
+
+    def _close_stdin(self):
+        if self.process.stdin is not None:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+
+    def finish(self) -> int:
+        """Waits for the process to exit and cleans up. Returns the exit code."""
+        self._close_stdin()
+        returncode = self.process.wait()
+        clear_cancel(self.state_dir)
+        return returncode
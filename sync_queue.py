@@ -0,0 +1,100 @@
+"""
+Deadline-ordered queue for the Reclaim stage.
+
+Tasks are synced most urgent first instead of in Canvas fetch order, so a
+slow, cancelled or budget-limited run has already created tomorrow's
+homework before next month's reading. Urgency is the slack: hours until the
+due date minus the hours the task needs (overdue or tight tasks go first,
+ties broken by the earlier due date). Tasks without a due date go last.
+
+Optional per-run budgets in config.py, applied in that order:
+    SYNC_MAX_TASKS_PER_RUN = 20
+    SYNC_TIME_BUDGET_MINUTES = 5
+The time budget only counts time spent creating tasks (not waiting on
+Canvas or on prompts). Whatever doesn't fit stays unsynced, and since every
+sync queues all timed assignments not synced yet (not just this run's new
+ones), it is picked up by urgency next run.
+"""
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import config
+except ImportError:
+    config = None
+
+MAX_TASKS_PER_RUN = getattr(config, "SYNC_MAX_TASKS_PER_RUN", None)
+TIME_BUDGET_MINUTES = getattr(config, "SYNC_TIME_BUDGET_MINUTES", None)
+
+
+def priority_key(task, now: Optional[datetime] = None) -> Tuple:
+    """Sort key: (has no due date, slack in hours, due timestamp). Lower syncs first."""
+    if task.due_at is None:
+        return (1, 0.0, 0.0)
+    now = now or datetime.now(timezone.utc)
+    due = task.due_at if task.due_at.tzinfo is not None else task.due_at.astimezone()
+    hours_left = (due - now).total_seconds() / 3600
+    return (0, hours_left - (task.time_allocated_hours or 0), due.timestamp())
+
+
+class SyncQueue:
+    """Min-heap of tasks by priority_key (stable for equal keys)."""
+
+    def __init__(self, tasks: Iterable = (), now: Optional[datetime] = None):
+        self.now = now or datetime.now(timezone.utc)
+        self._order = itertools.count()
+        self._heap: List[tuple] = [(priority_key(t, self.now), next(self._order), t) for t in tasks]
+        heapq.heapify(self._heap)
+
+    def push(self, task):
+        heapq.heappush(self._heap, (priority_key(task, self.now), next(self._order), task))
+
+    def pop(self):
+        return heapq.heappop(self._heap)[2]
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+class Budget:
+    """Per-run limits on the number of tasks and the time spent syncing them."""
+
+    def __init__(self, max_tasks: Optional[int] = MAX_TASKS_PER_RUN,
+                 minutes: Optional[float] = TIME_BUDGET_MINUTES):
+        self.max_tasks = max_tasks
+        self.seconds = minutes * 60 if minutes else None
+        self.elapsed = 0.0
+        self.used = 0
+
+    def exhausted(self) -> Optional[str]:
+        """The reason no more tasks may start, or None."""
+        if self.max_tasks is not None and self.used >= self.max_tasks:
+            return f"task limit of {self.max_tasks} reached"
+        if self.seconds is not None and self.elapsed >= self.seconds:
+            return f"time budget of {self.seconds / 60:g} minutes used up"
+        return None
+
+    @contextmanager
+    def spend(self):
+        """Counts one task, and the time spent in the block towards the time budget."""
+        self.used += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.elapsed += time.monotonic() - started
+
+
+def unsynced(timed: Iterable) -> List:
+    """The timed assignments still to create in Reclaim (from this run or an earlier, cut-short one)."""
+    return [task for task in timed if not task.reclaim_synced and task.time_allocated_hours]
+
+
+def in_priority_order(tasks: Iterable, now: Optional[datetime] = None) -> Iterator:
+    queue = SyncQueue(tasks, now)
+    while len(queue):
+        yield queue.pop()
@@ -1,31 +1,49 @@
-import json
 import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from difflib import SequenceMatcher
 from typing import List, Dict, Any, Optional
+import json_codec
+import stage_supervisor
+import rule_index
+from progress import Progress
+from assignment_record import Assignment, load_records, dump_records
 
 # --- Configuration ---
 SEEN_FILE = "seen_assignments.json"
 RULES_FILE = "assignment_time_rules.json"
 TIMED_FILE = "timed_assignments.json"
 SIMILARITY_THRESHOLD = 0.50 # 50% similarity threshold for grouping names
+DEFAULT_TIME_HOURS = 1.0 # Used for new groups when nobody can be prompted (batch mode)
+MIN_PARALLEL_NAMES = 200 # Below this many distinct names a process pool costs more than it saves
+PROGRESS_CHUNK = 200 # Names matched between progress updates in a single process
+CLUSTER_THRESHOLD = 0.80 # Similarity of normalized names needed to merge two clusters
+
+# Common abbreviations expanded before clustering ("HW 1" and "Homework 1" -> "homework")
+ABBREVIATIONS = {
+    "hw": "homework", "hwk": "homework", "assn": "assignment", "asgn": "assignment",
+    "assign": "assignment", "proj": "project", "disc": "discussion", "rdg": "reading",
+    "prob": "problem", "probs": "problems", "pset": "problem set", "ps": "problem set",
+    "ch": "chapter", "chap": "chapter", "sec": "section", "wk": "week", "mod": "module",
+}
 
 # --- Helper Functions ---
 
 def load_json(filename: str) -> Any:
     """Loads JSON data from a file."""
+    is_rules_file = os.path.basename(filename) == RULES_FILE
     if os.path.exists(filename):
         try:
-            with open(filename, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except json.JSONDecodeError:
+            return json_codec.load_file(filename)
+        except json_codec.JSONDecodeError:
             print(f"Warning: {filename} is corrupted. Starting empty.")
-            return {} if filename == RULES_FILE else []
-    return {} if filename == RULES_FILE else []
+            return {} if is_rules_file else []
+    return {} if is_rules_file else []
 
 def save_json(filename: str, data: Any):
     """Saves data to a JSON file."""
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+    json_codec.save_file(filename, data)
 
 def get_similarity_group_key(assignment_name: str, existing_rules: Dict[str, Any]) -> Optional[str]:
     """
@@ -46,6 +64,99 @@ def get_similarity_group_key(assignment_name: str, existing_rules: Dict[str, Any
     # No similar group found
     return None
 
+def _match_chunk(args) -> List[Optional[str]]:
+    """Process-pool worker: matches a chunk of names against the rule keys."""
+    names, rule_keys = args
+    rules = dict.fromkeys(rule_keys)
+    return [get_similarity_group_key(name, rules) for name in names]
+
+def match_existing_groups(names: List[str], time_rules: Dict[str, Any], workers: int = 1) -> Dict[str, Optional[str]]:
+    """
+    Matches every distinct name against the rules that exist before this run.
+    With workers > 1 the names are sharded across a process pool; chunks are
+    merged back in input order, so the result is identical to a single process.
+    """
+    unique_names = list(dict.fromkeys(names))
+    rule_keys = list(time_rules.keys())
+
+    bar = Progress("Allocator", "names matched", len(unique_names))
+    if workers <= 1 or len(unique_names) < MIN_PARALLEL_NAMES or not rule_keys:
+        matches = []
+        for i in range(0, len(unique_names), PROGRESS_CHUNK):
+            chunk = unique_names[i:i + PROGRESS_CHUNK]
+            matches.extend(_match_chunk((chunk, rule_keys)))
+            bar.advance(len(chunk))
+    else:
+        # Several chunks per worker so uneven chunks don't leave cores idle
+        chunk_size = -(-len(unique_names) // (workers * 4))
+        chunks = [(unique_names[i:i + chunk_size], rule_keys)
+                  for i in range(0, len(unique_names), chunk_size)]
+        matches = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for chunk_matches in pool.map(_match_chunk, chunks):
+                matches.extend(chunk_matches)
+                bar.advance(len(chunk_matches))
+
+    return dict(zip(unique_names, matches))
+
+def normalize_name(assignment_name: str) -> str:
+    """
+    Reduces an assignment name to its "type": lowercased, punctuation and
+    numbers removed, abbreviations expanded. "Circuits HW5" -> "circuits homework".
+    """
+    # Split letter/digit boundaries so "hw5" -> "hw 5", then keep only alphabetic tokens
+    spaced = re.sub(r"(?<=[a-z])(?=\d)|(?<=\d)(?=[a-z])", " ", assignment_name.lower())
+    tokens = re.findall(r"[a-z]+", spaced)
+    return " ".join(ABBREVIATIONS.get(token, token) for token in tokens)
+
+def cluster_names(names: List[str]) -> Dict[str, str]:
+    """
+    Groups names in one pass: names with the same normalized form share a
+    bucket, then buckets whose normalized forms are similar are merged
+    (single-linkage agglomerative clustering). Each cluster's key is its most
+    common normalized form. Returns name -> group key; deterministic for a
+    given input order.
+    """
+    # 1. Bucket by normalized form (first-appearance order)
+    forms: Dict[str, str] = {}
+    form_counts: Dict[str, int] = {}
+    for name in dict.fromkeys(names):
+        form = normalize_name(name) or name.lower().strip()
+        forms[name] = form
+        form_counts[form] = form_counts.get(form, 0) + 1
+
+    # 2. Merge similar forms with union-find (compared with tokens sorted, so word order doesn't matter)
+    distinct_forms = list(form_counts)
+    sorted_forms = [" ".join(sorted(form.split())) for form in distinct_forms]
+    parent = list(range(len(distinct_forms)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, form_a in enumerate(sorted_forms):
+        # SequenceMatcher caches its analysis of seq2, so the fixed side goes there
+        matcher = SequenceMatcher(None, b=form_a)
+        for j in range(i + 1, len(sorted_forms)):
+            root_i, root_j = find(i), find(j)
+            if root_i == root_j:
+                continue
+            matcher.set_seq1(sorted_forms[j])
+            if matcher.quick_ratio() >= CLUSTER_THRESHOLD and matcher.ratio() >= CLUSTER_THRESHOLD:
+                # The earlier bucket stays the root so results don't depend on merge order
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    # 3. Pick the most common form of each cluster as its key (ties -> earliest)
+    form_roots = {form: find(i) for i, form in enumerate(distinct_forms)}
+    best_form: Dict[int, str] = {}
+    for form, root in form_roots.items():
+        if root not in best_form or form_counts[form] > form_counts[best_form[root]]:
+            best_form[root] = form
+
+    return {name: best_form[form_roots[form]] for name, form in forms.items()}
+
 def get_time_from_user(group_name: str) -> float:
     """Prompts the user for the time taken for a new assignment group."""
     while True:
@@ -60,82 +171,147 @@ def get_time_from_user(group_name: str) -> float:
         except ValueError:
             print("Invalid input. Please enter a number.")
 
+def get_default_time(group_name: str) -> float:
+    """Non-interactive stand-in for get_time_from_user (batch mode)."""
+    print(f"\n New assignment group '{group_name}': using default {DEFAULT_TIME_HOURS} hours")
+    return DEFAULT_TIME_HOURS
+
 # --- Main Logic ---
 
-def allocate_time():
+def ensure_group_rule(group_key: str, time_rules: Dict[str, Any], prompt, example_names: Optional[List[str]] = None):
+    """Asks for and stores the time of a new group unless a rule with a time already exists."""
+    # Check if we already have a time rule for this key (in case the similarity missed it)
+    if group_key not in time_rules or time_rules[group_key].get("time_taken") is None:
+        print(f"\n--- New Assignment Group Detected ---")
+        if example_names and (len(example_names) > 1 or example_names[0] != group_key):
+            examples = ", ".join(f"'{n}'" for n in example_names[:3])
+            print(f"   Covers {len(example_names)} assignment name(s), e.g. {examples}")
+
+        # Ask user for time
+        time_taken = prompt(group_key)
+
+        # Store the new rule
+        time_rules[group_key] = {
+            "group_key": group_key,
+            "time_taken": time_taken
+        }
+
+        print(f"   Rule saved: '{group_key}' set to {time_taken} hours.")
+
+def ask_group_rule(group_key: str, time_rules: Dict[str, Any], prompt, state_dir: str,
+                   example_names: Optional[List[str]] = None) -> bool:
+    """ensure_group_rule, unless the run was cancelled (cancel file or closed input). Returns False to stop."""
+    if stage_supervisor.cancel_requested(state_dir):
+        return False
+    try:
+        ensure_group_rule(group_key, time_rules, prompt, example_names)
+    except EOFError:
+        return False
+    return True
+
+def save_cancelled(rules_file: str, time_rules: Dict[str, Any]) -> int:
+    """Keeps the times entered before a cancel, so they aren't asked again."""
+    save_json(rules_file, time_rules)
+    print("\n Cancelled: the time rules entered so far were saved. Sync again to finish.")
+    return 0
+
+def allocate_time(state_dir: str = ".", prompt=get_time_from_user, workers: int = 1, cluster: bool = True):
     """
     Reads assignments, groups them by name similarity, and allocates time.
+    Files are read/written inside `state_dir`; `prompt` is asked for the hours
+    of each new group. `workers` > 1 shards the similarity matching across
+    that many processes (bulk import). With `cluster`, names matching no
+    existing rule are clustered together in one pass (see cluster_names);
+    otherwise each one becomes its own group in processing order.
     """
     print("--- Time Allocator Running ---")
+    seen_file = os.path.join(state_dir, SEEN_FILE)
+    rules_file = os.path.join(state_dir, RULES_FILE)
+    timed_file = os.path.join(state_dir, TIMED_FILE)
     
     # Load data
-    assignments: List[Dict[str, Any]] = load_json(SEEN_FILE)
-    time_rules: Dict[str, Any] = load_json(RULES_FILE)
-    timed_assignments: List[Dict[str, Any]] = []
+    assignments: List[Assignment] = load_records(load_json(seen_file))
+    time_rules: Dict[str, Any] = load_json(rules_file)
+    timed_assignments: List[Assignment] = []
+    # Seen doesn't store what happened after allocation: carried over by html_url
+    previous = {t.html_url: t for t in load_records(load_json(timed_file)) if t.html_url}
 
     if not assignments:
         print("No assignments found in seen_assignments.json. Exiting.")
         return
 
     # 1. Group Assignments and Update Rules
-    for assignment in assignments:
-        assignment_name = assignment.get("name", "Unnamed Assignment")
-        
-        # Check if the name belongs to an existing group
-        group_key = get_similarity_group_key(assignment_name, time_rules)
+    names = [assignment.name or "Unnamed Assignment" for assignment in assignments]
+    # Matches against the rules loaded from disk (the expensive part, optionally parallel)
+    existing_matches = match_existing_groups(names, time_rules, workers)
 
-        if group_key:
-            # Found an existing group
-            assignment["group_key"] = group_key
-        else:
-            # New assignment type found: create a new group and ask for time
-            print(f"\n--- New Assignment Group Detected ---")
-            
-            # Use the assignment name itself as the initial group key
-            new_group_key = assignment_name
-            
-            # Check if we already have a time rule for this specific new name (in case the similarity missed it)
-            if new_group_key not in time_rules or time_rules[new_group_key].get("time_taken") is None:
-                
-                # Ask user for time
-                time_taken = get_time_from_user(new_group_key)
-                
-                # Store the new rule
-                time_rules[new_group_key] = {
-                    "group_key": new_group_key,
-                    "time_taken": time_taken
-                }
-                
-                print(f"   Rule saved: '{new_group_key}' set to {time_taken} hours.")
-
-            assignment["group_key"] = new_group_key
+    if cluster:
+        # Cluster every name that matched no loaded rule in one pass
+        ungrouped = [name for name in names if not existing_matches[name]]
+        cluster_keys = cluster_names(ungrouped)
+        members: Dict[str, List[str]] = {}
+        for name, group_key in cluster_keys.items():
+            members.setdefault(group_key, []).append(name)
+
+        bar = Progress("Allocator", "groups", len(members))
+        for group_key, group_names in members.items():
+            if not ask_group_rule(group_key, time_rules, prompt, state_dir, group_names):
+                return save_cancelled(rules_file, time_rules)
+            bar.advance()
+
+        for assignment, assignment_name in zip(assignments, names):
+            assignment.group_key = existing_matches[assignment_name] or cluster_keys[assignment_name]
+    else:
+        # Groups created during this run, in creation order (they follow the loaded rules)
+        created_rules: Dict[str, Any] = {}
+        bar = Progress("Allocator", "names grouped", len(names))
+
+        for assignment, assignment_name in zip(assignments, names):
+            # Check if the name belongs to an existing group, then to one created earlier in this run
+            group_key = existing_matches[assignment_name] or get_similarity_group_key(assignment_name, created_rules)
+
+            if not group_key:
+                # New assignment type found: use the assignment name itself as the initial group key
+                group_key = assignment_name
+                if group_key not in time_rules:
+                    created_rules[group_key] = None
+                if not ask_group_rule(group_key, time_rules, prompt, state_dir):
+                    return save_cancelled(rules_file, time_rules)
+
+            assignment.group_key = group_key
+            bar.advance()
     
     # Save the updated rules file
-    save_json(RULES_FILE, time_rules)
+    save_json(rules_file, time_rules)
     print("\n Assignment time rules updated.")
 
     # 2. Assign Time and Create New List
     for assignment in assignments:
-        group_key = assignment.get("group_key")
-        time_rule = time_rules.get(group_key)
+        time_rule = time_rules.get(assignment.group_key)
 
         if time_rule and time_rule.get("time_taken") is not None:
-            time_taken = time_rule["time_taken"]
-            
-            # Create the new dictionary with original data and time attached
-            timed_item = assignment.copy() # Start with all original data
-            timed_item["time_allocated_hours"] = time_taken
-            timed_assignments.append(timed_item)
+            # Attach the time to the record itself (no per-item copy)
+            assignment.time_allocated_hours = time_rule["time_taken"]
+            earlier = previous.get(assignment.html_url)
+            if earlier is not None:
+                assignment.reclaim_synced = earlier.reclaim_synced
+                assignment.start_at = earlier.start_at
+            timed_assignments.append(assignment)
         else:
             # Should not happen if logic is correct, but handles a missing rule
-            print(f"Warning: Could not assign time to '{assignment.get('name')}' (Missing rule). Skipping.")
+            print(f"Warning: Could not assign time to '{assignment.name}' (Missing rule). Skipping.")
             
     
-    # 3. Save the final list
-    save_json(TIMED_FILE, timed_assignments)
+    # 3. Save the final list (and the group -> assignments index used for rule edits)
+    save_json(timed_file, dump_records(timed_assignments))
+    rule_index.update_index(state_dir, timed_assignments, time_rules)
     print(f"\n Successfully processed {len(timed_assignments)} assignments.")
     print(f"   Data saved to {TIMED_FILE}")
+    return len(timed_assignments)
 
 
 if __name__ == "__main__":
-    allocate_time()
\ No newline at end of file
+    # --bulk: use every core for the similarity matching (initial import of a long history)
+    # --no-cluster: old behaviour, each unmatched name becomes its own group
+    allocate_time(workers=(os.cpu_count() or 1) if "--bulk" in sys.argv[1:] else 1,
+                  cluster="--no-cluster" not in sys.argv[1:])
\ No newline at end of file
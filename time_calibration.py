@@ -0,0 +1,225 @@
+"""
+Recalibrates the time rules from the time actually spent on tasks.
+
+After a sync this batch job collects actual hours per finished task:
+  * from Reclaim (RECLAIM_API_KEY set): timeChunksSpent of completed or
+    archived "[Canvas]" tasks, listed in one API call
+  * from ACTUALS_LOG, a local stand-in for browser-mode users or other
+    trackers, one JSON object per line:
+        {"name": "HW 3", "hours": 2.5}   (or "html_url" instead of "name"; optional "at")
+Each sample is joined to its group (the timed record's group_key, else the
+closest rule by name) and added once to HISTORY_FILE.
+
+A group's new estimate is a trimmed, exponentially decayed mean of its
+history: the highest and lowest TRIM_FRACTION of samples (at least one
+each, so with 3 samples one outlier can't move the rule) are dropped, and
+each remaining sample weighs 0.5 ** (age / HALF_LIFE_DAYS), so recent work
+counts most. Groups with at least MIN_SAMPLES samples get the estimate
+(rounded to ROUND_TO hours) as their time_taken, no prompts involved, and
+rule_index re-times the group's tracked assignments and updates those of
+their Reclaim tasks that are still open (finished ones keep their time).
+
+Uses numpy for the statistics when it is installed.
+
+Usage: python time_calibration.py [--dry-run]
+"""
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import json_codec
+import rule_index
+import time_allocator
+from assignment_record import Assignment, load_records, parse_datetime
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import config
+except ImportError:
+    config = None
+
+HISTORY_FILE = "time_history.json"
+ACTUALS_LOG = "actual_time_log.jsonl"
+HALF_LIFE_DAYS = getattr(config, "CALIBRATION_HALF_LIFE_DAYS", 60)
+MIN_SAMPLES = getattr(config, "CALIBRATION_MIN_SAMPLES", 3)
+TRIM_FRACTION = 0.1 # Share of samples dropped at each end before averaging
+ROUND_TO = 0.25 # Hours
+MINUTES_PER_CHUNK = 15
+FINISHED_STATUSES = ("COMPLETE", "ARCHIVED")
+
+
+def decayed_trimmed_mean(hours: Sequence[float], ages_days: Sequence[float],
+                         half_life: float = HALF_LIFE_DAYS, trim: float = TRIM_FRACTION) -> float:
+    """Mean of `hours` without the extremes, weighted by 0.5 ** (age / half_life)."""
+    # At least the single highest and lowest go, once that leaves something
+    cut = max(1, int(len(hours) * trim)) if len(hours) >= 3 else 0
+    if np is not None:
+        values = np.asarray(hours, dtype=float)
+        weights = 0.5 ** (np.asarray(ages_days, dtype=float) / half_life)
+        order = np.argsort(values, kind="stable")
+        values, weights = values[order], weights[order]
+        if cut:
+            values, weights = values[cut:-cut], weights[cut:-cut]
+        return float(np.dot(values, weights) / weights.sum())
+
+    pairs = sorted(zip(hours, ages_days), key=lambda p: p[0])
+    if cut:
+        pairs = pairs[cut:-cut]
+    weights = [0.5 ** (age / half_life) for _, age in pairs]
+    return sum(h * w for (h, _), w in zip(pairs, weights)) / sum(weights)
+
+
+def round_hours(hours: float) -> float:
+    return max(ROUND_TO, round(hours / ROUND_TO) * ROUND_TO)
+
+
+def _timestamp(value: Any) -> float:
+    parsed = parse_datetime(value)
+    return parsed.timestamp() if parsed is not None else time.time()
+
+
+# --- collecting samples: (sample id, name, html_url or None, hours, finished timestamp) ---
+def samples_from_reclaim(remote_tasks: List[Dict[str, Any]]) -> List[Tuple[str, str, Optional[str], float, float]]:
+    import reclaim_reconcile
+    samples = []
+    for task in remote_tasks:
+        spent = task.get("timeChunksSpent") or 0
+        if task.get("status") not in FINISHED_STATUSES or spent <= 0:
+            continue
+        name = str(task.get("title", ""))[len(reclaim_reconcile.TASK_PREFIX):]
+        finished = task.get("finished") or task.get("updated")
+        samples.append((f"reclaim:{task.get('id')}", name, None, spent * MINUTES_PER_CHUNK / 60, _timestamp(finished)))
+    return samples
+
+
+def samples_from_log(path: str) -> List[Tuple[str, str, Optional[str], float, float]]:
+    samples = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return samples
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entry = json.loads(line)
+            hours = float(entry["hours"])
+        except (ValueError, KeyError, TypeError):
+            print(f"Warning: {path} line {number} is not a valid entry. Skipping.")
+            continue
+        if hours <= 0 or not (entry.get("name") or entry.get("html_url")):
+            continue
+        key = entry.get("html_url") or entry.get("name")
+        samples.append((f"log:{key}:{entry.get('at', number)}", entry.get("name", ""), entry.get("html_url"),
+                        hours, _timestamp(entry.get("at"))))
+    return samples
+
+
+def join_groups(samples, timed: List[Assignment], time_rules: Dict[str, Any]) -> Dict[str, List[list]]:
+    """group_key -> [[sample id, hours, timestamp], ...] for the samples that map to a group."""
+    by_link = {t.html_url: t for t in timed if t.group_key}
+    by_name = {t.name: t for t in timed if t.group_key}
+    grouped: Dict[str, List[list]] = {}
+    for sample_id, name, link, hours, finished in samples:
+        record = by_link.get(link) or by_name.get(name)
+        group_key = record.group_key if record is not None else time_allocator.get_similarity_group_key(name, time_rules)
+        if group_key:
+            grouped.setdefault(group_key, []).append([sample_id, hours, finished])
+    return grouped
+
+
+def merge_history(history: Dict[str, List[list]], grouped: Dict[str, List[list]]) -> int:
+    """Adds samples not recorded yet. Returns how many were added."""
+    known = {sample[0] for samples in history.values() for sample in samples}
+    added = 0
+    for group_key, samples in grouped.items():
+        for sample in samples:
+            if sample[0] not in known:
+                history.setdefault(group_key, []).append(sample)
+                known.add(sample[0])
+                added += 1
+    return added
+
+
+def recalibrate(history: Dict[str, List[list]], time_rules: Dict[str, Any], now: Optional[float] = None) -> Dict[str, Tuple[Any, float, int]]:
+    """Updates time_rules in place. Returns group_key -> (old hours, new hours, samples) for changed rules."""
+    now = now if now is not None else time.time()
+    changes = {}
+    for group_key, samples in history.items():
+        rule = time_rules.get(group_key)
+        if rule is None or len(samples) < MIN_SAMPLES:
+            continue
+        hours = [s[1] for s in samples]
+        ages = [max(0.0, (now - s[2]) / 86400) for s in samples]
+        estimate = round_hours(decayed_trimmed_mean(hours, ages))
+        old = rule.get("time_taken")
+        if old is not None and abs(estimate - old) < ROUND_TO / 2:
+            continue
+        rule["time_taken"] = estimate
+        rule["calibrated_from"] = len(samples)
+        changes[group_key] = (old, estimate, len(samples))
+    return changes
+
+
+def run(state_dir: str = ".", api_key: Optional[str] = None, http=None, dry_run: bool = False) -> int:
+    """Collects new actuals, recalibrates the rules and applies them. Returns the number of rules changed."""
+    print("--- Time Calibration Running ---")
+    api_key = api_key if api_key is not None else getattr(config, "RECLAIM_API_KEY", "")
+    rules_path = os.path.join(state_dir, time_allocator.RULES_FILE)
+    history_path = os.path.join(state_dir, HISTORY_FILE)
+    time_rules = time_allocator.load_json(rules_path)
+    if not time_rules:
+        print("No time rules yet. Nothing to calibrate.")
+        return 0
+    timed = load_records(time_allocator.load_json(os.path.join(state_dir, time_allocator.TIMED_FILE)))
+
+    samples = samples_from_log(os.path.join(state_dir, ACTUALS_LOG))
+    if api_key:
+        import requests
+        import reclaim_reconcile
+        try:
+            samples += samples_from_reclaim(reclaim_reconcile.ReclaimApi(api_key, http).list_canvas_tasks())
+        except requests.exceptions.RequestException as e:
+            print(f"WARNING: Could not read actual times from Reclaim: {e}")
+
+    try:
+        history = json_codec.load_file(history_path)
+    except (FileNotFoundError, json_codec.JSONDecodeError):
+        history = {}
+    added = merge_history(history, join_groups(samples, timed, time_rules))
+    print(f"Actual times: {added} new sample(s), {sum(len(s) for s in history.values())} in history.")
+
+    changes = recalibrate(history, time_rules)
+    for group_key, (old, new, count) in changes.items():
+        print(f" Rule '{group_key}': {old} -> {new} hours (from {count} finished tasks)")
+    if dry_run:
+        print("Dry run: nothing saved.")
+        return len(changes)
+
+    json_codec.save_file(history_path, history)
+    if changes:
+        time_allocator.save_json(rules_path, time_rules)
+        # Pending assignments of those groups (and their Reclaim tasks) follow the new rules
+        rule_index.propagate(state_dir, api_key, http)
+    else:
+        print("Time rules are up to date.")
+    return len(changes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalibrate time rules from actual time spent.")
+    parser.add_argument("--dry-run", action="store_true", help="Show the new estimates without saving them")
+    args = parser.parse_args()
+    run(dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
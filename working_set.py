@@ -0,0 +1,78 @@
+"""
+Active working set for the sync pipeline.
+
+Only assignments that are not yet past due and are due within the next
+ACTIVE_WINDOW_DAYS are kept in seen_assignments.json, so the allocator and
+the Reclaim stage never reprocess old history. Assignments that age out are
+appended to a cold archive (archived_assignments.jsonl, one JSON object per
+line) instead of being rewritten with the working set on every sync.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Optional, Tuple
+
+import json_codec
+from assignment_record import Assignment, parse_datetime
+
+ARCHIVE_FILE = "archived_assignments.jsonl"
+DEFAULT_WINDOW_DAYS = 60 # Assignments due further out are picked up on a later sync
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Canvas dates are UTC; treat naive values from hand-edited files the same way
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+def in_active_window(due_at, now: Optional[datetime] = None, window_days: Optional[float] = DEFAULT_WINDOW_DAYS) -> bool:
+    """
+    True if due_at (datetime or ISO string) is not past and falls within the
+    next `window_days` days. A window of None means no upper bound.
+    """
+    due = parse_datetime(due_at)
+    if due is None:
+        return False
+    due = _as_utc(due)
+    now = now or utc_now()
+    if due < now:
+        return False
+    return window_days is None or due <= now + timedelta(days=window_days)
+
+
+def split_expired(assignments: List[Assignment], now: Optional[datetime] = None) -> Tuple[List[Assignment], List[Assignment]]:
+    """Splits records into (still active, past due). Records without a due date stay active."""
+    now = now or utc_now()
+    active, expired = [], []
+    for assignment in assignments:
+        if assignment.due_at is not None and _as_utc(assignment.due_at) < now:
+            expired.append(assignment)
+        else:
+            active.append(assignment)
+    return active, expired
+
+
+def archive(expired: List[Assignment], path: str = ARCHIVE_FILE):
+    """Appends records to the cold archive (JSON Lines)."""
+    if not expired:
+        return
+    with open(path, "a", encoding="utf-8") as f:
+        for assignment in expired:
+            f.write(json_codec.dumps(assignment.to_dict(), indent=None) + "\n")
+
+
+def load_archive(path: str = ARCHIVE_FILE) -> Iterator[Assignment]:
+    """Yields the archived records, oldest first. Skips unreadable lines."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield Assignment.from_dict(json_codec.loads(line))
+            except json_codec.JSONDecodeError:
+                continue